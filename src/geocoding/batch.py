@@ -0,0 +1,279 @@
+"""
+Batched, asynchronous geocoding.
+
+``geocoding.add_location`` geocodes one entity at a time, spinning up an
+event loop and an HTTP session for each lookup. Doing that in the notify
+endpoint means a slow geocoding provider holds up the request thread for
+as long as the provider takes to answer, for each entity in turn.
+
+The ``BatchGeocoder`` instead takes all the entities of an insert in one
+go. It looks up each distinct address only once, first in the geocoding
+cache and then, for addresses not in the cache, through the provider. It
+runs provider lookups concurrently on an event loop in a background
+thread that keeps one HTTP session open for the life of the process, and
+spaces out requests to keep within the provider's rate limit---public
+Nominatim allows at most one request per second.
+
+Geocoding happens when the insert task runs, right before the insert, so
+if inserts are offloaded to the work queue, geocoding happens in the work
+queue worker rather than in the notify endpoint.
+"""
+
+import asyncio
+import json
+import logging
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+
+from geocoding import geocoding
+from geocoding.factory import get_geo_cache, is_geo_coding_available
+from geocoding.geocache import NOT_FOUND
+from geocoding.location import normalize_location
+from utils.cfgreader import EnvReader, FloatVar, IntVar
+
+
+GEOCODING_RATE_LIMIT_VAR = FloatVar('GEOCODING_RATE_LIMIT', 1.0)
+GEOCODING_MAX_CONCURRENCY_VAR = IntVar('GEOCODING_MAX_CONCURRENCY', 4)
+GEOCODING_TIMEOUT_VAR = FloatVar('GEOCODING_TIMEOUT', 10.0)
+
+LOOKUP_FAILED = object()
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def rate_limit() -> float:
+    """
+    :return: the max number of requests per second to send to the
+        geocoding provider.
+    """
+    return EnvReader().safe_read(GEOCODING_RATE_LIMIT_VAR)
+
+
+def max_concurrency() -> int:
+    """
+    :return: the max number of provider requests in flight at any time.
+    """
+    return EnvReader().safe_read(GEOCODING_MAX_CONCURRENCY_VAR)
+
+
+def lookup_timeout() -> float:
+    """
+    :return: how many seconds to wait for the provider to answer.
+    """
+    return EnvReader().safe_read(GEOCODING_TIMEOUT_VAR)
+
+
+class Nominatim:
+    """
+    A Nominatim client sharing one HTTP session across lookups.
+    """
+
+    def __init__(self, rate: float, timeout: float):
+        self._rate = rate
+        self._timeout = timeout
+        self._geolocator = None
+        self._geocode = None
+
+    async def open(self):
+        from geopy.adapters import AioHTTPAdapter
+        from geopy.extra.rate_limiter import AsyncRateLimiter
+        from geopy.geocoders import Nominatim as GeopyNominatim
+
+        self._geolocator = GeopyNominatim(user_agent="quantumleap",
+                                          adapter_factory=AioHTTPAdapter,
+                                          timeout=self._timeout)
+        await self._geolocator.__aenter__()
+        min_delay = 1.0 / self._rate if self._rate > 0 else 0.0
+        self._geocode = AsyncRateLimiter(                           # (1)
+            self._geolocator.geocode, min_delay_seconds=min_delay,
+            max_retries=0, swallow_exceptions=False)
+
+    async def geocode(self, key: str):
+        return await self._geocode(key, geometry='geojson',
+                                   exactly_one=False, limit=5)
+
+    async def close(self):
+        await self._geolocator.__aexit__(None, None, None)
+    # NOTE
+    # 1. Concurrency. The rate limiter spaces out the start of each request
+    # but doesn't wait for responses, so concurrent lookups still overlap
+    # waiting on a slow provider.
+
+
+class BatchGeocoder:
+    """
+    Geocode the entities of an insert in one go.
+    """
+
+    def __init__(self, provider, max_concurrent: int, cache=None):
+        """
+        Create a new instance.
+
+        :param provider: the geocoding provider, with async ``open``,
+            ``geocode`` and ``close`` methods.
+        :param max_concurrent: the max number of provider lookups to run
+            at the same time.
+        :param cache: the geocoding cache, if any.
+        """
+        self._provider = provider
+        self._max_concurrent = max_concurrent
+        self._cache = cache
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        Thread(target=self._loop.run_forever, daemon=True).start()  # (1)
+        self._run(self._open())
+    # NOTE
+    # 1. Event loop. The loop runs in its own thread so we can submit
+    # lookups from any thread, e.g. Gunicorn threads, and the provider's
+    # HTTP session lives as long as the loop does.
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop) \
+            .result()
+
+    async def _open(self):
+        self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        await self._provider.open()
+
+    async def _lookup(self, key: str):
+        async with self._semaphore:
+            try:
+                return await self._provider.geocode(key)
+            except Exception as e:
+                log().error(f"Geocoding of '{key}' failed: {e!r}")
+                return LOOKUP_FAILED
+
+    async def _lookup_all(self, keys: List[str]) -> list:
+        return await asyncio.gather(*[self._lookup(k) for k in keys])
+
+    def lookup(self, keys: List[str]) -> Dict[str, object]:
+        """
+        Ask the provider for the given address keys.
+
+        :param keys: the address keys.
+        :return: the provider's response for each key, ``LOOKUP_FAILED``
+            if the lookup failed.
+        """
+        if not keys:
+            return {}
+        return dict(zip(keys, self._run(self._lookup_all(keys))))
+
+    def _cached_location(self, key: str) -> Optional[str]:
+        if not self._cache:
+            return None
+        try:
+            return self._cache.get(key)
+        except Exception:
+            log().warning("Can't read from the geocoding cache",
+                          exc_info=True)
+            return None
+
+    def _cache_location(self, key: str, location: Optional[dict]):
+        if not self._cache:
+            return
+        try:
+            if location is None:
+                self._cache.put_not_found(key)
+            else:
+                self._cache.put(key, json.dumps(location))
+        except Exception:
+            log().warning("Can't write to the geocoding cache",
+                          exc_info=True)
+
+    def add_locations(self, entities: List[dict]) -> List[dict]:
+        """
+        Add a location to each entity that has an address but no location.
+        Entities we can't locate are left as they are.
+
+        :param entities: the entities to geocode.
+        :return: the entities we added a location to.
+        """
+        pending = {}
+        for e in entities:
+            try:
+                req = geocoding.location_request(e)
+            except Exception as ex:
+                log().warning(f"Can't geocode entity: {ex!r}")
+                continue
+            if req:
+                key, osm_type = req
+                pending.setdefault(key, (osm_type, []))[1].append(e)
+
+        located, misses = [], []
+        for key, (_, es) in pending.items():
+            loc = self._cached_location(key)
+            if loc is None:
+                misses.append(key)
+            elif loc != NOT_FOUND:
+                located.extend(self._set_location(es, json.loads(loc)))
+
+        for key, info in self.lookup(misses).items():
+            if info is LOOKUP_FAILED:                               # (1)
+                continue
+            osm_type, es = pending[key]
+            loc = None
+            if info:
+                loc = geocoding.extract_location(info, osm_type, key)
+            self._cache_location(key, loc)
+            if loc is not None:
+                located.extend(self._set_location(es, loc))
+        return located
+    # NOTE
+    # 1. Negative caching. We only remember the provider couldn't locate an
+    # address if it actually said so. If the lookup failed, e.g. it timed
+    # out, we'll try again next time.
+
+    @staticmethod
+    def _set_location(entities: List[dict], location: dict) -> List[dict]:
+        for e in entities:
+            geocoding.do_add_location(e, dict(location))
+            normalize_location(e)
+        return entities
+
+    def close(self):
+        self._run(self._provider.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def new_batch_geocoder(cache=None) -> BatchGeocoder:
+    """
+    :return: a ``BatchGeocoder`` using Nominatim, configured from the
+        environment.
+    """
+    provider = Nominatim(rate_limit(), lookup_timeout())
+    return BatchGeocoder(provider, max_concurrency(), cache)
+
+
+_geocoder: Optional[BatchGeocoder] = None
+_geocoder_lock = Lock()
+
+
+def batch_geocoder() -> Optional[BatchGeocoder]:
+    """
+    Get the process-wide batch geocoder, creating it on first use.
+
+    :return: the geocoder if geocoding is on, ``None`` otherwise.
+    """
+    global _geocoder
+    if not is_geo_coding_available():
+        return None
+
+    with _geocoder_lock:                                      # (*)
+        if _geocoder is None:
+            _geocoder = new_batch_geocoder(get_geo_cache())
+        return _geocoder
+# NOTE. Lazy init. As for the coalescer, we can only start the event loop
+# thread after Gunicorn forked the worker process.
+
+
+def geocode_entities(entities: List[dict]):
+    """
+    Add a location to the given entities if geocoding is on.
+
+    :param entities: the entities to geocode.
+    """
+    geocoder = batch_geocoder()
+    if geocoder:
+        geocoder.add_locations(entities)
@@ -2,7 +2,8 @@ import logging
 from typing import Union
 
 from cache.factory import REDIS_HOST_ENV_VAR, REDIS_PORT_ENV_VAR
-from .geocache import GeoCodingCache
+from .geocache import GeoCodingCache, DEFAULT_LOCAL_SIZE, \
+    DEFAULT_LOCAL_TTL, DEFAULT_NEGATIVE_TTL
 from utils.cfgreader import EnvReader, BoolVar, IntVar, StrVar, MaybeString
 
 MaybeGeoCache = Union[GeoCodingCache, None]
@@ -17,6 +18,9 @@ MaybeGeoCache = Union[GeoCodingCache, None]
 
 USE_GEOCODING_ENV_VAR = 'USE_GEOCODING'
 CACHE_GEOCODING_ENV_VAR = 'CACHE_GEOCODING'
+GEOCODING_CACHE_LOCAL_SIZE_ENV_VAR = 'GEOCODING_CACHE_LOCAL_SIZE'
+GEOCODING_CACHE_LOCAL_TTL_ENV_VAR = 'GEOCODING_CACHE_LOCAL_TTL'
+GEOCODING_NEGATIVE_TTL_ENV_VAR = 'GEOCODING_NEGATIVE_TTL'
 
 
 class GeoCodingEnvReader:
@@ -33,6 +37,18 @@ class GeoCodingEnvReader:
     def cache_geocoding(self) -> bool:
         return self.env.read(BoolVar(CACHE_GEOCODING_ENV_VAR, False))
 
+    def cache_local_size(self) -> int:
+        return self.env.read(IntVar(GEOCODING_CACHE_LOCAL_SIZE_ENV_VAR,
+                                    DEFAULT_LOCAL_SIZE))
+
+    def cache_local_ttl(self) -> int:
+        return self.env.read(IntVar(GEOCODING_CACHE_LOCAL_TTL_ENV_VAR,
+                                    DEFAULT_LOCAL_TTL))
+
+    def negative_ttl(self) -> int:
+        return self.env.read(IntVar(GEOCODING_NEGATIVE_TTL_ENV_VAR,
+                                    DEFAULT_NEGATIVE_TTL))
+
     def redis_host(self) -> MaybeString:
         return self.env.read(StrVar(REDIS_HOST_ENV_VAR, None))
 
@@ -84,7 +100,10 @@ def get_geo_cache() -> MaybeGeoCache:
     if is_geo_coding_available():
         log().debug("Geo Cache env variables set, try to build a cache.")
         if env.cache_geocoding() and is_geo_cache_available():
-            return GeoCodingCache(env.redis_host(), env.redis_port())
+            return GeoCodingCache(env.redis_host(), env.redis_port(),
+                                  local_size=env.cache_local_size(),
+                                  local_ttl=env.cache_local_ttl(),
+                                  negative_ttl=env.negative_ttl())
         log().warning("Geo Cache is not enabled, check env variables.")
 
     log().debug("Geo Cache is not enabled")
@@ -1,11 +1,193 @@
+"""
+Geocoding cache.
+
+Geocoding results live in Redis so all QuantumLeap processes can share
+them, with an in-process LRU cache in front of Redis so that addresses
+notified over and over again don't cost a Redis round trip each time.
+Entries in the LRU cache expire after a while so the process eventually
+sees changes made to Redis by others, e.g. flushing the cache.
+
+We also remember addresses the provider couldn't locate, though only for
+a limited time, so we don't keep on asking the provider about the same
+unresolvable address on every notification. These entries hold the
+``NOT_FOUND`` value.
+
+Cache keys are address keys as built by ``get_address_key_and_type``,
+normalised so that trivial variations in case, spacing and punctuation
+map to the same entry.
+"""
+
+from collections import OrderedDict
 from datetime import datetime
+import re
+from threading import Lock
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
 from cache import rediscache
+from server.telemetry.monitor import record
+
+
+NOT_FOUND = ''
+"""Cached value of an address the provider couldn't locate."""
+
+DEFAULT_LOCAL_SIZE = 4096
+DEFAULT_LOCAL_TTL = 3600
+DEFAULT_NEGATIVE_TTL = 3600
+
+LOCAL_HITS_LABEL = 'geocoding cache local hits'
+REDIS_HITS_LABEL = 'geocoding cache redis hits'
+NEGATIVE_HITS_LABEL = 'geocoding cache negative hits'
+MISSES_LABEL = 'geocoding cache misses'
+
+_SEPARATORS = re.compile(r'\s*,[\s,]*')
+
+
+def normalize_address_key(key: str) -> str:
+    """
+    Normalise an address key, e.g. ``"Gran Via  9 , Madrid , ES"`` becomes
+    ``"gran via 9, madrid, es"``.
+
+    :param key: the address key as built by ``get_address_key_and_type``.
+    :return: the normalised key.
+    """
+    key = ' '.join(key.lower().split())
+    return _SEPARATORS.sub(', ', key).strip(', ')
+
+
+class LocalGeoCache:
+    """
+    Thread-safe LRU cache of geocoding results, each expiring after its
+    own time to live.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max(1, max_size)
+        self._entries: 'OrderedDict[str, Tuple[str, float]]' = \
+            OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiry = entry
+            if expiry <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
 
 class GeoCodingCache(rediscache.RedisCache):
 
-    def __init__(self, redis_host, redis_port):
+    def __init__(self, redis_host, redis_port,
+                 local_size: int = DEFAULT_LOCAL_SIZE,
+                 local_ttl: float = DEFAULT_LOCAL_TTL,
+                 negative_ttl: int = DEFAULT_NEGATIVE_TTL):
+        """
+        Create a new instance.
+
+        :param redis_host: the Redis host.
+        :param redis_port: the Redis port.
+        :param local_size: how many entries to keep in memory at most.
+        :param local_ttl: how many seconds to keep an entry in memory.
+        :param negative_ttl: how many seconds to remember an address the
+            provider couldn't locate.
+        """
         super(GeoCodingCache, self).__init__(redis_host, redis_port, 0)
+        self._local = LocalGeoCache(local_size)
+        self._local_ttl = local_ttl
+        self._negative_ttl = negative_ttl
+        self._stats: Dict[str, int] = {}
+        self._stats_lock = Lock()
+
+    def _count(self, label: str):
+        with self._stats_lock:
+            self._stats[label] = self._stats.get(label, 0) + 1
+        record(label, 1)
+
+    def _local_ttl_of(self, value: str) -> float:
+        if value == NOT_FOUND:
+            return min(self._local_ttl, self._negative_ttl)
+        return self._local_ttl
+
+    def get(self, key):
+        """
+        Look up an address key, in memory first and then in Redis.
+
+        :param key: the address key.
+        :return: the location as a JSON string, ``NOT_FOUND`` if the
+            provider couldn't locate the address, or ``None`` if the
+            address isn't in the cache.
+        """
+        key = normalize_address_key(key)
+        value = self._local.get(key)
+        if value is not None:
+            self._count(NEGATIVE_HITS_LABEL if value == NOT_FOUND
+                        else LOCAL_HITS_LABEL)
+            return value
+
+        value = super(GeoCodingCache, self).get(key)
+        if value is None:
+            self._count(MISSES_LABEL)
+            return None
+        self._local.put(key, value, self._local_ttl_of(value))
+        self._count(NEGATIVE_HITS_LABEL if value == NOT_FOUND
+                    else REDIS_HITS_LABEL)
+        return value
+
+    def put(self, key, value, ex=None):
+        key = normalize_address_key(key)
+        super(GeoCodingCache, self).put(key, value, ex=ex)
+        self._local.put(key, value, self._local_ttl_of(value))
+
+    def put_not_found(self, key):
+        """
+        Remember the provider couldn't locate the given address.
+
+        :param key: the address key.
+        """
+        self.put(key, NOT_FOUND, ex=self._negative_ttl)
+
+    def expire(self, key, ex=0):
+        key = normalize_address_key(key)
+        self._local.discard(key)
+        super(GeoCodingCache, self).expire(key, ex)
+
+    def delete(self, key):
+        key = normalize_address_key(key)
+        self._local.discard(key)
+        super(GeoCodingCache, self).delete(key)
+
+    def flushall(self):
+        self._local.clear()
+        super(GeoCodingCache, self).flushall()
+
+    def stats(self) -> dict:
+        """
+        :return: how many local hits, Redis hits, negative hits and misses
+            there were so far, keyed by telemetry label.
+        """
+        with self._stats_lock:
+            return dict(self._stats)
 
 
 def temp_geo_cache(host, port):
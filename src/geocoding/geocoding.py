@@ -44,6 +44,7 @@ import json
 import logging
 
 from exceptions.exceptions import InvalidNGSIEntity
+from geocoding.geocache import NOT_FOUND
 
 logger = logging.getLogger(__name__)
 
@@ -84,38 +85,18 @@ def add_location(entity, raise_error=False, cache=None):
         as it was, unless you set raise_error, in which case a RuntimeError
         is raised.
     """
-    # Validate Entity
-    if not isinstance(entity, dict):
-        raise TypeError
-
-    if 'type' not in entity or 'id' not in entity:
-        raise InvalidNGSIEntity(entity)
-
-    if 'location' in entity:
-        return entity
-
-    if 'address' not in entity:
-        error_msg = 'Cannot add location to entity ' \
-                    '(type: "{}", id: "{}")'.format(entity['type'],
-                                                    entity['id'])
-        logger.warning('{}, missing "address" attribute.'.format(error_msg))
-        return entity
-
-    addr = entity['address']
-    if not isinstance(addr, dict) or not isinstance(addr['value'], dict):
-        error_msg = 'Attribute address in entity (type: "{}", id: "{}")' \
-                    'is not a dict, so geocoding will not act.'
-        logger.warning(error_msg.format(entity['type'], entity['id']))
+    req = location_request(entity)
+    if req is None:
         return entity
-
-    # Get Address Key
-    key, osm_type = get_address_key_and_type(entity)
+    key, osm_type = req
 
     # Get Location from Cache (if any)
     if cache:
         loc = cache.get(key)
+        if loc == NOT_FOUND:
+            return entity
         if loc is not None:
-            return _do_add_location(entity, json.loads(loc))
+            return do_add_location(entity, json.loads(loc))
 
     # Get Location from Provider (if possible)
     info = None
@@ -131,11 +112,69 @@ def add_location(entity, raise_error=False, cache=None):
     if not info:
         msg = "Request to provider was not OK. {}".format(info)
         logging.error(msg)
+        if cache:
+            cache.put_not_found(key)
         if raise_error:
             raise RuntimeError(msg)
         return entity
 
-    # Extract location from result.
+    loc = extract_location(info, osm_type, key)
+    if loc is None:
+        if cache:
+            cache.put_not_found(key)
+        return entity
+
+    if cache:
+        cache.put(key, json.dumps(loc))
+
+    return do_add_location(entity, loc)
+
+
+def location_request(entity):
+    """
+    Work out what to ask the geocoding provider to locate the given entity.
+
+    :param dict entity: the entity to locate.
+    :return: the address key and OSM type to look up or ``None`` if the
+        entity already has a location or can't be geocoded.
+    """
+    # Validate Entity
+    if not isinstance(entity, dict):
+        raise TypeError
+
+    if 'type' not in entity or 'id' not in entity:
+        raise InvalidNGSIEntity(entity)
+
+    if 'location' in entity:
+        return None
+
+    if 'address' not in entity:
+        error_msg = 'Cannot add location to entity ' \
+                    '(type: "{}", id: "{}")'.format(entity['type'],
+                                                    entity['id'])
+        logger.warning('{}, missing "address" attribute.'.format(error_msg))
+        return None
+
+    addr = entity['address']
+    if not isinstance(addr, dict) or not isinstance(addr['value'], dict):
+        error_msg = 'Attribute address in entity (type: "{}", id: "{}")' \
+                    'is not a dict, so geocoding will not act.'
+        logger.warning(error_msg.format(entity['type'], entity['id']))
+        return None
+
+    # Get Address Key
+    return get_address_key_and_type(entity)
+
+
+def extract_location(info, osm_type, key):
+    """
+    Pick the location out of the geocoding provider's response.
+
+    :param info: the provider's response.
+    :param osm_type: the OSM type we asked the provider for.
+    :param key: the address key we asked the provider for.
+    :return: the location or ``None`` if there's no suitable one.
+    """
     loc = None
     if osm_type == TYPE_POINT:
         loc = _extract_point(info)
@@ -157,12 +196,7 @@ def add_location(entity, raise_error=False, cache=None):
     if loc is None:
         msg = "Could not determine location of type {} for key {}."
         logging.error(msg.format(osm_type, key))
-        return entity
-
-    if cache:
-        cache.put(key, json.dumps(loc))
-
-    return _do_add_location(entity, loc)
+    return loc
 
 
 def _osm_result_geom_type(result):
@@ -190,7 +224,7 @@ def _extract_point(osm_response):
     return _extract_most_accurate_osm_result(osm_response, 'Point')
 
 
-def _do_add_location(entity, location):
+def do_add_location(entity, location):
     # Inject location into entity respecting its representation format
     assert isinstance(location, dict)
     is_json_repr = 'value' in entity['address']
@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+from geocoding.batch import BatchGeocoder
+from geocoding.geocache import NOT_FOUND
+
+
+class FakeResult:
+
+    def __init__(self, osm_type, geojson):
+        self.raw = {'osm_type': osm_type, 'geojson': geojson,
+                    'importance': 1}
+
+
+STREET = {'type': 'LineString', 'coordinates': [[4.4, 51.2], [4.5, 51.3]]}
+
+
+class FakeProvider:
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.keys = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def open(self):
+        pass
+
+    async def geocode(self, key):
+        self.keys.append(key)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if 'Nowhere' in key:
+            raise TimeoutError('provider timed out')
+        if 'Atlantis' in key:
+            return None
+        return [FakeResult('way', STREET)]
+
+    async def close(self):
+        pass
+
+
+class FakeCache:
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def put(self, key, value):
+        self.store[key] = value
+
+    def put_not_found(self, key):
+        self.store[key] = NOT_FOUND
+
+
+def entity(eid, street, locality='Antwerpen'):
+    return {
+        'id': eid, 'type': 'Shop',
+        'address': {'type': 'StructuredValue',
+                    'value': {'streetAddress': street,
+                              'addressLocality': locality}}
+    }
+
+
+def test_lookup_each_address_once():
+    provider = FakeProvider()
+    target = BatchGeocoder(provider, max_concurrent=4)
+    es = [entity('s1', 'IJzerlaan'), entity('s2', 'IJzerlaan'),
+          entity('s3', 'Meir')]
+
+    located = target.add_locations(es)
+    target.close()
+
+    assert len(located) == 3
+    assert sorted(provider.keys) == ['IJzerlaan , Antwerpen ',
+                                     'Meir , Antwerpen ']
+    for e in es:
+        assert e['location'] == {'type': 'geo:json', 'value': STREET}
+
+
+def test_lookups_run_concurrently():
+    provider = FakeProvider(delay=0.05)
+    target = BatchGeocoder(provider, max_concurrent=2)
+    es = [entity(f"s{k}", f"Street {k}") for k in range(5)]
+
+    target.add_locations(es)
+    target.close()
+
+    assert provider.max_in_flight == 2
+
+
+def test_use_cache():
+    cache = FakeCache()
+    provider = FakeProvider()
+    target = BatchGeocoder(provider, max_concurrent=4, cache=cache)
+
+    target.add_locations([entity('s1', 'Meir')])
+    assert json.loads(cache.get('Meir , Antwerpen ')) == STREET
+
+    e = entity('s2', 'Meir')
+    target.add_locations([e])
+    target.close()
+
+    assert len(provider.keys) == 1
+    assert e['location']['value'] == STREET
+
+
+def test_skip_entities_that_cant_be_located():
+    provider = FakeProvider()
+    target = BatchGeocoder(provider, max_concurrent=4)
+    located = {'id': 's1', 'type': 'Shop',
+               'location': {'type': 'geo:json', 'value': STREET}}
+    no_address = {'id': 's2', 'type': 'Shop'}
+    bad_address = entity('s3', 'Meir', locality='')
+    timed_out = entity('s4', 'Nowhere')
+
+    assert target.add_locations(
+        [located, no_address, bad_address, timed_out]) == []
+    target.close()
+
+    assert 'location' not in no_address
+    assert 'location' not in bad_address
+    assert 'location' not in timed_out
+
+
+def test_cache_addresses_not_found():
+    cache = FakeCache()
+    provider = FakeProvider()
+    target = BatchGeocoder(provider, max_concurrent=4, cache=cache)
+
+    for _ in range(2):
+        target.add_locations([entity('s1', 'Atlantis'),
+                              entity('s2', 'Nowhere')])
+    target.close()
+
+    assert cache.store == {'Atlantis , Antwerpen ': NOT_FOUND}
+    assert sorted(provider.keys) == ['Atlantis , Antwerpen ',
+                                     'Nowhere , Antwerpen ',
+                                     'Nowhere , Antwerpen ']
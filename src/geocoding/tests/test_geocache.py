@@ -0,0 +1,87 @@
+from time import sleep
+
+import pytest
+
+from geocoding.geocache import LOCAL_HITS_LABEL, MISSES_LABEL, \
+    NEGATIVE_HITS_LABEL, NOT_FOUND, REDIS_HITS_LABEL, GeoCodingCache, \
+    LocalGeoCache, normalize_address_key
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.store = {}
+        self.expiries = {}
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.expiries[key] = ex
+
+
+@pytest.fixture
+def cache():
+    c = GeoCodingCache('localhost', 6379, local_size=2, local_ttl=60,
+                       negative_ttl=30)
+    c.redis = FakeRedis()
+    return c
+
+
+@pytest.mark.parametrize('key, expected', [
+    ('Gran Via 9 , Madrid , ES', 'gran via 9, madrid, es'),
+    ('  gran  via 9, MADRID ,ES ', 'gran via 9, madrid, es'),
+    ('Madrid , , ES', 'madrid, es'),
+    ('ES', 'es')
+])
+def test_normalize_address_key(key, expected):
+    assert normalize_address_key(key) == expected
+
+
+def test_local_cache_evicts_least_recently_used():
+    target = LocalGeoCache(max_size=2)
+    target.put('a', '1', ttl=60)
+    target.put('b', '2', ttl=60)
+    target.get('a')
+    target.put('c', '3', ttl=60)
+
+    assert (target.get('a'), target.get('b'), target.get('c')) == \
+        ('1', None, '3')
+
+
+def test_local_cache_entries_expire():
+    target = LocalGeoCache(max_size=2)
+    target.put('a', '1', ttl=0.05)
+    sleep(0.1)
+
+    assert target.get('a') is None
+
+
+def test_variations_share_entry(cache):
+    cache.put('Meir 1 , Antwerpen , BE', '{"type": "Point"}')
+
+    assert cache.get('meir 1, antwerpen, be') == '{"type": "Point"}'
+    assert list(cache.redis.store) == ['meir 1, antwerpen, be']
+
+
+def test_local_tier_spares_redis_round_trips(cache):
+    cache.redis.store['meir, antwerpen'] = '{"type": "Point"}'
+
+    assert cache.get('Meir , Antwerpen') == '{"type": "Point"}'
+    assert cache.get('Meir , Antwerpen') == '{"type": "Point"}'
+    assert cache.get('Nowhere') is None
+
+    assert cache.redis.gets == 2
+    assert cache.stats() == {REDIS_HITS_LABEL: 1, LOCAL_HITS_LABEL: 1,
+                             MISSES_LABEL: 1}
+
+
+def test_negative_entries(cache):
+    cache.put_not_found('Atlantis')
+
+    assert cache.redis.expiries['atlantis'] == 30
+    assert cache.get('Atlantis') == NOT_FOUND
+    assert cache.stats() == {NEGATIVE_HITS_LABEL: 1}
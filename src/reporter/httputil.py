@@ -1,7 +1,21 @@
+from typing import Mapping, Optional
+
 from flask import request
 
 
-def fiware_s() -> str:
+HeaderMap = Optional[Mapping[str, str]]
+"""
+Case-insensitive HTTP headers, e.g. a Werkzeug ``Headers`` object. If
+``None``, the header functions below read the headers of the current
+Flask request.
+"""
+
+
+def _headers(headers: HeaderMap) -> Mapping[str, str]:
+    return request.headers if headers is None else headers
+
+
+def fiware_s(headers: HeaderMap = None) -> str:
     """
     Read the tenant header.
     If the request has an `ngsild-tenant` header, return its value.
@@ -11,22 +25,23 @@ def fiware_s() -> str:
 
     :return: The content of the tenant header if any.
     """
-    return request.headers.get('ngsild-tenant', None) \
-        or request.headers.get('fiware-service', None)
+    headers = _headers(headers)
+    return headers.get('ngsild-tenant', None) \
+        or headers.get('fiware-service', None)
 
 
-def fiware_sp() -> str:
+def fiware_sp(headers: HeaderMap = None) -> str:
     """
     :return: The content of the FIWARE service path header if any.
     """
-    return request.headers.get('fiware-servicepath', '/')
+    return _headers(headers).get('fiware-servicepath', '/')
 
 
-def fiware_correlator() -> str:
+def fiware_correlator(headers: HeaderMap = None) -> str:
     """
     :return: The content of the FIWARE correlator path header if any.
     """
-    return request.headers.get('Fiware-Correlator', None)
+    return _headers(headers).get('Fiware-Correlator', None)
 
 
 def is_root_service_path() -> bool:
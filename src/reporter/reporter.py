@@ -28,8 +28,6 @@ I.e, QL must be told where orion is.
 """
 
 from flask import request
-from geocoding import geocoding
-from geocoding.factory import get_geo_cache, is_geo_coding_available
 from requests import RequestException
 from translators.sql_translator import SQLTranslator
 from utils.common import iter_entity_attrs, TIME_INDEX_NAME
@@ -38,10 +36,15 @@ import logging
 import requests
 from reporter.timex import select_time_index_value_as_iso, \
     TIME_INDEX_HEADER_NAME
-from geocoding.location import normalize_location, LOCATION_ATTR_NAME
+from geocoding.location import normalize_location
 from exceptions.exceptions import NGSIUsageError, InvalidParameterValue, InvalidHeaderValue
+from wq.ql.backpressure import load_shedder
+from wq.ql.coalescer import notify_coalescer
+from wq.ql.dedup import notification_deduplicator
 from wq.ql.notify import InsertAction
-from reporter.httputil import fiware_correlator, fiware_s, fiware_sp
+from reporter.httputil import fiware_correlator, fiware_s, fiware_sp, \
+    HeaderMap
+from typing import Dict, Optional, Tuple, Union
 
 
 def log():
@@ -77,6 +80,39 @@ def has_value(entity, attr_name):
     return attr_value != '' and attr_value is not None
 
 
+def _validate_notification_data(data) -> Optional[str]:
+    """
+    Check the notification data is a list of entities, each with a string
+    ``id`` and ``type``, as the ``Notification`` schema says.
+
+    :param data: the ``data`` field of the notification.
+    :return: the error message if the data isn't valid, ``None`` otherwise.
+
+    Examples:
+
+        >>> _validate_notification_data([{'id': 'e', 'type': 't'}]) is None
+        True
+
+        >>> _validate_notification_data([1]) is None
+        False
+
+        >>> _validate_notification_data([{'id': 1, 'type': 't'}]) is None
+        False
+    """
+    if not isinstance(data, list):
+        return 'Discarding notification due to malformed data: expected a ' \
+               'list of entities.'
+    for entity in data:
+        if not isinstance(entity, dict):
+            return 'Discarding notification due to malformed data: each ' \
+                   'entity must be a JSON object.'
+        for key in ('id', 'type'):
+            if key in entity and not isinstance(entity[key], str):
+                return f"Discarding notification due to malformed data: " \
+                       f"entity {key} must be a string."
+    return None
+
+
 def _validate_payload(payload):
     """
     :param payload:
@@ -148,15 +184,42 @@ def _filter_no_type_no_value_entities(payload):
 
 
 def notify():
-    if request.json is None:
+    return handle_notification(request.json, request.headers,
+                               request.content_length)
+
+
+def handle_notification(body: Optional[dict], headers: HeaderMap,
+                        content_length: Optional[int] = None) \
+        -> Union[Tuple[str, int], Tuple[str, int, Dict[str, str]]]:
+    """
+    Validate and insert the entities in an NGSI notification.
+    This is the guts of the notify endpoint, independent of the web
+    framework so both the WSGI and ASGI apps can call it.
+
+    :param body: the notification payload, parsed from JSON.
+    :param headers: the request headers, case-insensitive.
+    :param content_length: the size of the notification in bytes if known.
+    :return: the response message and HTTP status code, followed by the
+        response headers if there are any to add.
+    """
+    if body is None:
         return 'Discarding notification due to lack of request body. ' \
                'Lost in a redirect maybe?', 400
 
-    if 'data' not in request.json:
+    if not isinstance(body, dict) or 'data' not in body:
         return 'Discarding notification due to lack of request body ' \
                'content.', 400
 
-    payload = request.json['data']
+    error = _validate_notification_data(body['data'])             # (1)
+    if error:
+        return error, 400
+
+    shedder = load_shedder()
+    overload = shedder.check(fiware_s(headers)) if shedder else None
+    if overload:                                                  # (2)
+        return overload.message, overload.status, overload.headers()
+
+    payload = body['data']
 
     # preprocess and validate each entity update
     for entity in payload:
@@ -167,13 +230,11 @@ def notify():
             #  is wrong
             return error, 400
         # Add TIME_INDEX attribute
-        custom_index = request.headers.get(TIME_INDEX_HEADER_NAME, None)
+        custom_index = headers.get(TIME_INDEX_HEADER_NAME, None)
         entity[TIME_INDEX_NAME] = \
             select_time_index_value_as_iso(custom_index, entity)
-        # Add GEO-DATE if enabled
-        if not entity.get(LOCATION_ATTR_NAME, None):
-            add_geodata(entity)
-        # Always normalize location if there's one
+        # Always normalize location if there's one; entities without a
+        # location get geocoded, if enabled, right before the insert.
         normalize_location(entity)
 
     res_entity = []
@@ -188,10 +249,27 @@ def notify():
             e_new = _filter_no_type_no_value_entities(e)
             res_entity.append(e_new)
     payload = res_entity
+    svc, svc_path = fiware_s(headers), fiware_sp(headers)
+    dedup, fingerprints = None, []
     try:
-        InsertAction(fiware_s(), fiware_sp(), fiware_correlator(), payload) \
-            .enqueue()
+        if ',' not in svc_path:                                   # (*)
+            dedup = notification_deduplicator()
+        if dedup:
+            payload, fingerprints = dedup.filter(svc, svc_path, payload)
+            if not payload:
+                msg = "Notification discarded as duplicate"
+                log().info(msg)
+                return msg, 200
+
+        coalescer = notify_coalescer()
+        if coalescer and ',' not in svc_path:                     # (*)
+            coalescer.add(svc, svc_path, payload, content_length)
+        else:
+            InsertAction(svc, svc_path, fiware_correlator(headers),
+                         payload).enqueue()
     except Exception as e:
+        if dedup:
+            dedup.forget(fingerprints)
         msg = "Notification not processed or not updated: {}".format(e)
         log().error(msg, exc_info=True)
         error_code = 500
@@ -202,13 +280,18 @@ def notify():
         return msg, error_code
     msg = "Notification successfully processed"
     log().info(msg)
-    return msg
-
-
-def add_geodata(entity):
-    if is_geo_coding_available():
-        cache = get_geo_cache()
-        geocoding.add_location(entity, cache=cache)
+    return msg, 200
+# NOTE
+# 1. Schema. Connexion validates the body against the ``Notification``
+# schema before calling ``notify``, but the ASGI app calls us directly
+# with whatever JSON it got, so we check the shape of the data here too.
+# 2. Load shedding. We turn down notifications before doing any work on
+# them, in particular before dedup remembers their entities, otherwise
+# we'd drop them as duplicates when Orion sends them again.
+# (*) Multiple service paths. When the header lists a service path for
+# each entity, we leave it to the translator to pair up entities and paths
+# rather than regrouping the payload here. For the same reason, we can't
+# drop duplicate entities from the payload.
 
 
 def config():
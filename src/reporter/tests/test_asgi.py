@@ -0,0 +1,179 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+from threading import Event
+
+import pytest
+
+from reporter.reporter import handle_notification
+from server.asgi import QuantumLeapAsgi, wsgi_environ
+
+
+def echo_wsgi_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    content = json.dumps({
+        'method': environ['REQUEST_METHOD'],
+        'path': environ['PATH_INFO'],
+        'query': environ['QUERY_STRING'],
+        'service': environ.get('HTTP_FIWARE_SERVICE'),
+        'body': body.decode('utf8')
+    }).encode('utf8')
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [content]
+
+
+def call(app, scope, body=b''):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+
+def http_scope(method, path, query=b'', headers=None):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query,
+        'headers': headers or [],
+        'server': ('localhost', 8668)
+    }
+
+
+def new_app(notify_handler=None):
+    if notify_handler is None:
+        def notify_handler(body, headers, content_length):
+            return 'not expected', 500
+    return QuantumLeapAsgi(echo_wsgi_app, ThreadPoolExecutor(2),
+                           notify_handler)
+
+
+def test_forward_to_wsgi_app():
+    scope = http_scope('GET', '/v2/entities', b'limit=1',
+                       [(b'fiware-service', b't1')])
+    status, headers, body = call(new_app(), scope)
+
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert json.loads(body) == {
+        'method': 'GET', 'path': '/v2/entities', 'query': 'limit=1',
+        'service': 't1', 'body': ''
+    }
+
+
+def test_notify_handled_natively():
+    received = {}
+
+    def notify_handler(body, headers, content_length):
+        received['body'] = body
+        received['service'] = headers.get('Fiware-Service')
+        received['length'] = content_length
+        return 'done', 200
+
+    payload = json.dumps({'data': [{'id': 'e1', 'type': 't'}]}).encode()
+    scope = http_scope('POST', '/v2/notify',
+                       headers=[(b'fiware-service', b't1')])
+    status, _, body = call(new_app(notify_handler), scope, payload)
+
+    assert status == 200
+    assert body == b'done'
+    assert received == {
+        'body': {'data': [{'id': 'e1', 'type': 't'}]},
+        'service': 't1',
+        'length': len(payload)
+    }
+
+
+def test_notify_response_headers():
+    def notify_handler(body, headers, content_length):
+        return 'busy', 429, {'Retry-After': 30}
+
+    scope = http_scope('POST', '/v2/notify')
+    status, headers, body = call(new_app(notify_handler), scope, b'{}')
+
+    assert (status, body) == (429, b'busy')
+    assert headers[b'retry-after'] == b'30'
+
+
+def test_notify_malformed_json():
+    scope = http_scope('POST', '/v2/notify')
+    status, _, _ = call(new_app(), scope, b'{not json')
+
+    assert status == 400
+
+
+@pytest.mark.parametrize('payload', [
+    {'data': [1]}, {'data': 'e1'}, {'data': [{'id': 1, 'type': 't'}]}
+])
+def test_notify_malformed_data(payload):
+    scope = http_scope('POST', '/v2/notify')
+    app = new_app(handle_notification)
+    status, _, body = call(app, scope, json.dumps(payload).encode())
+
+    assert status == 400
+    assert body.startswith(b'Discarding notification')
+
+
+def test_notify_handler_error():
+    def notify_handler(body, headers, content_length):
+        raise TypeError('boom')
+
+    scope = http_scope('POST', '/v2/notify')
+    status, _, body = call(new_app(notify_handler), scope, b'{}')
+
+    assert status == 500
+    assert b'boom' in body
+
+
+def test_finish_requests_on_shutdown():
+    release = Event()
+
+    def notify_handler(body, headers, content_length):
+        return ('released' if release.wait(5) else 'timed out'), 200
+
+    app = new_app(notify_handler)
+    lifespan = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive_request():
+        return {'type': 'http.request', 'body': b'{}', 'more_body': False}
+
+    async def receive_lifespan():
+        return lifespan.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        request = asyncio.create_task(
+            app(http_scope('POST', '/v2/notify'), receive_request, send))
+        await asyncio.sleep(0.1)
+        shutdown = asyncio.create_task(
+            app({'type': 'lifespan'}, receive_lifespan, send))
+        await asyncio.sleep(0.1)
+        release.set()                                                  # (1)
+        await asyncio.gather(request, shutdown)
+
+    asyncio.run(run())
+
+    bodies = [m['body'] for m in sent if m['type'] == 'http.response.body']
+    assert bodies == [b'released']
+    assert {'type': 'lifespan.shutdown.complete'} in sent
+# NOTE
+# 1. Event loop. The handler only gets released if the loop keeps running
+# while the app waits for the executor to shut down.
+
+
+def test_repeated_headers_joined_in_environ():
+    scope = http_scope('GET', '/', headers=[(b'accept', b'a'),
+                                            (b'accept', b'b')])
+    environ = wsgi_environ(scope, b'')
+
+    assert environ['HTTP_ACCEPT'] == 'a,b'
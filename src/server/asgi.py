@@ -0,0 +1,280 @@
+"""
+ASGI entry point.
+
+The ``application`` callable in this module lets you run QuantumLeap in
+an ASGI server like Uvicorn, e.g.
+
+    uvicorn server.asgi:application --host 0.0.0.0 --port 8668
+
+or in Gunicorn with Uvicorn workers
+
+    gunicorn server.asgi:application -k uvicorn.workers.UvicornWorker
+
+Uvicorn isn't a QuantumLeap dependency, so install it first, e.g. with
+``pipenv install uvicorn`` or ``pip install uvicorn``.
+
+An asyncio event loop then takes care of the HTTP connections, so a single
+process can keep lots of Orion connections open without tying up a thread
+for each. The notify endpoint gets read and parsed on the event loop, but
+the DB work still happens in blocking translator code, so we run it in a
+bounded thread pool. The pool size, ``ASGI_MAX_THREADS``, caps how many
+DB round trips can be in flight at once---as opposed to how many clients
+can be connected. Each pool thread gets its own DB connections through the
+``ConnectionManager``. Any request other than a notification is handed
+over to the WSGI app in ``server.wsgi``, again in the thread pool.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from io import BytesIO
+import json
+import logging
+import sys
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from werkzeug.datastructures import Headers
+
+from reporter.reporter import handle_notification
+from server.wsgi import application as wsgi_application
+from utils.cfgreader import EnvReader, IntVar
+
+
+ASGI_MAX_THREADS_VAR = IntVar('ASGI_MAX_THREADS', 32)
+
+NOTIFY_PATH = '/v2/notify'
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def max_threads() -> int:
+    """
+    :return: how many threads to use to run blocking code, i.e. DB calls
+        and the WSGI app.
+    """
+    return max(1, EnvReader(log=log().debug).safe_read(ASGI_MAX_THREADS_VAR))
+
+
+NotifyHandler = Callable[[Optional[dict], Headers, Optional[int]],
+                         Union[Tuple[str, int],
+                               Tuple[str, int, Dict[str, str]]]]
+"""
+A function to process a notification. It gets called with the parsed
+JSON body, the request headers and the content length, in that order, and
+returns the response message and HTTP status code, optionally followed by
+headers to add to the response, just like a Flask view.
+"""
+
+AsgiHeaders = List[Tuple[bytes, bytes]]
+
+
+async def read_body(receive) -> bytes:
+    """
+    Read the whole body of an HTTP request.
+
+    :param receive: the ASGI receive callable.
+    :return: the body bytes.
+    """
+    chunks = []
+    more = True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        more = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def send_response(send, status: int, headers: AsgiHeaders,
+                        body: bytes):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': body
+    })
+
+
+def _latin1(b: bytes) -> str:
+    return b.decode('latin1')
+
+
+def wsgi_environ(scope: dict, body: bytes) -> dict:
+    """
+    Build a WSGI environment out of an ASGI HTTP scope as specified by
+    PEP 3333.
+
+    :param scope: the ASGI connection scope.
+    :param body: the request body.
+    :return: the WSGI environment.
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _latin1(scope.get('root_path', '').encode('utf8')),
+        'PATH_INFO': _latin1(scope['path'].encode('utf8')),
+        'QUERY_STRING': _latin1(scope.get('query_string', b'')),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = \
+            client[0], str(client[1])
+
+    for name, value in scope.get('headers', []):
+        name, value = _latin1(name).lower(), _latin1(value)
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:                                         # (1)
+            value = f"{environ[key]},{value}"
+        environ[key] = value
+
+    return environ
+# NOTE
+# 1. Repeated headers. WSGI has got just one entry per header, so we join
+# the values with a comma as HTTP allows.
+
+
+def run_wsgi(app, scope: dict, body: bytes) -> Tuple[int, AsgiHeaders, bytes]:
+    """
+    Call a WSGI app to handle the given request.
+
+    :param app: the WSGI callable.
+    :param scope: the ASGI connection scope.
+    :param body: the request body.
+    :return: the response status, headers and body.
+    """
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [
+            (k.lower().encode('latin1'), v.encode('latin1'))
+            for k, v in headers
+        ]
+        return chunks.append
+
+    result = app(wsgi_environ(scope, body), start_response)
+    try:
+        for data in result:
+            chunks.append(data)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+class QuantumLeapAsgi:
+    """
+    ASGI app to process notifications on the event loop and forward any
+    other request to the QuantumLeap WSGI app.
+    """
+
+    def __init__(self, wsgi_app, executor: Executor,
+                 notify_handler: NotifyHandler = handle_notification):
+        """
+        Create a new instance.
+
+        :param wsgi_app: the WSGI callable to handle any request other
+            than a notification.
+        :param executor: runs the blocking code, i.e. the WSGI app and
+            the notify handler.
+        :param notify_handler: processes notifications.
+        """
+        self._wsgi_app = wsgi_app
+        self._executor = executor
+        self._notify_handler = notify_handler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] != 'http':
+            raise ValueError(f"unsupported ASGI scope: {scope['type']}")
+        elif scope['method'] == 'POST' and scope['path'] == NOTIFY_PATH:
+            await self._notify(scope, receive, send)
+        else:
+            await self._forward(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None,                       # (1)
+                                           self._executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    # NOTE
+    # 1. Shutdown. Waiting for the executor's threads blocks, so we wait
+    # in another thread. That way the loop can still send the responses of
+    # the requests those threads are finishing.
+
+    async def _run_blocking(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _notify(self, scope, receive, send):
+        body = await read_body(receive)
+        headers = Headers([(_latin1(k), _latin1(v))
+                           for k, v in scope.get('headers', [])])
+        try:
+            notification = json.loads(body) if body else None
+        except ValueError:
+            msg, status, extra = 'Discarding notification due to ' \
+                                 'malformed JSON body.', 400, {}
+        else:
+            try:
+                msg, status, *rest = await self._run_blocking(
+                    self._notify_handler, notification, headers, len(body))
+                extra = rest[0] if rest else {}
+            except Exception as e:                                    # (1)
+                log().exception('Notification not processed')
+                msg, status, extra = 'Notification not processed: ' \
+                                     f"{e}", 500, {}
+
+        await send_response(
+            send, status,
+            [(b'content-type', b'text/plain; charset=utf-8')] +
+            [(k.lower().encode('latin1'), str(v).encode('latin1'))
+             for k, v in extra.items()],
+            msg.encode('utf8'))
+    # NOTE
+    # 1. Unexpected errors. The notify handler turns the errors it expects
+    # into a response, but if anything else goes wrong, we still owe the
+    # client a response, just like Flask would send back a 500.
+
+    async def _forward(self, scope, receive, send):
+        body = await read_body(receive)
+        status, headers, content = await self._run_blocking(
+            run_wsgi, self._wsgi_app, scope, body)
+        await send_response(send, status, headers, content)
+
+
+application = QuantumLeapAsgi(wsgi_application,
+                              ThreadPoolExecutor(max_threads()))
+"""
+The ASGI callable to run QuantumLeap in an ASGI server of your choice,
+e.g. Uvicorn.
+"""
@@ -39,8 +39,9 @@ Time series data are collected in a memory buffer which gets flushed to
 file when the buffer's memory grows bigger than 1 MiB. Files are written to
 a directory of your choice with file names having the following prefixes:
 the value of ``DURATION_FILE_PREFIX`` for duration series, the value of
-``RUNTIME_FILE_PREFIX`` for GC & OS metrics, and ``PROFILER_FILE_PREFIX``
-for profiler data. The file format is CSV and fields are arranged as
+``RUNTIME_FILE_PREFIX`` for GC & OS metrics, ``METRIC_FILE_PREFIX`` for
+any other quantity recorded through the ``record`` function, and
+``PROFILER_FILE_PREFIX`` for profiler data. The file format is CSV and fields are arranged as
 follows:
 
 * **Timepoint**: time at which the measurement was taken, expressed as number
@@ -174,7 +175,7 @@ import os
 from threading import Lock
 from typing import Optional
 
-from server.telemetry.observation import ObservationBucket
+from server.telemetry.observation import ObservationBucket, observe
 from server.telemetry.flush import flush_to_csv
 from server.telemetry.sampler import DurationSampler, RuntimeBackgroundSampler
 
@@ -182,6 +183,7 @@ from server.telemetry.sampler import DurationSampler, RuntimeBackgroundSampler
 DURATION_FILE_PREFIX = 'duration'
 RUNTIME_FILE_PREFIX = 'runtime'
 PROFILER_FILE_PREFIX = 'profiler'
+METRIC_FILE_PREFIX = 'metric'
 
 
 def _new_bucket(monitoring_dir: str, prefix: str) -> ObservationBucket:
@@ -222,6 +224,7 @@ class Monitor:
                  with_profiler: bool = False):
         self._monitoring_dir = monitoring_dir
         self._duration_sampler = _new_duration_sampler(monitoring_dir)
+        self._metric_bucket = _new_bucket(monitoring_dir, METRIC_FILE_PREFIX)
         self._runtime_bucket = None
         self._profiler = None
         self._lock = Lock()
@@ -242,6 +245,9 @@ class Monitor:
     def stop_duration_sample(self, label: str, sample_id: str):
         self._duration_sampler.collect(label, sample_id)
 
+    def record(self, label: str, measurement: float):
+        self._metric_bucket.put(observe(label, measurement))
+
     def stop(self):
         if self._profiler:
             with self._lock:
@@ -250,6 +256,7 @@ class Monitor:
                 self._profiler.dump_stats(outfile)
 
         self._duration_sampler.bucket().empty()
+        self._metric_bucket.empty()
         if self._runtime_bucket:
             self._runtime_bucket.empty()
 
@@ -297,6 +304,20 @@ def stop_duration_sample(label: str, sample_id: str):
         _monitor.stop_duration_sample(label, sample_id)
 
 
+def record(label: str, measurement: float):
+    """
+    Add a measurement to the metric series identified by the given label,
+    e.g. a batch size or a cache hit count. Unlike durations, you sample
+    these quantities yourself and just hand over the value to record.
+    This function does nothing if no monitoring session was started.
+
+    :param label: identifies the series where the measurement should go.
+    :param measurement: the sampled quantity.
+    """
+    if _monitor:
+        _monitor.record(label, measurement)
+
+
 def stop():
     """
     Ends the monitoring session. Call this just before the process exits.
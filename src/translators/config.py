@@ -1,11 +1,13 @@
 import logging
 import os
 
-from utils.cfgreader import EnvReader, BoolVar, IntVar
+from translators.raw_entity import RAW_ENTITY_ENCODINGS, RAW_JSON
+from utils.cfgreader import EnvReader, BoolVar, IntVar, StrVar
 
 
 DEFAULT_LIMIT_VAR = 'DEFAULT_LIMIT'
 KEEP_RAW_ENTITY_VAR = 'KEEP_RAW_ENTITY'
+KEEP_RAW_ENTITY_ENCODING_VAR = 'KEEP_RAW_ENTITY_ENCODING'
 FALLBACK_LIMIT = 10000
 
 
@@ -25,3 +27,13 @@ class SQLTranslatorConfig:
     def keep_raw_entity(self) -> bool:
         var = BoolVar(KEEP_RAW_ENTITY_VAR, False)
         return self.store.safe_read(var)
+
+    def keep_raw_entity_encoding(self) -> str:
+        var = StrVar(KEEP_RAW_ENTITY_ENCODING_VAR, RAW_JSON)
+        encoding = self.store.safe_read(var).lower()
+        if encoding not in RAW_ENTITY_ENCODINGS:
+            logging.getLogger(__name__).warning(
+                f"Unknown {KEEP_RAW_ENTITY_ENCODING_VAR} '{encoding}', " +
+                f"falling back to '{RAW_JSON}'")
+            return RAW_JSON
+        return encoding
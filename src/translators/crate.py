@@ -86,8 +86,12 @@ class CrateTranslator(sql_translator.SQLTranslator):
         self.ccm = None
         self.connection = None
         self.cursor = None
+        self.conn_data = conn_data
         self.dbCacheName = 'crate'
 
+    def _clone(self):
+        return type(self)(self.conn_data)
+
     def setup(self):
         url = "{}:{}".format(self.host, self.port)
         self.ccm = ConnectionManager()
@@ -216,28 +220,40 @@ class CrateTranslator(sql_translator.SQLTranslator):
         self.cursor.execute(stmt)
 
     def _update_data_table(self, table_name, new_columns, fiware_service):
-        # crate allows to add only one column for alter command!
+        if self._can_add_many_columns():
+            alt_cols = ', '.join('add column "{}" {}'.format(cn.lower(), ct)
+                                 for cn, ct in new_columns.items())
+            stmt = "alter table {} {};".format(table_name, alt_cols)
+            self.cursor.execute(stmt)
+            return
+
+        # crate < 5.5 allows to add only one column for alter command!
         for cn in new_columns:
             alt_cols = 'add column "{}" {}'.format(cn.lower(), new_columns[cn])
             stmt = "alter table {} {};".format(table_name, alt_cols)
             self.cursor.execute(stmt)
 
+    def _can_add_many_columns(self) -> bool:
+        """
+        :return: ``True`` if the DB can add many columns in a single
+            ``alter table`` statement, which Crate can do since 5.5.
+        """
+        try:
+            major, minor = [int(n) for n in self.db_version.split('.')[:2]]
+        except (AttributeError, ValueError):
+            return False
+        return (major, minor) >= (5, 5)
+
     def _should_insert_original_entities(self,
                                          insert_error: Exception) -> bool:
         return isinstance(insert_error, Exception)
 
-    def _build_original_data_value(self, entity: dict,
-                                   insert_error: Exception = None,
-                                   failed_batch_id: str = None) -> Any:
-        value = {
-            'data': json.dumps(entity)
-        }
-        if failed_batch_id:
-            value['failedBatchID'] = failed_batch_id
-        if insert_error:
-            value['error'] = repr(insert_error)
-
-        return self._to_db_ngsi_structured_value(value)
+    def _encode_raw_entity(self, entity: dict,
+                           encoding: Optional[str] = None) -> dict:
+        value = super()._encode_raw_entity(entity, encoding)
+        if 'encoding' not in value:
+            value['data'] = json.dumps(entity)
+        return value
 
     def _create_metadata_table(self):
         stmt = "create table if not exists {} " \
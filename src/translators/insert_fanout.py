@@ -0,0 +1,96 @@
+"""
+Concurrent inserts of entity groups.
+
+The SQL translator splits the entities to insert into groups sharing the
+same type and service path and inserts each group separately. With a
+lot of groups, running the inserts one after the other adds up the DB
+round trips of each group. So the translator can run them concurrently
+in the calling thread plus the process-wide thread pool we keep in this
+module. The pool has ``INSERT_MAX_FANOUT - 1`` threads and, since the ``ConnectionManager`` keeps
+a set of DB connections per thread, the pool's threads effectively make
+up a pool of long-lived connections of the same size.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import logging
+from threading import Lock
+from typing import Callable, List, Optional, TypeVar
+
+from utils.cfgreader import EnvReader, IntVar
+
+
+INSERT_MAX_FANOUT_VAR = IntVar('INSERT_MAX_FANOUT', 1)
+
+T = TypeVar('T')
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def insert_max_fanout() -> int:
+    """
+    :return: how many entity groups to insert concurrently at most. One
+        or less means insert groups one after the other.
+    """
+    return EnvReader(log=log().debug).safe_read(INSERT_MAX_FANOUT_VAR)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def insert_executor() -> Optional[ThreadPoolExecutor]:
+    """
+    Get the process-wide insert thread pool, creating it on first use.
+
+    :return: the thread pool if ``insert_max_fanout`` returns more than
+        one, ``None`` otherwise.
+    """
+    global _executor
+    fanout = insert_max_fanout()
+    if fanout <= 1:
+        return None
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=fanout - 1,                             # (1)
+                thread_name_prefix='ql-insert')
+        return _executor
+# NOTE
+# 1. Calling thread. ``run_all`` runs a task in the calling thread too, so
+# we need one thread less than the fan-out.
+
+
+def run_all(executor: ThreadPoolExecutor, tasks: List[Callable[[], T]]) \
+        -> List[T]:
+    """
+    Run the given tasks concurrently and wait for all of them to finish,
+    even if some fail. The last task runs in the calling thread, the
+    others in the given thread pool.
+
+    :param executor: runs all the tasks but the last.
+    :param tasks: the tasks to run.
+    :return: each task's result, in the same order as the tasks.
+    :raise Exception: the error of the first failed task in task order,
+        if any task failed.
+    """
+    if not tasks:
+        return []
+
+    futures: List[Future] = [executor.submit(t) for t in tasks[:-1]]
+    last = Future()
+    try:
+        last.set_result(tasks[-1]())
+    except Exception as e:
+        last.set_exception(e)
+    futures.append(last)
+
+    wait(futures)
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    for e in errors[1:]:
+        log().error(f"Concurrent insert failed: {e}", exc_info=e)
+    if errors:
+        raise errors[0]
+    return [f.result() for f in futures]
@@ -0,0 +1,160 @@
+"""
+Compiled insert plans.
+
+To insert a lot of entities of the same type, the SQL translator has to
+work out an NGSI and SQL type for each attribute, the data table columns,
+how to convert each attribute value to a DB value and the SQL insert
+statement. The outcome only depends on the shape of the entities in the
+lot---attribute names, declared NGSI types and kinds of values---and not
+on the actual values. Since entities of a given type hardly ever change
+shape, we compile all that into an ``InsertPlan`` the first time we see a
+shape and keep it in an ``InsertPlanCache`` keyed by table and shape
+signature.
+"""
+
+from collections import OrderedDict
+import logging
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from utils.cfgreader import EnvReader, IntVar
+
+
+INSERT_PLAN_CACHE_SIZE_VAR = IntVar('INSERT_PLAN_CACHE_SIZE', 1024)
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def plan_cache_size() -> int:
+    """
+    :return: how many insert plans to keep in memory. Zero or less means
+        don't cache plans.
+    """
+    return EnvReader(log=log().debug).safe_read(INSERT_PLAN_CACHE_SIZE_VAR)
+
+
+ColumnConverter = Callable[[dict, Optional[str]], Any]
+"""
+A function to extract a column value from an entity. It gets called with
+the entity and its service path, in that order.
+"""
+
+PlanKey = Tuple[str, str, Hashable]
+"""
+The translator's cache name, the table name and the signature of the
+entities' shape.
+"""
+
+
+class InsertPlan:
+    """
+    Everything the SQL translator needs to insert a lot of entities of a
+    given shape in a given table.
+    """
+
+    def __init__(self, table_name: str, table: Dict[str, str],
+                 original_attrs: Dict[str, Tuple[str, Optional[str]]],
+                 col_names: List[str], converters: List[ColumnConverter],
+                 stmt: str):
+        """
+        Create a new instance.
+
+        :param table_name: the table to insert into.
+        :param table: the SQL type of each column.
+        :param original_attrs: the NGSI attribute name and type of each
+            column, i.e. the table metadata.
+        :param col_names: the columns to insert, in statement order.
+        :param converters: the function to extract the value of each column
+            from an entity, in the same order as ``col_names``.
+        :param stmt: the SQL insert statement.
+        """
+        self.table_name = table_name
+        self.table = table
+        self.original_attrs = original_attrs
+        self.col_names = col_names
+        self.converters = converters
+        self.stmt = stmt
+
+    def to_row(self, entity: dict, fiware_servicepath: Optional[str]) \
+            -> List[Any]:
+        """
+        :return: the values to insert for the given entity, in the same
+            order as the columns in the insert statement.
+        """
+        return [c(entity, fiware_servicepath) for c in self.converters]
+
+
+class InsertPlanCache:
+    """
+    Thread-safe LRU cache of insert plans.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        Create a new instance.
+
+        :param max_size: how many plans to keep at most. When full, adding
+            a plan evicts the least recently used one.
+        """
+        self._max_size = max_size
+        self._plans: 'OrderedDict[PlanKey, InsertPlan]' = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: PlanKey) -> Optional[InsertPlan]:
+        """
+        :return: the plan stored under the given key if any, ``None``
+            otherwise.
+        """
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+            return plan
+
+    def put(self, key: PlanKey, plan: InsertPlan):
+        """
+        Store the given plan, evicting the least recently used one if the
+        cache is full.
+        """
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self._max_size:
+                self._plans.popitem(last=False)
+
+    def evict(self, cache_name: str, table_name: str):
+        """
+        Remove all the plans for the given table.
+        """
+        with self._lock:
+            stale = [k for k in self._plans
+                     if k[0] == cache_name and k[1] == table_name]
+            for k in stale:
+                del self._plans[k]
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._plans)
+
+
+_plan_cache: Optional[InsertPlanCache] = None
+_plan_cache_lock = Lock()
+
+
+def insert_plan_cache() -> InsertPlanCache:
+    """
+    :return: the process-wide insert plan cache.
+    """
+    global _plan_cache
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            _plan_cache = InsertPlanCache(plan_cache_size())
+        return _plan_cache
@@ -1,8 +1,7 @@
 import logging
-from objsize import get_deep_size
-from typing import Optional, Tuple
+from typing import Any, Optional, Tuple
 
-from utils.cfgreader import BitSizeVar, EnvReader
+from utils.cfgreader import BitSizeVar, EnvReader, IntVar
 from utils.itersplit import IterCostSplitter
 
 INSERT_MAX_SIZE_VAR = 'INSERT_MAX_SIZE'
@@ -10,6 +9,12 @@ INSERT_MAX_SIZE_VAR = 'INSERT_MAX_SIZE'
 The name of the environment variable to configure the insert max size.
 """
 
+INSERT_MAX_ROWS_VAR = 'INSERT_MAX_ROWS'
+"""
+The name of the environment variable to configure the maximum number of
+rows in an insert batch.
+"""
+
 
 def _log():
     return logging.getLogger(__name__)
@@ -31,15 +36,62 @@ def configured_insert_max_size_in_bytes() -> Optional[int]:
     return None
 
 
+def configured_insert_max_rows() -> Optional[int]:
+    """
+    Read the insert max rows env var and return its value if set to a
+    positive integer or ``None`` otherwise.
+
+    :return: the max number of rows if available, ``None`` otherwise.
+    """
+    env_reader = EnvReader(log=_log().debug)
+    max_rows = env_reader.safe_read(IntVar(INSERT_MAX_ROWS_VAR, None))
+    if max_rows and max_rows > 0:
+        return max_rows
+    return None
+
+
+_FIXED_SIZES = {
+    type(None): 4,
+    bool: 5,
+    int: 8,
+    float: 8
+}
+
+
+def estimate_value_size(v: Any) -> int:
+    """
+    Estimate how many bytes the given SQL parameter value takes up when
+    sent to the DB. The estimate is roughly the length of the value's
+    JSON encoding: strings count as many bytes as they have characters,
+    scalars have a fixed size and containers add up the size of their
+    items. This is way cheaper than encoding or measuring the object in
+    memory, yet good enough to keep insert batches within a size limit.
+
+    :param v: the value.
+    :return: the estimated size in bytes.
+    """
+    t = type(v)
+    size = _FIXED_SIZES.get(t)
+    if size is not None:
+        return size
+    if t is str:
+        return len(v) + 2
+    if t is dict:
+        return sum(len(k) + 4 + estimate_value_size(x)
+                   for k, x in v.items()) + 2
+    if isinstance(v, (list, tuple)):
+        return sum(estimate_value_size(x) + 1 for x in v) + 2
+    return len(str(v)) + 2
+
+
 def compute_row_size(r: Tuple) -> int:
     """
-    Compute the memory size, in bytes, of the given row's components.
+    Estimate the size, in bytes, of the given row's components.
 
     :param r: the row to insert.
     :return: the size in bytes.
     """
-    component_sizes = [get_deep_size(k) for k in r]
-    return sum(component_sizes)
+    return sum(estimate_value_size(k) for k in r)
 
 
 def to_insert_batches(rows: [Tuple]) -> [[Tuple]]:
@@ -50,19 +102,26 @@ def to_insert_batches(rows: [Tuple]) -> [[Tuple]]:
     some backends (e.g. Crate) have a cap on how much data you can shovel
     in a single SQL (bulk) insert statement---see #445 about it.
 
-    Split only if the insert max size env var holds a valid value. (If that's
-    not the case, return a single batch with all input rows.)
-    Splitting happens as explained in the ``IterCostSplitter`` docs with
-    ``compute_row_size`` as a cost function so the cost of each input row
-    is the amount of bytes its components take up in memory and the value
-    of the env var as a maximum batch size (= cost in bytes).
+    Split only if the insert max size or max rows env var holds a valid
+    value. (If that's not the case, return a single batch with all input
+    rows.) Splitting happens as explained in the ``IterCostSplitter`` docs
+    with ``compute_row_size`` as a cost function so the cost of each input
+    row is the estimated amount of bytes its components take up when sent
+    to the DB and the value of the max size env var as a maximum batch size
+    (= cost in bytes). On top of that, no batch will have more rows than
+    the value of the max rows env var.
 
     :param rows: the rows the SQL translator lined up for an insert.
     :return: the insert batches.
     """
     config_max_cost = configured_insert_max_size_in_bytes()
-    if config_max_cost is None:
+    config_max_rows = configured_insert_max_rows()
+    if config_max_cost is None and config_max_rows is None:
         return [rows]
+    if config_max_cost is None:
+        return [rows[k:k + config_max_rows]
+                for k in range(0, len(rows), config_max_rows)]
     splitter = IterCostSplitter(cost_fn=compute_row_size,
-                                batch_max_cost=config_max_cost)
+                                batch_max_cost=config_max_cost,
+                                batch_max_len=config_max_rows)
     return splitter.list_batches(rows)
@@ -0,0 +1,250 @@
+"""
+In-process cache of entity table metadata.
+
+The SQL translator needs a table's metadata---the original NGSI name and
+type of each column---to insert entities, since it has to tell whether
+the table needs new columns, as well as to query entities, since it has
+to map columns back to NGSI attributes. Metadata hardly ever change, so
+rather than reading them from the metadata table on each API call, each
+QuantumLeap process can keep them in a ``MetadataCache``.
+
+When a process changes a table's metadata, it updates its own cache and
+publishes the table name on a Redis channel. All QuantumLeap processes
+listen on that channel and drop the table's entry from their cache, as
+well as any insert plan for the table. Cache entries also expire after a
+while, so a process that missed a message, e.g. because Redis was down,
+eventually gets fresh metadata anyway. Without Redis, expiry is the only
+way another process's changes become visible.
+"""
+
+import json
+import logging
+import os
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Dict, Optional, Tuple
+from uuid import uuid4
+
+from cache.factory import CacheEnvReader
+from utils.cfgreader import EnvReader, BoolVar, IntVar
+
+
+CACHE_METADATA_VAR = BoolVar('CACHE_METADATA', False)
+METADATA_CACHE_TTL_VAR = IntVar('METADATA_CACHE_TTL', 300)
+
+INVALIDATION_CHANNEL = 'ql:metadata:invalidate'
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def cache_metadata() -> bool:
+    """
+    Keep table metadata in memory?
+
+    :return: `True` to cache metadata in each process; `False` to read
+        them from the DB or the query cache on each API call.
+    """
+    return EnvReader(log=log().debug).safe_read(CACHE_METADATA_VAR)
+
+
+def metadata_cache_ttl() -> int:
+    """
+    :return: how many seconds a table's metadata can stay in the cache.
+    """
+    return EnvReader(log=log().debug).safe_read(METADATA_CACHE_TTL_VAR)
+
+
+CacheKey = Tuple[str, str]
+"""
+The translator's cache name and the table name.
+"""
+
+
+class MetadataCache:
+    """
+    Thread-safe cache of table metadata, each entry expiring after a TTL.
+    """
+
+    def __init__(self, ttl: float, redis=None):
+        """
+        Create a new instance.
+
+        :param ttl: how many seconds to keep a table's metadata.
+        :param redis: the Redis client to publish metadata changes to other
+            processes, if any.
+        """
+        self._ttl = ttl
+        self._redis = redis
+        self._origin = f"{os.getpid()}-{uuid4()}"
+        self._entries: Dict[CacheKey, Tuple[dict, float]] = {}
+        self._loaded = set()
+        self._lock = Lock()
+
+    def origin(self) -> str:
+        """
+        :return: an ID for this cache, unique across processes.
+        """
+        return self._origin
+
+    def is_loaded(self, cache_name: str) -> bool:
+        with self._lock:
+            return cache_name in self._loaded
+
+    def load(self, cache_name: str, metadata: Dict[str, dict]):
+        """
+        Add the metadata of many tables at once, typically all the tables
+        in the DB.
+
+        :param cache_name: the translator's cache name.
+        :param metadata: the metadata of each table.
+        """
+        expires_at = monotonic() + self._ttl
+        with self._lock:
+            for table_name, md in metadata.items():
+                self._entries[(cache_name, table_name)] = \
+                    (dict(md), expires_at)
+            self._loaded.add(cache_name)
+
+    def get(self, cache_name: str, table_name: str) -> Optional[dict]:
+        """
+        :return: a copy of the table's metadata if in the cache and not
+            expired, ``None`` otherwise.
+        """
+        key = (cache_name, table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            md, expires_at = entry
+            if expires_at <= monotonic():
+                del self._entries[key]
+                return None
+            return dict(md)
+
+    def put(self, cache_name: str, table_name: str, metadata: dict):
+        with self._lock:
+            self._entries[(cache_name, table_name)] = \
+                (dict(metadata), monotonic() + self._ttl)
+
+    def invalidate(self, cache_name: str, table_name: str):
+        with self._lock:
+            self._entries.pop((cache_name, table_name), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded.clear()
+
+    def changed(self, cache_name: str, table_name: str,
+                metadata: Optional[dict]):
+        """
+        Record that this process changed a table's metadata and tell the
+        other processes about it.
+
+        :param cache_name: the translator's cache name.
+        :param table_name: the table whose metadata changed.
+        :param metadata: the new metadata or ``None`` if the table got
+            dropped.
+        """
+        if metadata is None:
+            self.invalidate(cache_name, table_name)
+        else:
+            self.put(cache_name, table_name, metadata)
+
+        if self._redis is None:
+            return
+        msg = json.dumps({'origin': self._origin,
+                          'cache_name': cache_name,
+                          'table_name': table_name})
+        try:
+            self._redis.publish(INVALIDATION_CHANNEL, msg)
+        except Exception:
+            log().warning(f"Can't publish metadata change of '{table_name}'",
+                          exc_info=True)
+
+
+class InvalidationListener(Thread):
+    """
+    Drop cache entries and insert plans of tables whose metadata got
+    changed by other processes.
+    """
+
+    def __init__(self, cache: MetadataCache, redis,
+                 retry_interval: float = 1.0):
+        super().__init__(name='ql-metadata-listener')
+        self._cache = cache
+        self._redis = redis
+        self._retry_interval = retry_interval
+        self.daemon = True
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                log().warning("Lost metadata invalidation channel",
+                              exc_info=True)
+            self._cache.clear()                                     # (1)
+            sleep(self._retry_interval)
+# NOTE
+# 1. Missed messages. We can't tell which tables changed while we weren't
+# listening, so we start over with an empty cache.
+
+    def _listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(INVALIDATION_CHANNEL)
+        for message in pubsub.listen():
+            self.handle(message)
+
+    def handle(self, message: dict):
+        try:
+            change = json.loads(message['data'])
+        except (KeyError, TypeError, ValueError):
+            log().warning(f"Ignoring malformed metadata message: {message}")
+            return
+        if change.get('origin') == self._cache.origin():
+            return
+
+        cache_name, table_name = change['cache_name'], change['table_name']
+        self._cache.invalidate(cache_name, table_name)
+        from translators.insert_plan import insert_plan_cache
+        insert_plan_cache().evict(cache_name, table_name)
+
+
+def _redis_client():
+    reader = CacheEnvReader()
+    host = reader.redis_host()
+    if not host:
+        return None
+    from redis import Redis
+    return Redis(host=host, port=reader.redis_port())
+
+
+_metadata_cache: Optional[MetadataCache] = None
+_metadata_cache_lock = Lock()
+
+
+def metadata_cache() -> Optional[MetadataCache]:
+    """
+    Get the process-wide metadata cache, creating it on first use along
+    with the invalidation listener if Redis is configured.
+
+    :return: the cache if ``cache_metadata`` returns true, ``None``
+        otherwise.
+    """
+    global _metadata_cache
+    if not cache_metadata():
+        return None
+
+    with _metadata_cache_lock:                                      # (1)
+        if _metadata_cache is None:
+            redis = _redis_client()
+            _metadata_cache = MetadataCache(metadata_cache_ttl(), redis)
+            if redis is not None:
+                InvalidationListener(_metadata_cache, redis).start()
+        return _metadata_cache
+# NOTE
+# 1. Lazy init. Same as the coalescer, we can only start the listener
+# thread in a Gunicorn worker process, i.e. after the fork.
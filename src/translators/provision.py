@@ -0,0 +1,197 @@
+"""
+Schema pre-provisioning.
+
+QuantumLeap normally works out an entity type's table from the entities
+it gets notified about, creating the table or adding columns when new
+attributes show up. This is handy, but when a new data model version
+gets rolled out, lots of processes end up altering tables at the same
+time while notifications keep coming in. To avoid that, you can create
+tables, columns and metadata ahead of time from a template listing the
+attributes of each entity type, e.g.
+
+    entity_types:
+      - type: WeatherObserved
+        tenant: smartcity
+        attributes:
+          temperature: Number
+          dateObserved: DateTime
+          location: geo:json
+      - type: Streetlight
+        tenant: smartcity
+        schema: models/Streetlight/schema.json
+
+The ``tenant`` field is optional. Instead of listing attributes, you can
+point to the JSON schema of a data model, e.g. a Smart Data Model schema,
+and we'll work out the NGSI types of the attributes from the schema's
+properties.
+
+To provision the schema, run (from the src dir)
+
+    $ python -m translators.provision template.yml
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import click
+import yaml
+
+from translators.factory import translator_for
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+JSON_SCHEMA_TO_NGSI = {
+    'number': 'Number',
+    'integer': 'Integer',
+    'boolean': 'Boolean',
+    'string': 'Text',
+    'object': 'StructuredValue',
+    'array': 'Array'
+}
+
+JSON_SCHEMA_DATE_FORMATS = {'date-time', 'date'}
+
+# Attributes any NGSI entity has got, which QuantumLeap stores in fixed
+# columns.
+RESERVED_ATTRS = {'id', 'type'}
+
+
+class EntityTypeTemplate:
+    """
+    The attributes of an entity type to provision.
+    """
+
+    def __init__(self, etype: str, attrs: Dict[str, str],
+                 fiware_service: Optional[str] = None):
+        """
+        Create a new instance.
+
+        :param etype: the entity type.
+        :param attrs: the NGSI type of each attribute.
+        :param fiware_service: the tenant the entity type belongs to.
+        """
+        self.etype = etype
+        self.attrs = attrs
+        self.fiware_service = fiware_service
+
+
+def _json_schema_properties(schema: dict) -> Dict[str, dict]:
+    props = dict(schema.get('properties', {}))
+    for sub_schema in schema.get('allOf', []):
+        props.update(_json_schema_properties(sub_schema))
+    return props
+
+
+def _json_schema_prop_to_ngsi(name: str, prop: dict) -> Optional[str]:
+    ref = prop.get('$ref', '')
+    if name == 'location' or 'geometry' in ref.lower():
+        return 'geo:json'
+    json_type = prop.get('type')
+    if json_type == 'string' and \
+            prop.get('format') in JSON_SCHEMA_DATE_FORMATS:
+        return 'DateTime'
+    if isinstance(json_type, str):
+        return JSON_SCHEMA_TO_NGSI.get(json_type)
+    return None
+
+
+def attrs_from_json_schema(schema: dict) -> Dict[str, str]:
+    """
+    Work out the NGSI type of each attribute defined in a JSON schema.
+    We look at the schema's properties, including those of any ``allOf``
+    sub-schema, but we don't resolve references to other schemas. Any
+    property with a type we can't work out is skipped.
+
+    :param schema: the JSON schema of the entity type.
+    :return: the NGSI type of each attribute.
+    """
+    attrs = {}
+    for name, prop in _json_schema_properties(schema).items():
+        if name in RESERVED_ATTRS:
+            continue
+        attr_t = _json_schema_prop_to_ngsi(name, prop)
+        if attr_t is None:
+            log().warning(f"Skipping attribute '{name}': can't tell its " +
+                          "type from the schema")
+            continue
+        attrs[name] = attr_t
+    return attrs
+
+
+def _read_entry(entry: dict, base_dir: str) -> EntityTypeTemplate:
+    etype = entry.get('type')
+    if not etype:
+        raise ValueError(f"entity type template without type: {entry}")
+
+    attrs = dict(entry.get('attributes') or {})
+    schema_path = entry.get('schema')
+    if schema_path:
+        with open(os.path.join(base_dir, schema_path)) as f:
+            schema_attrs = attrs_from_json_schema(json.load(f))
+        attrs = {**schema_attrs, **attrs}                           # (1)
+    if not attrs:
+        raise ValueError(f"no attributes for entity type '{etype}'")
+
+    return EntityTypeTemplate(etype, attrs, entry.get('tenant'))
+# NOTE
+# 1. Overrides. Attributes listed in the template take precedence over
+# those in the schema, so you can fix up what we get wrong.
+
+
+def read_template(path: str) -> List[EntityTypeTemplate]:
+    """
+    Read a provisioning template file.
+
+    :param path: the path to the YAML (or JSON) template.
+    :return: the entity types to provision.
+    """
+    with open(path) as f:
+        content = yaml.safe_load(f) or {}
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [_read_entry(e, base_dir)
+            for e in content.get('entity_types', [])]
+
+
+def provision(templates: List[EntityTypeTemplate]) -> Dict[str, set]:
+    """
+    Create the tables, columns and metadata for the given entity types.
+    Tables and columns already in the DB are left alone.
+
+    :param templates: the entity types to provision.
+    :return: for each entity type, the columns that weren't in the DB.
+    """
+    report = {}
+    for t in templates:
+        with translator_for(t.fiware_service) as trans:
+            added = trans.provision_entity_type(t.etype, t.attrs,
+                                                t.fiware_service)
+        key = f"{t.fiware_service or ''}/{t.etype}"
+        report[key] = added
+        log().info(f"Provisioned {key}: {len(added)} new columns")
+    return report
+
+
+@click.command()
+@click.argument('template', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, default=False,
+              help='Only show the attributes of each entity type.')
+def main(template, dry_run):
+    """Create the DB schema of the entity types in TEMPLATE."""
+    templates = read_template(template)
+    if dry_run:
+        for t in templates:
+            click.echo(f"{t.fiware_service or ''}/{t.etype}: {t.attrs}")
+        return
+
+    for key, added in provision(templates).items():
+        columns = ', '.join(sorted(added)) or 'none'
+        click.echo(f"{key}: new columns: {columns}")
+
+
+if __name__ == '__main__':
+    main()
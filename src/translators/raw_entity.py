@@ -0,0 +1,179 @@
+"""
+Encoding of the original entities we keep in ``ORIGINAL_ENTITY_COL``.
+
+With ``KEEP_RAW_ENTITY`` on, each row also stores the whole notified
+entity as JSON, which easily takes more space than the row itself. To cut
+that down, the entity can be stored compressed instead: we serialise it
+to compact JSON, deflate it and Base64-encode the outcome so it fits in
+the same column as before, i.e. a string field of the wrapper object
+
+    { "data": "eNqrVkrOz0vOT0lVslJQ...", "encoding": "zlib-ngsi-v1" }
+
+Entities are small, so plain deflate wouldn't get us far. But NGSI entities
+repeat much the same keys and types, e.g. ``"type":"Number","value":``,
+so we seed the compressor with a preset dictionary of those strings. The
+dictionary is part of the encoding: the ``encoding`` field tells which
+dictionary to use to decompress, so the dictionary of an encoding must
+never change---add a new encoding instead.
+
+Use ``decode_original_data`` to get back the entity from what's stored in
+the column, whatever the encoding. No API endpoint reads the column, so
+this is for whoever reads it straight from the DB. Rows of failed inserts
+always hold plain JSON though, since operators query them to find out
+what failed.
+"""
+
+import base64
+import json
+from typing import Any, Union
+import zlib
+
+
+RAW_JSON = 'json'
+"""Store the entity as JSON, which is what QuantumLeap always did."""
+
+RAW_ZLIB = 'zlib'
+"""Store the entity as Base64-encoded, deflated JSON."""
+
+RAW_ENTITY_ENCODINGS = (RAW_JSON, RAW_ZLIB)
+
+ZLIB_NGSI_V1 = 'zlib-ngsi-v1'
+
+_ZLIB_NGSI_V1_DICT = (
+    b'"type":"StructuredValue","value":{'
+    b'"type":"Relationship","object":"urn:ngsi-ld:'
+    b'"type":"Property","value":'
+    b'"type":"GeoProperty","value":{"type":"Polygon","coordinates":[[['
+    b'"type":"geo:json","value":{"type":"Point","coordinates":['
+    b'"type":"DateTime","value":"'
+    b'"observedAt":"'
+    b'"unitCode":"'
+    b'"type":"ISO8601","value":"'
+    b'"type":"Boolean","value":'
+    b'"type":"Integer","value":'
+    b'"type":"Array","value":['
+    b'"type":"Text","value":"'
+    b'"metadata":{}},'
+    b'"time_index":"'
+    b'"dateModified":{"type":"DateTime","value":"'
+    b'T00:00:00.000Z"'
+    b'"type":"Number","value":'
+    b'"id":"urn:ngsi-ld:'
+)
+# NOTE. Dictionary layout. Deflate encodes matches closer to the end of the
+# dictionary with fewer bits, so the most common strings go last.
+
+_ZLIB_DICTS = {
+    ZLIB_NGSI_V1: _ZLIB_NGSI_V1_DICT
+}
+
+_ENCODER_OF = {
+    RAW_ZLIB: ZLIB_NGSI_V1
+}
+
+
+def _compact_json(value: Any) -> bytes:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False) \
+        .encode('utf-8')
+
+
+def deflate_json(value: Any, encoding: str = ZLIB_NGSI_V1) -> bytes:
+    """
+    Serialise a value to compact JSON and deflate it with the preset
+    dictionary of the given encoding. Works best on NGSI entities or lists
+    of them.
+
+    :param value: the value to compress.
+    :param encoding: the compressed encoding to use.
+    :return: the deflated JSON.
+    """
+    compressor = zlib.compressobj(level=9, wbits=13, memLevel=6,    # (1)
+                                  zdict=_ZLIB_DICTS[encoding])
+    return compressor.compress(_compact_json(value)) + compressor.flush()
+# NOTE
+# 1. Compressor state. With the default 32 KiB window, setting up the
+# compressor takes longer than compressing a few entities. An 8 KiB window
+# is still way bigger than the dictionary plus a typical entity, so we get
+# the same output size in a fraction of the time. The window size is in
+# the zlib header, so decompressing doesn't need to know about it.
+
+
+def inflate_json(data: bytes, encoding: str = ZLIB_NGSI_V1) -> Any:
+    """
+    Reverse ``deflate_json``.
+
+    :param data: the deflated JSON.
+    :param encoding: the encoding the value was compressed with.
+    :return: the value.
+    """
+    decompressor = zlib.decompressobj(zdict=_ZLIB_DICTS[encoding])
+    inflated = decompressor.decompress(data) + decompressor.flush()
+    return json.loads(inflated.decode('utf-8'))
+
+
+def compress_entity(entity: dict, encoding: str = ZLIB_NGSI_V1) -> str:
+    """
+    Compress an entity.
+
+    :param entity: the entity to compress.
+    :param encoding: the compressed encoding to use.
+    :return: the compressed entity as a Base64 string.
+    """
+    deflated = deflate_json(entity, encoding)
+    return base64.b64encode(deflated).decode('ascii')
+
+
+def decompress_entity(data: str, encoding: str = ZLIB_NGSI_V1) -> dict:
+    """
+    Reverse ``compress_entity``.
+
+    :param data: the compressed entity as a Base64 string.
+    :param encoding: the encoding the entity was compressed with.
+    :return: the entity.
+    """
+    return inflate_json(base64.b64decode(data), encoding)
+
+
+def encode_raw_entity(entity: dict, encoding: str = RAW_JSON) -> dict:
+    """
+    Encode an entity to store in ``ORIGINAL_ENTITY_COL``.
+
+    :param entity: the notified entity.
+    :param encoding: one of ``RAW_ENTITY_ENCODINGS``.
+    :return: the ``data`` field and, if the entity got compressed, the
+        ``encoding`` field of the column value.
+    """
+    if encoding == RAW_JSON:
+        return {'data': entity}
+    stored_encoding = _ENCODER_OF[encoding]
+    return {
+        'data': compress_entity(entity, stored_encoding),
+        'encoding': stored_encoding
+    }
+
+
+def decode_original_data(value: Union[str, dict, None]) -> Any:
+    """
+    Get back the entity stored in ``ORIGINAL_ENTITY_COL``.
+
+    :param value: the column value as returned by the DB driver, i.e. the
+        wrapper object or its JSON string.
+    :return: the entity or ``None`` if the column is empty.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+
+    data = value.get('data')
+    encoding = value.get('encoding')
+    if encoding in _ZLIB_DICTS:
+        return decompress_entity(data, encoding)
+    if encoding is not None:
+        raise ValueError(f"unknown raw entity encoding: {encoding}")
+    if isinstance(data, str):                                       # (1)
+        return json.loads(data)
+    return data
+# NOTE
+# 1. Crate. The Crate translator stores uncompressed entities as JSON
+# strings rather than objects.
@@ -0,0 +1,192 @@
+"""
+Locks to coordinate schema changes.
+
+When entities with new attributes come in, every thread and process
+inserting them would try to add the same columns and rewrite the same
+metadata at the same time. To avoid that, the SQL translator holds a lock
+on the table while changing its schema. We've got an in-process lock to
+coordinate threads, and on top of that a Redis lock or a Postgres
+advisory lock to coordinate processes.
+
+Locks are best effort: if we can't get a lock within the configured
+timeout, e.g. because the process holding it died, or Redis is down, we
+log a warning and go ahead anyway, which is no worse than not locking
+at all.
+"""
+
+from contextlib import contextmanager
+from hashlib import sha1
+import logging
+from threading import Lock
+from time import monotonic, sleep
+from typing import Dict, Optional
+
+from cache.factory import CacheEnvReader
+from utils.cfgreader import EnvReader, FloatVar
+
+
+SCHEMA_LOCK_TIMEOUT_VAR = FloatVar('SCHEMA_LOCK_TIMEOUT', 30.0)
+
+REDIS_KEY_PREFIX = 'ql:schema-lock:'
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def schema_lock_timeout() -> float:
+    """
+    :return: how many seconds to wait for a schema lock, which is also how
+        long a Redis lock lasts if its holder doesn't release it.
+    """
+    return EnvReader(log=log().debug).safe_read(SCHEMA_LOCK_TIMEOUT_VAR)
+
+
+_local_locks: Dict[str, Lock] = {}
+_local_locks_guard = Lock()
+
+
+def _local_lock(key: str) -> Lock:
+    with _local_locks_guard:
+        return _local_locks.setdefault(key, Lock())
+
+
+@contextmanager
+def local_schema_lock(key: str, timeout: float):
+    """
+    Hold the in-process lock for the given key.
+
+    :param key: identifies the table.
+    :param timeout: how many seconds to wait for the lock.
+    """
+    lock = _local_lock(key)
+    acquired = lock.acquire(timeout=timeout)
+    if not acquired:
+        log().warning(f"Timed out waiting for local schema lock on {key}")
+    try:
+        yield
+    finally:
+        if acquired:
+            lock.release()
+
+
+@contextmanager
+def redis_schema_lock(redis, key: str, timeout: float):
+    """
+    Hold the Redis lock for the given key.
+
+    :param redis: the Redis client.
+    :param key: identifies the table.
+    :param timeout: how many seconds to wait for the lock as well as how
+        long the lock lasts if not released.
+    """
+    lock = redis.lock(REDIS_KEY_PREFIX + key, timeout=timeout,
+                      blocking_timeout=timeout)
+    try:
+        acquired = lock.acquire()
+    except Exception:
+        log().warning(f"Can't get Redis schema lock on {key}", exc_info=True)
+        acquired = False
+    else:
+        if not acquired:
+            log().warning(f"Timed out waiting for Redis schema lock on {key}")
+    try:
+        yield
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except Exception:                                       # (1)
+                log().warning(f"Can't release Redis schema lock on {key}",
+                              exc_info=True)
+# NOTE
+# 1. Lock expiry. If changing the schema took longer than the timeout, the
+# lock expired and someone else might hold it now. Redis won't let us
+# release it then, which is what we want.
+
+
+def advisory_lock_id(key: str) -> int:
+    """
+    :return: a Postgres advisory lock ID for the given key, i.e. a signed
+        64-bit integer.
+    """
+    digest = sha1(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], byteorder='big', signed=True)
+
+
+@contextmanager
+def pg_advisory_lock(cursor, key: str, timeout: float,
+                     poll_interval: float = 0.05):
+    """
+    Hold a Postgres session-level advisory lock for the given key.
+
+    :param cursor: a cursor on an autocommit connection.
+    :param key: identifies the table.
+    :param timeout: how many seconds to wait for the lock.
+    :param poll_interval: how many seconds to sleep between attempts to
+        get the lock.
+    """
+    lock_id = advisory_lock_id(key)
+    deadline = monotonic() + timeout
+    acquired = False
+    try:
+        while True:
+            cursor.execute('select pg_try_advisory_lock(?)', [lock_id])
+            acquired = cursor.fetchall()[0][0]
+            if acquired or monotonic() >= deadline:
+                break
+            sleep(poll_interval)
+    except Exception:
+        log().warning(f"Can't get advisory schema lock on {key}",
+                      exc_info=True)
+    if not acquired:
+        log().warning(f"Going ahead without advisory schema lock on {key}")
+    try:
+        yield
+    finally:
+        if acquired:
+            try:
+                cursor.execute('select pg_advisory_unlock(?)', [lock_id])
+                cursor.fetchall()
+            except Exception:                                       # (1)
+                log().warning(f"Can't release advisory schema lock on {key}",
+                              exc_info=True)
+# NOTE
+# 1. Lost session. If the translator had to reconnect while holding the
+# lock, Postgres already released the lock when the old session ended.
+
+
+_redis = None
+_redis_lock = Lock()
+
+
+def _redis_client():
+    global _redis
+    host = CacheEnvReader().redis_host()
+    if not host:
+        return None
+    with _redis_lock:
+        if _redis is None:
+            from redis import Redis
+            _redis = Redis(host=host, port=CacheEnvReader().redis_port())
+        return _redis
+
+
+@contextmanager
+def schema_lock(key: str, redis=None):
+    """
+    Hold the in-process lock for the given key and, if Redis is available,
+    the Redis lock too.
+
+    :param key: identifies the table.
+    :param redis: the Redis client to use, defaults to the one configured
+        through ``REDIS_HOST`` if any.
+    """
+    timeout = schema_lock_timeout()
+    redis = redis or _redis_client()
+    with local_schema_lock(key, timeout):
+        if redis is None:
+            yield
+        else:
+            with redis_schema_lock(redis, key, timeout):
+                yield
@@ -7,14 +7,22 @@ from translators.config import SQLTranslatorConfig
 from utils.common import iter_entity_attrs
 from utils.jsondict import safe_get_value
 from utils.maybe import maybe_map
+from utils.timestr import is_iso8601, parse_iso8601
 import logging
+from functools import partial
 from geocoding.slf import SlfQuery
-import dateutil.parser
-from typing import Any, List, Optional, Sequence
+from typing import Any, ContextManager, Dict, Hashable, List, Optional, \
+    Sequence, Tuple
 from uuid import uuid4
 
 from cache.factory import get_cache, is_cache_available
+from translators.insert_fanout import insert_executor, run_all
+from translators.insert_plan import ColumnConverter, InsertPlan, \
+    insert_plan_cache
 from translators.insert_splitter import to_insert_batches
+from translators.metadata_cache import MetadataCache, metadata_cache
+from translators.raw_entity import RAW_JSON, encode_raw_entity
+from translators.schema_lock import schema_lock
 from utils.connection_manager import Borg
 # NGSI TYPES
 # Based on Orion output because official docs don't say much about these :(
@@ -44,6 +52,9 @@ ORIGINAL_ENTITY_COL = '__original_ngsi_entity__'
 ENTITY_ID_COL = 'entity_id'
 ENTITY_TYPE_COL = 'entity_type'
 
+# Tell apart missing attribute fields from fields set to null.
+_MISSING = object()
+
 # Default Translation
 NGSI_TO_SQL = {
     "Array": 'array',
@@ -215,36 +226,82 @@ class SQLTranslator(base_translator.BaseTranslator):
             for e in entities:
                 entities_by_type.setdefault(entity_type(e), []).append(e)
 
-            res = None
-            for et in entities_by_type.keys():
-                res = self._insert_entities_of_type(et,
-                                                    entities_by_type[et],
-                                                    fiware_service,
-                                                    service_paths[0])
+            groups = [(et, es, service_paths[0])
+                      for et, es in entities_by_type.items()]
         elif len(service_paths) == len(entities):
             entities_by_service_path = {}
             for idx, path in enumerate(service_paths):
                 entities_by_service_path.setdefault(path, []).append(
                     entities[idx])
-            res = None
+            groups = []
             for path in entities_by_service_path.keys():
                 entities_by_type = {}
                 for e in entities_by_service_path[path]:
                     entities_by_type.setdefault(entity_type(e), []).append(e)
 
-                res = None
-                for et in entities_by_type.keys():
-                    res = self._insert_entities_of_type(et,
-                                                        entities_by_type[et],
-                                                        fiware_service,
-                                                        path)
+                groups += [(et, es, path)
+                           for et, es in entities_by_type.items()]
         else:
             msg = 'Multiple servicePath are allowed only ' \
                   'if their number match the number of entities'
             raise InvalidHeaderValue('Fiware-ServicePath',
                                      fiware_servicepath, msg)
 
-        return res
+        return self._insert_groups(groups, fiware_service)
+
+    def _insert_groups(self, groups: List[Tuple[str, List[dict], str]],
+                       fiware_service: Optional[str]):
+        """
+        Insert each group of entities of the same type and service path.
+        If ``INSERT_MAX_FANOUT`` is greater than one, the first group gets
+        inserted on its own and the others concurrently, each through a
+        clone of this translator except for the last one.
+
+        :param groups: entity type, entities and service path of each group.
+        :param fiware_service: the tenant the entities belong to.
+        :return: the result of inserting the last group.
+        """
+        if not groups:
+            return None
+
+        et, es, path = groups[0]
+        res = self._insert_entities_of_type(et, es, fiware_service, path)
+
+        executor = insert_executor()
+        if executor is None or len(groups) <= 2:
+            for et, es, path in groups[1:]:
+                res = self._insert_entities_of_type(et, es,
+                                                    fiware_service, path)
+            return res
+
+        et, es, path = groups[-1]
+        tasks = [partial(self._insert_group_in_clone, g, fiware_service)
+                 for g in groups[1:-1]]                               # (1)
+        tasks.append(partial(self._insert_entities_of_type,
+                             et, es, fiware_service, path))         # (2)
+        return run_all(executor, tasks)[-1]
+# NOTE
+# 1. First group. Inserting the first group on its own creates the tenant's
+# schema and the metadata table if need be, so the concurrent inserts only
+# ever create their own data tables and don't race on shared DDL.
+# 2. Result. We insert the last group in the calling thread through this
+# translator, so we return this translator's cursor like the serial code
+# path does. A clone's cursor is closed by the time we get hold of it.
+
+    def _insert_group_in_clone(self, group: Tuple[str, List[dict], str],
+                               fiware_service: Optional[str]):
+        et, es, path = group
+        with self._clone() as trans:
+            return trans._insert_entities_of_type(et, es, fiware_service,
+                                                  path)
+
+    def _clone(self) -> 'SQLTranslator':
+        """
+        :return: a new, not yet set up, translator with the same connection
+            settings as this one. Subclasses must implement this method to
+            support concurrent inserts.
+        """
+        raise NotImplementedError
 
     def _insert_entities_of_type(self,
                                  entityType,
@@ -270,6 +327,161 @@ class SQLTranslator(base_translator.BaseTranslator):
                     f"Entity {entity_id(e)} has a reserved attribute name: " +
                     "'{ORIGINAL_ENTITY_COL_NAME}'")
 
+        table_name = self._et2tn(entityType, fiware_service)
+        plans = insert_plan_cache()
+        signature = self._attrs_signature(entities)
+        plan_key = (self.dbCacheName, table_name, signature)
+        plan = plans.get(plan_key) if signature is not None else None  # (1)
+        if plan is None:
+            plan = self._compile_insert_plan(table_name, entities)
+
+        modified = self._sync_tables(table_name, plan, fiware_service)
+        if modified:
+            plans.evict(self.dbCacheName, table_name)                 # (2)
+        if signature is not None:
+            plans.put(plan_key, plan)
+
+        # Gather attribute values
+        entries = [plan.to_row(e, fiware_servicepath) for e in entities]
+
+        # Insert entities data
+        self._insert_entity_rows(plan, entries, entities)
+        return self.cursor
+    # NOTE
+    # 1. Insert plans. Working out column types and value converters is
+    # the bulk of the CPU work on insert, but the outcome only depends on
+    # the shape of the entities, so we only do it for shapes we haven't
+    # seen yet. We still have to check the table metadata though, since
+    # another QL process could've dropped or altered the table in the
+    # meantime.
+    # 2. Stale plans. If we had to touch the table, plans compiled earlier
+    # for other shapes might not match the table anymore, e.g. if it got
+    # dropped and recreated.
+
+    def _sync_tables(self, table_name: str, plan: InsertPlan,
+                     fiware_service: Optional[str]) -> set:
+        """
+        Make sure the data table and its metadata have all the columns in
+        the given plan, creating the table or adding columns if needed.
+
+        :return: the names of the columns that weren't there.
+        """
+        if not self._metadata_diff(table_name, plan.original_attrs):
+            return set()
+
+        with self._schema_lock(table_name):                           # (1)
+            # Create/Update metadata table for this type
+            modified = self._update_metadata_table(
+                table_name, plan.original_attrs, fresh=True)         # (2)
+            # Sort out data table.
+            if modified and modified == plan.original_attrs.keys():
+                self._create_data_table(table_name, plan.table,
+                                        fiware_service)
+            elif modified:
+                new_columns = {}
+                for k in modified:
+                    new_columns[k] = plan.table[k]
+                self._update_data_table(table_name, new_columns,
+                                        fiware_service)
+        return modified
+    # NOTE
+    # 1. Schema changes. When new attributes show up, lots of threads and
+    # processes are likely to see them at the same time. The schema lock
+    # makes sure only one of them changes the table while the others wait.
+    # 2. Double check. Once we've got the lock, we read the metadata again
+    # from the DB since whoever had the lock before us could've added the
+    # same columns already, in which case there's nothing left to do.
+
+    def _schema_lock(self, table_name: str) -> ContextManager:
+        """
+        :return: a lock to hold while changing the given table's schema.
+            Subclasses can use DB-specific locks, the default is a Redis
+            lock if Redis is configured or an in-process lock otherwise.
+        """
+        return schema_lock(f"{self.dbCacheName}:{table_name}")
+
+    def provision_entity_type(self, etype: str, attrs: Dict[str, str],
+                              fiware_service: Optional[str] = None) -> set:
+        """
+        Create the data table and metadata for the given entity type ahead
+        of time, so inserts of entities of that type don't have to touch
+        the DB schema. If the table is already there, add any column it
+        doesn't have yet, all in one go.
+
+        :param etype: the entity type.
+        :param attrs: the NGSI type of each entity attribute.
+        :param fiware_service: the tenant the entity type belongs to.
+        :return: the names of the columns that weren't there.
+        """
+        template = {NGSI_ID: '', NGSI_TYPE: etype,
+                    self.TIME_INDEX_NAME: current_timex()}
+        for name, attr_t in attrs.items():
+            template[name] = {'type': attr_t, 'value': None}
+
+        table_name = self._et2tn(etype, fiware_service)
+        plan = self._compile_insert_plan(table_name, [template])
+        modified = self._sync_tables(table_name, plan, fiware_service)
+        if modified:
+            insert_plan_cache().evict(self.dbCacheName, table_name)
+        return modified
+
+    def _attrs_signature(self, entities: List[dict]) -> Optional[Hashable]:
+        """
+        Compute a signature of the shape of the given entities such that
+        entity lots with the same signature compile to the same insert plan.
+        Since, when inferring column types, later entities in the lot win
+        over earlier ones, the signature only takes into account the last
+        shape of each column.
+
+        :param entities: the entities to insert, all of the same type.
+        :return: the signature or ``None`` if some attributes have a shape
+            we can't account for.
+        """
+        shapes = {}
+        for e in entities:
+            for attr in iter_entity_attrs(e):
+                if attr == self.TIME_INDEX_NAME:
+                    continue
+                shape = self._attr_shape(e[attr])
+                if shape is None:
+                    return None
+                shapes[self._ea2cn(attr)] = (attr, shape)
+        return frozenset(shapes.items())
+
+    def _attr_shape(self, attr: dict) -> Optional[Tuple]:
+        if not isinstance(attr, dict):
+            return None
+
+        attr_t = attr.get('type', _MISSING)
+        if not isinstance(attr_t, str) and attr_t not in (None, _MISSING):
+            return None
+        value = attr.get('value', _MISSING)
+        fallback_value = attr.get('value', None) or attr.get('object', None)
+        is_inferred = attr_t is _MISSING or attr_t == 'Property' \
+            or attr_t not in self.NGSI_TO_SQL                         # (1)
+
+        return (attr_t, self._value_shape(value, is_inferred),
+                self._value_shape(fallback_value, is_inferred))
+    # NOTE
+    # 1. Type inference. Only then the inferred types depend on what the
+    # values look like, e.g. whether a string holds an ISO 8601 date, as
+    # opposed to just what Python type they are.
+
+    def _value_shape(self, value: Any, is_inferred: bool) -> Tuple:
+        if isinstance(value, str):
+            is_long = len(value) > 32765
+            is_date = is_inferred and self._is_iso_date(value)
+            return str, is_long, is_date
+        if isinstance(value, dict):
+            is_date = is_inferred and value.get('@type') == 'DateTime' \
+                and '@value' in value and self._is_iso_date(value['@value'])
+            return dict, value.get('@type') == 'DateTime', is_date
+        if value is _MISSING:
+            return None,
+        return type(value),
+
+    def _compile_insert_plan(self, table_name: str,
+                             entities: List[dict]) -> InsertPlan:
         # Define column types
         # {column_name -> crate_column_type}
         table = {
@@ -329,82 +541,126 @@ class SQLTranslator(base_translator.BaseTranslator):
 
                 table[col] = self._compute_type(entityId, attr_t, e[attr])
 
-        # Create/Update metadata table for this type
-        table_name = self._et2tn(entityType, fiware_service)
-        modified = self._update_metadata_table(table_name, original_attrs)
-        # Sort out data table.
-        if modified and modified == original_attrs.keys():
-            self._create_data_table(table_name, table, fiware_service)
-        elif modified:
-            new_columns = {}
-            for k in modified:
-                new_columns[k] = table[k]
-            self._update_data_table(table_name, new_columns, fiware_service)
-
-        # Gather attribute values
         col_names = sorted(table.keys())
-        entries = []  # raw values in same order as column names
-        for e in entities:
-            values = self._preprocess_values(e, original_attrs, col_names,
-                                             fiware_servicepath)
-            entries.append(values)
+        converters = [self._column_converter(cn, original_attrs)
+                      for cn in col_names]
+        col_list = ', '.join(['"{}"'.format(c.lower()) for c in col_names])
+        placeholders = ','.join(['?'] * len(col_names))
+        stmt = f"insert into {table_name} ({col_list}) values ({placeholders})"
 
-        # Insert entities data
-        self._insert_entity_rows(table_name, col_names, entries, entities)
-        return self.cursor
+        return InsertPlan(table_name=table_name, table=table,
+                          original_attrs=original_attrs, col_names=col_names,
+                          converters=converters, stmt=stmt)
 
-    def _insert_entity_rows(self, table_name: str, col_names: List[str],
-                            rows: List[List], entities: List[dict]):
-        col_list, placeholders, rows = \
-            self._build_insert_params_and_values(col_names, rows, entities)
+    def _insert_entity_rows(self, plan: InsertPlan, rows: List[List],
+                            entities: List[dict]):
+        rows = self._add_original_data_values(plan.col_names, rows, entities)
+        start_time = datetime.now()
 
-        stmt = f"insert into {table_name} ({col_list}) values ({placeholders})"
-        try:
-            start_time = datetime.now()
-
-            for batch in to_insert_batches(rows):
-                res = self.cursor.executemany(stmt, batch)
-                # new version of crate does not bomb anymore when
-                # something goes wrong in multi entries
-                # simply it returns -2 for each row that have an issue
-                # TODO: improve error handling.
-                # using batches, we don't need to fail the whole set
-                # but only failing batches.
-                if isinstance(res, list):
-                    for i in range(len(res)):
-                        if res[i]['rowcount'] < 0:
-                            raise Exception('An insert failed')
-
-            dt = datetime.now() - start_time
-            time_difference = (dt.days * 24 * 60 * 60 + dt.seconds) \
-                * 1000 + dt.microseconds / 1000.0
-            self.logger.debug("Query completed | time={} msec".format(
-                str(time_difference)))
-        except Exception as e:
-            self.sql_error_handler(e)
-            if not self._should_insert_original_entities(e):
-                raise
+        offset = 0
+        for batch in to_insert_batches(rows):
+            batch_entities = entities[offset:offset + len(batch)]     # (1)
+            offset += len(batch)
+            try:
+                res = self._insert_batch(plan, batch)
+            except Exception as e:
+                self.sql_error_handler(e)
+                if not self._should_insert_original_entities(e):
+                    raise
 
-            self.logger.exception(
-                'Failed to insert entities because of below error; ' +
-                'translator will still try saving original JSON in ' +
-                f"{table_name}.{ORIGINAL_ENTITY_COL}"
-            )
-            self._insert_original_entities_in_failed_batch(
-                table_name, entities, e)
+                self.logger.exception(
+                    'Failed to insert entities because of below error; ' +
+                    'translator will still try saving original JSON in ' +
+                    f"{plan.table_name}.{ORIGINAL_ENTITY_COL}"
+                )
+                self._insert_original_entities_in_failed_batch(
+                    plan.table_name, batch_entities, e)
+                continue
+
+            failed_rows = self._failed_rows(res)
+            if failed_rows:
+                self._handle_failed_rows(plan, batch, batch_entities,
+                                         failed_rows)
+
+        dt = datetime.now() - start_time
+        time_difference = (dt.days * 24 * 60 * 60 + dt.seconds) \
+            * 1000 + dt.microseconds / 1000.0
+        self.logger.debug("Query completed | time={} msec".format(
+            str(time_difference)))
+    # NOTE
+    # 1. Batch failures. Batches get inserted independently, so if one
+    # fails, we only save the original entities of that batch. The rows of
+    # the other batches are stored as usual.
+
+    @staticmethod
+    def _failed_rows(insert_result: Any) -> List[int]:
+        """
+        Find out which rows of a bulk insert failed, if the DB driver tells.
+        Recent versions of Crate don't bomb out when some of the rows in a
+        bulk insert are bad, rather they return a result list with a row
+        count of -2 for each row that couldn't be inserted.
+
+        :param insert_result: what the DB driver returned for the insert.
+        :return: the indexes of the failed rows within the batch.
+        """
+        if isinstance(insert_result, list):
+            return [i for i, r in enumerate(insert_result)
+                    if r['rowcount'] < 0]
+        return []
+
+    def _handle_failed_rows(self, plan: InsertPlan, batch: List[List],
+                            entities: List[dict], failed_rows: List[int]):
+        insert_error = Exception('An insert failed')
+        if len(failed_rows) < len(batch):                             # (1)
+            still_failed = []
+            for i in failed_rows:
+                try:
+                    self.cursor.execute(plan.stmt, batch[i])
+                except Exception as e:
+                    self.sql_error_handler(e)
+                    insert_error = e
+                    still_failed.append(i)
+            failed_rows = still_failed
+        if not failed_rows:
+            return
+        if not self._should_insert_original_entities(insert_error):
+            raise insert_error
+
+        self.logger.error(
+            f"Failed to insert {len(failed_rows)} out of {len(batch)} " +
+            f"rows because of error: {insert_error!r}; translator will " +
+            'still try saving original JSON in ' +
+            f"{plan.table_name}.{ORIGINAL_ENTITY_COL}"
+        )
+        failed_entities = [entities[i] for i in failed_rows]
+        self._insert_original_entities_in_failed_batch(
+            plan.table_name, failed_entities, insert_error)
+    # NOTE
+    # 1. Retries. If only some rows failed, we retry each of them on its
+    # own, which could work if the failure was transient and otherwise gets
+    # us the actual error to save along with the original entity. If the
+    # whole batch failed though, odds are retrying row by row will fail
+    # too, so we save all the original entities straight away.
+
+    def _insert_batch(self, plan: InsertPlan, batch: List[List]) -> Any:
+        """
+        Insert a batch of rows in one go.
+
+        :param plan: the plan the rows were built with.
+        :param batch: the rows to insert.
+        :return: whatever the DB driver returns for the insert.
+        """
+        return self.cursor.executemany(plan.stmt, batch)
 
-    def _build_insert_params_and_values(
+    def _add_original_data_values(
             self, col_names: List[str], rows: List[List],
-            entities: List[dict]) -> (str, str, List[List]):
+            entities: List[dict]) -> List[List]:
         if self.config.keep_raw_entity():
             original_entity_col_index = col_names.index(ORIGINAL_ENTITY_COL)
             for i, r in enumerate(rows):
                 wrapper = self._build_original_data_value(entities[i])
                 r[original_entity_col_index] = wrapper
-
-        col_list = ', '.join(['"{}"'.format(c.lower()) for c in col_names])
-        placeholders = ','.join(['?'] * len(col_names))
-        return col_list, placeholders, rows
+        return rows
 
     # NOTE. Brittle code.
     # This code, like the rest of the insert workflow implicitly assumes
@@ -416,15 +672,25 @@ class SQLTranslator(base_translator.BaseTranslator):
     def _build_original_data_value(self, entity: dict,
                                    insert_error: Exception = None,
                                    failed_batch_id: str = None) -> Any:
-        value = {
-            'data': entity
-        }
-        if failed_batch_id:
+        if failed_batch_id:                                            # (1)
+            value = self._encode_raw_entity(entity, RAW_JSON)
             value['failedBatchID'] = failed_batch_id
+        else:
+            value = self._encode_raw_entity(entity)
         if insert_error:
             value['error'] = repr(insert_error)
 
         return self._to_db_ngsi_structured_value(value)
+    # NOTE
+    # 1. Failed batches. Operators query these rows to find out what went
+    # wrong, so we always keep the entity as plain JSON next to the error
+    # and batch ID, whatever ``KEEP_RAW_ENTITY_ENCODING`` says.
+
+    def _encode_raw_entity(self, entity: dict,
+                           encoding: Optional[str] = None) -> dict:
+        if encoding is None:
+            encoding = self.config.keep_raw_entity_encoding()
+        return encode_raw_entity(entity, encoding)
 
     @staticmethod
     def _to_db_ngsi_structured_value(data: dict) -> Any:
@@ -460,62 +726,69 @@ class SQLTranslator(base_translator.BaseTranslator):
     def is_text(attr_type):
         return attr_type == NGSI_TEXT or attr_type not in NGSI_TO_SQL
 
-    def _preprocess_values(self, e, original_attrs, col_names,
-                           fiware_servicepath):
-        values = []
-        for cn in col_names:
-            if cn == ENTITY_TYPE_COL:
-                values.append(entity_type(e))
-            elif cn == ENTITY_ID_COL:
-                values.append(entity_id(e))
-            elif cn == self.TIME_INDEX_NAME:
-                values.append(e[self.TIME_INDEX_NAME])
-            elif cn == FIWARE_SERVICEPATH:
-                values.append(fiware_servicepath or '/')
-            elif cn == 'instanceId':
-                values.append("urn:ngsi-ld:" + str(uuid4()))
-            else:
-                # Normal attributes
-                try:
-                    attr = original_attrs[cn][0]
-                    attr_t = original_attrs[cn][1]
-
-                    if SlfGeometry.is_ngsi_slf_attr(e[attr]):
-                        mapped_value = self._ngsi_slf_to_db(e[attr])
-                    elif attr_t == NGSI_GEOJSON or attr_t == NGSI_LD_GEOMETRY:
-                        mapped_value = self._ngsi_geojson_to_db(e[attr])
-                    elif self._is_ngsi_ld_datetime_property(e[attr]):
-                        mapped_value = self._ngsi_ld_datetime_to_db(e[attr])
-                    elif attr_t == NGSI_TEXT:
-                        mapped_value = self._ngsi_text_to_db(e[attr])
-                    elif attr_t == NGSI_DATETIME or attr_t == NGSI_ISO8601:
-                        mapped_value = self._ngsi_datetime_to_db(e[attr])
-                    elif attr_t == "Boolean":
-                        mapped_value = self._ngsi_boolean_to_db(e[attr])
-                    elif attr_t == "Number":
-                        mapped_value = self._ngsi_number_to_db(e[attr])
-                    elif attr_t == "Integer":
-                        mapped_value = self._ngsi_integer_to_db(e[attr])
-                    elif attr_t == 'Relationship':
-                        mapped_value = self._ngsi_ld_relationship_to_db(
-                            e[attr])
-                    elif self._is_ngsi_array(e[attr], attr_t):
-                        mapped_value = self._ngsi_array_to_db(e[attr])
-                    elif self._is_ngsi_object(e[attr], attr_t):
-                        mapped_value = self._ngsi_structured_to_db(e[attr])
-                    else:
-                        mapped_value = self._ngsi_default_to_db(e[attr])
-
-                    values.append(mapped_value)
-                except KeyError:
-                    # this entity update does not have a value for the column
-                    # so use None which will be inserted as NULL to the db.
-                    values.append(None)
-                except ValueError:
-                    # this value cannot be cast to column type
-                    # so use None which will be inserted as NULL to the db.
-                    values.append(None)
-        return values
+    def _column_converter(self, col_name: str, original_attrs: dict) \
+            -> ColumnConverter:
+        if col_name == ENTITY_TYPE_COL:
+            return lambda e, sp: entity_type(e)
+        if col_name == ENTITY_ID_COL:
+            return lambda e, sp: entity_id(e)
+        if col_name == self.TIME_INDEX_NAME:
+            time_index_name = self.TIME_INDEX_NAME
+            return lambda e, sp: e[time_index_name]
+        if col_name == FIWARE_SERVICEPATH:
+            return lambda e, sp: sp or '/'
+        if col_name == 'instanceId':
+            return lambda e, sp: "urn:ngsi-ld:" + str(uuid4())
+        if col_name not in original_attrs:
+            return lambda e, sp: None
+
+        # Normal attributes
+        attr, attr_t = original_attrs[col_name]
+        to_db = type(self)._ngsi_attr_to_db                           # (1)
+
+        def convert(e: dict, sp: Optional[str]) -> Any:
+            try:
+                return to_db(e[attr], attr_t)
+            except KeyError:
+                # this entity update does not have a value for the column
+                # so use None which will be inserted as NULL to the db.
+                return None
+            except ValueError:
+                # this value cannot be cast to column type
+                # so use None which will be inserted as NULL to the db.
+                return None
+
+        return convert
+    # NOTE
+    # 1. Converters outlive the translator. Plans get cached across
+    # translator instances, so we shouldn't hang on to this one, its
+    # cursor and connection.
+
+    @classmethod
+    def _ngsi_attr_to_db(cls, attr: dict, attr_t: Optional[str]) -> Any:
+        if SlfGeometry.is_ngsi_slf_attr(attr):
+            return cls._ngsi_slf_to_db(attr)
+        if attr_t == NGSI_GEOJSON or attr_t == NGSI_LD_GEOMETRY:
+            return cls._ngsi_geojson_to_db(attr)
+        if cls._is_ngsi_ld_datetime_property(attr):
+            return cls._ngsi_ld_datetime_to_db(attr)
+        if attr_t == NGSI_TEXT:
+            return cls._ngsi_text_to_db(attr)
+        if attr_t == NGSI_DATETIME or attr_t == NGSI_ISO8601:
+            return cls._ngsi_datetime_to_db(attr)
+        if attr_t == "Boolean":
+            return cls._ngsi_boolean_to_db(attr)
+        if attr_t == "Number":
+            return cls._ngsi_number_to_db(attr)
+        if attr_t == "Integer":
+            return cls._ngsi_integer_to_db(attr)
+        if attr_t == 'Relationship':
+            return cls._ngsi_ld_relationship_to_db(attr)
+        if cls._is_ngsi_array(attr, attr_t):
+            return cls._ngsi_array_to_db(attr)
+        if cls._is_ngsi_object(attr, attr_t):
+            return cls._ngsi_structured_to_db(attr)
+        return cls._ngsi_default_to_db(attr)
 
     @staticmethod
     def _is_ngsi_array(attr, attr_t):
@@ -656,7 +929,7 @@ class SQLTranslator(base_translator.BaseTranslator):
     def _ngsi_ld_relationship_to_db(attr):
         return attr.get('value', None) or attr.get('object', None)
 
-    def _update_metadata_table(self, table_name, metadata):
+    def _update_metadata_table(self, table_name, metadata, fresh=False):
         """
         This method creates the METADATA_TABLE_NAME (if not exists), which
         stores, for each table_name (entity type), a translation table (dict)
@@ -673,8 +946,43 @@ class SQLTranslator(base_translator.BaseTranslator):
 
         :param metadata: dict
             The dict mapping the matedata of each column. See original_attrs.
+
+        :param fresh: bool
+            Read the persisted metadata from the DB, bypassing the query
+            cache.
+        """
+        md_cache = self._metadata_cache()
+        persisted_metadata = self._read_metadata(table_name, fresh)
+
+        diff = metadata.keys() - persisted_metadata.keys()
+        if diff:
+            # we update using the difference to "not" corrupt the metadata
+            # by previous insert
+            update = dict((k, metadata[k]) for k in diff if k in metadata)
+            persisted_metadata.update(update)
+            self._store_metadata(table_name, persisted_metadata)
+            self._cache(self.dbCacheName,
+                        table_name,
+                        [[persisted_metadata]],
+                        self.default_ttl)
+            if md_cache:
+                md_cache.changed(self.dbCacheName, table_name,
+                                 persisted_metadata)
+        elif md_cache and persisted_metadata:
+            md_cache.put(self.dbCacheName, table_name, persisted_metadata)
+        return diff
+        # NOTE. Concurrency. Callers should hold the table's schema lock,
+        # otherwise concurrent updates could get lost. See _sync_tables.
+
+    def _read_metadata(self, table_name: str, fresh: bool = False) -> dict:
         """
+        Read a table's metadata from the query cache or the DB, creating
+        the metadata table if need be.
 
+        :param table_name: the table whose metadata to read.
+        :param fresh: read from the DB, bypassing the query cache.
+        :return: the table's metadata, empty if there's none.
+        """
         if not self._is_query_in_cache(self.dbCacheName, METADATA_TABLE_NAME):
             self._create_metadata_table()
             self._cache(self.dbCacheName,
@@ -688,39 +996,99 @@ class SQLTranslator(base_translator.BaseTranslator):
 
         # By design, one entry per table_name
         try:
-            res = self._execute_query_via_cache(self.dbCacheName,
-                                                table_name,
-                                                stmt,
-                                                [table_name],
-                                                self.default_ttl)
-            persisted_metadata = res[0][0] if res else {}
+            if fresh:
+                self.cursor.execute(stmt, [table_name])
+                res = self.cursor.fetchall()
+            else:
+                res = self._execute_query_via_cache(self.dbCacheName,
+                                                    table_name,
+                                                    stmt,
+                                                    [table_name],
+                                                    self.default_ttl)
+            return res[0][0] if res else {}
         except Exception as e:
             self.sql_error_handler(e)
             # Metadata table still not created
             logging.debug(str(e), exc_info=True)
             # Attempt to re-create metadata table
             self._create_metadata_table()
-            persisted_metadata = {}
+            return {}
 
-        diff = metadata.keys() - persisted_metadata.keys()
-        if diff:
-            # we update using the difference to "not" corrupt the metadata
-            # by previous insert
-            update = dict((k, metadata[k]) for k in diff if k in metadata)
-            persisted_metadata.update(update)
-            self._store_metadata(table_name, persisted_metadata)
-            self._cache(self.dbCacheName,
-                        table_name,
-                        [[persisted_metadata]],
-                        self.default_ttl)
-        return diff
-        # TODO: concurrency.
-        # This implementation paves
-        # the way to lost updates...
+    def _metadata_diff(self, table_name: str, metadata: dict) -> set:
+        """
+        :return: the columns in the given metadata the table hasn't got
+            yet according to the metadata cache, the query cache or the DB,
+            whichever has got the table's metadata first.
+        """
+        md_cache = self._metadata_cache()
+        if md_cache:
+            cached = md_cache.get(self.dbCacheName, table_name)
+            if cached is not None and not metadata.keys() - cached.keys():
+                return set()                                          # (1)
+
+        persisted_metadata = self._read_metadata(table_name)
+        if md_cache and persisted_metadata:
+            md_cache.put(self.dbCacheName, table_name, persisted_metadata)
+        return metadata.keys() - persisted_metadata.keys()
+    # NOTE
+    # 1. Metadata cache. We only trust the cache when it says there's
+    # nothing new. Otherwise the cache could be stale, e.g. another process
+    # added the same columns in the meantime, so we read the metadata again.
 
     def _store_metadata(self, table_name, persisted_metadata):
         raise NotImplementedError
 
+    def _metadata_cache(self) -> Optional[MetadataCache]:
+        """
+        :return: the process-wide metadata cache, loaded with the metadata
+            of all the tables in this translator's DB, if ``CACHE_METADATA``
+            is set, ``None`` otherwise.
+        """
+        md_cache = metadata_cache()
+        if md_cache and not md_cache.is_loaded(self.dbCacheName):
+            stmt = "select table_name, entity_attrs from {}".format(
+                METADATA_TABLE_NAME)
+            try:
+                self.cursor.execute(stmt)
+                rows = self.cursor.fetchall()
+            except Exception as e:
+                self.sql_error_handler(e)
+                # Metadata table still not created
+                self.logger.debug(str(e), exc_info=True)
+                rows = []
+            md_cache.load(self.dbCacheName,
+                          {t: md for t, md in rows if md is not None})
+        return md_cache
+
+    def _load_metadata(self, table_names: List[str]) -> list:
+        """
+        Read the metadata of the given tables, from the metadata cache if
+        ``CACHE_METADATA`` is set, from the DB otherwise.
+
+        :param table_names: the tables whose metadata to read.
+        :return: a (table name, metadata) pair for each table that has
+            metadata.
+        """
+        md_cache = self._metadata_cache()
+        res, missing = [], table_names
+        if md_cache:
+            cached = [(t, md_cache.get(self.dbCacheName, t))
+                      for t in table_names]
+            res = [(t, md) for t, md in cached if md is not None]
+            missing = [t for t, md in cached if md is None]
+        if not missing:
+            return res
+
+        cursors = ', '.join(list(map(lambda x: '?', missing)))
+        stmt = "select table_name, entity_attrs from {} " \
+               "where table_name in ({})".format(METADATA_TABLE_NAME, cursors)
+        self.cursor.execute(stmt, missing)
+        rows = self.cursor.fetchall()
+        if md_cache:
+            for t, md in rows:
+                md_cache.put(self.dbCacheName, t, md)
+        return res + rows
+
     def _get_et_table_names(self, fiware_service=None):
         """
         Return the names of all the tables representing entity types.
@@ -848,15 +1216,14 @@ class SQLTranslator(base_translator.BaseTranslator):
     @staticmethod
     def _parse_date(date):
         try:
-            return dateutil.parser.isoparse(date.strip('\"')).isoformat()
+            return parse_iso8601(date.strip('\"')).isoformat()
         except Exception as e:
             raise InvalidParameterValue(date, "**fromDate** or **toDate**")
 
     @staticmethod
     def _is_iso_date(date):
         try:
-            dateutil.parser.isoparse(date.strip('\"')).isoformat()
-            return True
+            return is_iso8601(date.strip('\"'))
         except Exception as e:
             return False
 
@@ -1428,9 +1795,6 @@ class SQLTranslator(base_translator.BaseTranslator):
         """
         if isinstance(table_names, str):
             table_names = [table_names]
-        cursors = ', '.join(list(map(lambda x: '?', table_names)))
-        stmt = "select table_name, entity_attrs from {} " \
-               "where table_name in ({})".format(METADATA_TABLE_NAME, cursors)
 
         try:
             # TODO we tested using cache here, but with current "delete"
@@ -1444,8 +1808,7 @@ class SQLTranslator(base_translator.BaseTranslator):
             #  below ttl) the same cache can be called despite there is no
             #  data. a possible solution is to create a cache based on query
             #  parameters that would cache all the results
-            self.cursor.execute(stmt, table_names)
-            res = self.cursor.fetchall()
+            res = self._load_metadata(table_names)
         except Exception as e:
             self.sql_error_handler(e)
             self.logger.error(str(e), exc_info=True)
@@ -1580,11 +1943,16 @@ class SQLTranslator(base_translator.BaseTranslator):
             self.sql_error_handler(e)
             self.logger.error(str(e), exc_info=True)
 
+        insert_plan_cache().evict(self.dbCacheName, table_name)
+
         # Delete entry from metadata table
         op = "delete from {} where table_name = ?".format(METADATA_TABLE_NAME)
         try:
             self.cursor.execute(op, [table_name])
             self._remove_from_cache(self.dbCacheName, table_name)
+            md_cache = metadata_cache()
+            if md_cache:
+                md_cache.changed(self.dbCacheName, table_name, None)
             key = ""
             if fiware_service:
                 key = fiware_service.lower()
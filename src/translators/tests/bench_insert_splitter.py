@@ -0,0 +1,107 @@
+"""
+Micro-benchmark for insert batching.
+
+Time how long it takes to split a lot of typical insert rows into batches
+with the current ``to_insert_batches`` implementation and with the one
+it replaced, which measured rows with ``objsize`` and pushed items back
+into the input stream by wrapping it in more and more ``chain`` objects.
+Run it from the ``src`` directory with
+
+    python -m translators.tests.bench_insert_splitter --rows 20000
+"""
+
+from itertools import chain
+import os
+from timeit import timeit
+from uuid import uuid4
+
+import click
+from objsize import get_deep_size
+
+from translators.insert_splitter import INSERT_MAX_SIZE_VAR, \
+    compute_row_size, to_insert_batches
+
+
+class ChainSplitter:
+    """
+    The ``IterCostSplitter`` algorithm we used to have.
+    """
+
+    def __init__(self, cost_fn, batch_max_cost):
+        self._cost_of = cost_fn
+        self._max_cost = batch_max_cost
+        self._iter = None
+        self._keep_iterating = True
+
+    def _put_back(self, item):
+        self._iter = chain([item], self._iter)
+
+    def _next_batch(self):
+        cost_so_far = 0
+        batch_size = 0
+        for x in self._iter:
+            next_cost = self._cost_of(x)
+            if batch_size == 0 or cost_so_far + next_cost <= self._max_cost:
+                batch_size += 1
+                cost_so_far += next_cost
+                yield x
+            else:
+                self._put_back(x)
+                return
+        self._keep_iterating = False
+
+    def list_batches(self, xs):
+        self._iter = iter(xs)
+        self._keep_iterating = True
+        batches = []
+        while self._keep_iterating:
+            batch = list(self._next_batch())
+            if batch:
+                batches.append(batch)
+        return batches
+
+
+def deep_size_row_cost(r) -> int:
+    return sum(get_deep_size(k) for k in r)
+
+
+def gen_rows(n: int) -> [list]:
+    return [[
+        'urn:ngsi-ld:Device:' + str(k), 'Device',
+        '2021-06-01T10:00:00.000+00:00', '/some/service/path',
+        'urn:ngsi-ld:' + str(uuid4()), 20.5 + k, k, True,
+        'some text ' * 3, {'lat': 45.0, 'lon': 11.0, 'tags': ['a', 'b']},
+        None
+    ] for k in range(n)]
+
+
+def run(label: str, fn, repeat: int) -> float:
+    secs = timeit(fn, number=repeat) / repeat
+    print(f"{label:<45} {secs * 1000:10.1f} ms")
+    return secs
+
+
+@click.command()
+@click.option('--rows', default=20000, help='Number of rows to split.')
+@click.option('--max-size', default=16 * 1024,
+              help='Max batch size in bytes.')
+@click.option('--repeat', default=3, help='Number of runs to average.')
+def main(rows, max_size, repeat):
+    xs = gen_rows(rows)
+    os.environ[INSERT_MAX_SIZE_VAR] = f"{max_size}B"
+    print(f"Splitting {rows} rows in batches of at most {max_size} bytes.")
+
+    legacy = run('objsize cost + chain splitter',
+                 lambda: ChainSplitter(deep_size_row_cost, max_size)
+                 .list_batches(xs), repeat)
+    run('estimated cost + chain splitter',
+        lambda: ChainSplitter(compute_row_size, max_size).list_batches(xs),
+        repeat)
+    current = run('to_insert_batches (estimated cost + lookahead)',
+                  lambda: to_insert_batches(xs), repeat)
+
+    print(f"Speedup: {legacy / current:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,9 @@ from time import sleep
 from typing import Any, Callable, Generator, List
 
 from translators.base_translator import TIME_INDEX_NAME
-from translators.config import KEEP_RAW_ENTITY_VAR
+from translators.config import KEEP_RAW_ENTITY_VAR, \
+    KEEP_RAW_ENTITY_ENCODING_VAR
+from translators.raw_entity import decode_original_data
 from translators.sql_translator import SQLTranslator, current_timex
 from translators.sql_translator import ORIGINAL_ENTITY_COL, ENTITY_ID_COL, \
     TYPE_PREFIX, TENANT_PREFIX
@@ -42,10 +44,9 @@ def gen_entity(entity_id: int, attr_type: str, attr_value) -> dict:
 def assert_saved_original(actual_row, original_entity,
                           should_have_batch_id=False):
     saved_entity = actual_row[ORIGINAL_ENTITY_COL]
-    data = saved_entity['data']
-    if not isinstance(saved_entity['data'], dict):
-        data = json.loads(data)
-    assert original_entity == data
+    if isinstance(saved_entity, str):
+        saved_entity = json.loads(saved_entity)
+    assert original_entity == decode_original_data(saved_entity)
     if should_have_batch_id:
         assert saved_entity['failedBatchID']
     else:
@@ -131,6 +132,22 @@ class OriginalDataScenarios:
         assert_inserted_entity(rs[0], good_entity)
         assert_failed_entity(rs[1], bad_entity)
 
+    def run_partially_failed_batch_scenario(self):
+        tenant = gen_tenant_id()
+        e1, e2, e3 = [gen_entity(k + 1, 'Number', 123) for k in range(3)]
+        bad_entity = gen_entity(4, 'Text', 'shud of been a nbr!')
+
+        self.insert_entities(tenant, [e1])
+        self.insert_entities(tenant, [e2, e3, bad_entity])
+
+        rs = self.fetch_rows(tenant)
+
+        assert len(rs) == 4
+        assert_inserted_entity(rs[0], e1)
+        assert_inserted_entity(rs[1], e2)
+        assert_inserted_entity(rs[2], e3)
+        assert_failed_entity(rs[3], bad_entity)
+
     def run_inconsistent_attr_type_in_batch_scenario(self):
         tenant = gen_tenant_id()
         good_entity = gen_entity(1, 'Text', 'wada wada')
@@ -196,6 +213,36 @@ class OriginalDataScenarios:
             raise
         del os.environ[KEEP_RAW_ENTITY_VAR]
 
+    def run_success_scenario_with_keep_raw_compressed(self):
+        os.environ[KEEP_RAW_ENTITY_VAR] = 'true'
+        os.environ[KEEP_RAW_ENTITY_ENCODING_VAR] = 'zlib'
+        try:
+            self._do_success_scenario_with_keep_raw_on()
+        finally:
+            del os.environ[KEEP_RAW_ENTITY_VAR]
+            del os.environ[KEEP_RAW_ENTITY_ENCODING_VAR]
+
+    def run_failed_batch_scenario_with_keep_raw_compressed(self):
+        os.environ[KEEP_RAW_ENTITY_ENCODING_VAR] = 'zlib'
+        try:
+            tenant = gen_tenant_id()
+            good_entity = gen_entity(1, 'Number', 123)
+            bad_entity = gen_entity(2, 'Text', 'shud of been a nbr!')
+
+            self.insert_entities(tenant, [good_entity])
+            self.insert_entities(tenant, [bad_entity])
+
+            rs = self.fetch_rows(tenant)
+        finally:
+            del os.environ[KEEP_RAW_ENTITY_ENCODING_VAR]
+
+        assert len(rs) == 2
+        assert_failed_entity(rs[1], bad_entity)
+        saved_entity = rs[1][ORIGINAL_ENTITY_COL]
+        if isinstance(saved_entity, str):
+            saved_entity = json.loads(saved_entity)
+        assert saved_entity.get('encoding') is None
+
     def query_failed_inserts(self, tenant: str,
                              fetch_batch_id_clause: str) -> List[dict]:
         table = full_table_name(tenant)
@@ -4,6 +4,9 @@
 
 from exceptions.exceptions import AmbiguousNGSIIdError
 from translators.base_translator import BaseTranslator
+from translators.insert_fanout import INSERT_MAX_FANOUT_VAR
+from translators.insert_plan import insert_plan_cache
+from translators.metadata_cache import CACHE_METADATA_VAR, metadata_cache
 from translators.sql_translator import NGSI_TEXT, NGSI_DATETIME, NGSI_STRUCTURED_VALUE
 from utils.common import *
 from utils.tests.common import *
@@ -264,6 +267,33 @@ def test_insert_entity(translator, entity):
     translator.clean()
 
 
+@pytest.mark.parametrize("translator", translators, ids=["crate", "timescale"])
+def test_insert_reuses_plan(translator, entity):
+    entity[BaseTranslator.TIME_INDEX_NAME] = datetime.now(
+        timezone.utc).isoformat(timespec='milliseconds')
+    table_name = translator._et2tn(entity['type'])
+    plan_key = (translator.dbCacheName, table_name,
+                translator._attrs_signature([entity]))
+
+    translator.insert([entity])
+    plan = insert_plan_cache().get(plan_key)
+    assert plan is not None
+
+    entity['temperature']['value'] = 25.1
+    entity[BaseTranslator.TIME_INDEX_NAME] = datetime.now(
+        timezone.utc).isoformat(timespec='milliseconds')
+    translator.insert([entity])
+    assert insert_plan_cache().get(plan_key) is plan
+
+    loaded_entities, err = translator.query()
+    assert len(loaded_entities) == 1
+    assert loaded_entities[0]['temperature']['values'] == [24.2, 25.1]
+
+    translator.drop_table(entity['type'])
+    assert insert_plan_cache().get(plan_key) is None
+    translator.clean()
+
+
 @pytest.mark.parametrize("translator", translators, ids=["crate", "timescale"])
 def test_insert_same_entity_with_different_attrs(
         translator, sameEntityWithDifferentAttrs):
@@ -305,6 +335,47 @@ def test_insert_multiple_types(translator):
     translator.clean()
 
 
+@pytest.mark.parametrize("translator", translators, ids=["crate", "timescale"])
+def test_insert_multiple_types_concurrently(translator, monkeypatch):
+    monkeypatch.setenv(INSERT_MAX_FANOUT_VAR.name, '4')
+    entities = create_random_entities(num_types=6, num_ids_per_type=2,
+                                      num_updates=2, use_time=True)
+    result = translator.insert(entities)
+    assert result.rowcount > 0
+
+    loaded_entities, err = translator.query()
+    assert len(loaded_entities) == 12
+    translator.clean()
+
+
+@pytest.mark.parametrize("translator", translators, ids=["crate", "timescale"])
+def test_insert_with_metadata_cache(translator, entity, monkeypatch):
+    monkeypatch.setenv(CACHE_METADATA_VAR.name, 'true')
+    metadata_cache().clear()
+    table_name = translator._et2tn(entity['type'])
+    entity[BaseTranslator.TIME_INDEX_NAME] = datetime.now(
+        timezone.utc).isoformat(timespec='milliseconds')
+
+    translator.insert([entity])
+    cached = metadata_cache().get(translator.dbCacheName, table_name)
+    assert 'temperature' in cached
+
+    entity['humidity'] = {'type': 'Number', 'value': 10}
+    entity[BaseTranslator.TIME_INDEX_NAME] = datetime.now(
+        timezone.utc).isoformat(timespec='milliseconds')
+    translator.insert([entity])
+    cached = metadata_cache().get(translator.dbCacheName, table_name)
+    assert 'humidity' in cached
+
+    loaded_entities, err = translator.query()
+    assert len(loaded_entities) == 1
+    assert loaded_entities[0]['humidity']['values'] == [None, 10]
+
+    translator.drop_table(entity['type'])
+    assert metadata_cache().get(translator.dbCacheName, table_name) is None
+    translator.clean()
+
+
 @pytest.mark.parametrize("translator", translators, ids=["crate", "timescale"])
 def test_query_all_before_insert(translator):
     # Query all
@@ -1,10 +1,10 @@
 from itertools import takewhile
 import os
 import pytest
-import sys
 
 from translators.base_translator import TIME_INDEX_NAME
-from translators.insert_splitter import INSERT_MAX_SIZE_VAR
+from translators.insert_splitter import INSERT_MAX_ROWS_VAR, \
+    INSERT_MAX_SIZE_VAR, estimate_value_size
 from translators.tests.original_data_scenarios import full_table_name, \
     gen_entity, OriginalDataScenarios
 from translators.tests.test_original_data import translators, \
@@ -23,6 +23,14 @@ def clear_insert_max_size():
     os.environ[INSERT_MAX_SIZE_VAR] = ''
 
 
+def set_insert_max_rows(number_of_rows: int):
+    os.environ[INSERT_MAX_ROWS_VAR] = f"{number_of_rows}"
+
+
+def clear_insert_max_rows():
+    os.environ[INSERT_MAX_ROWS_VAR] = ''
+
+
 class DataGen:
 
     def __init__(self, insert_max_size: int, min_batches: int):
@@ -34,7 +42,7 @@ class DataGen:
     def _compute_insert_vector_size_lower_bound(entity: dict) -> int:
         vs = entity['id'], entity['type'], entity[TIME_INDEX_NAME], \
             entity['a_number']['value'], entity['an_attr']['value']
-        sz = [sys.getsizeof(v) for v in vs]
+        sz = [estimate_value_size(v) for v in vs]
         return sum(sz)
     # NOTE. lower bound since it doesn't include e.g. fiware service.
 
@@ -111,6 +119,18 @@ def test_insert_entities_in_batches(translator, min_batches):
     driver.run(with_batches=True)
 
 
+@pytest.mark.parametrize('translator', translators,
+                         ids=['timescale', 'crate'])
+def test_insert_entities_in_row_batches(translator):
+    test_data = DataGen(insert_max_size=1024, min_batches=3)
+    driver = DriverTest(translator, test_data)
+    set_insert_max_rows(2)
+    try:
+        driver.run(with_batches=False)
+    finally:
+        clear_insert_max_rows()
+
+
 # NOTE. Couldn't reproduce #445.
 # You can try this, but the exception I get is weirdly enough a connection
 # exception. Python will crunch data in memory for about 30 mins, then the
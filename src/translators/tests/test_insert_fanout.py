@@ -0,0 +1,66 @@
+from threading import current_thread, Event
+from time import sleep
+
+import pytest
+
+from translators.insert_fanout import INSERT_MAX_FANOUT_VAR, \
+    insert_executor, run_all
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setenv(INSERT_MAX_FANOUT_VAR.name, '4')
+    return insert_executor()
+
+
+def test_no_executor_by_default(monkeypatch):
+    monkeypatch.delenv(INSERT_MAX_FANOUT_VAR.name, raising=False)
+    assert insert_executor() is None
+
+
+def test_results_in_task_order(executor):
+    def task(n):
+        def run():
+            sleep(0.01 * (3 - n))
+            return n
+        return run
+
+    assert run_all(executor, [task(n) for n in range(4)]) == [0, 1, 2, 3]
+
+
+def test_last_task_runs_in_calling_thread(executor):
+    threads = run_all(executor, [current_thread, current_thread])
+    assert threads[0] is not current_thread()
+    assert threads[1] is current_thread()
+
+
+def test_tasks_run_concurrently(executor):
+    started = Event()
+
+    def waiter():
+        return started.wait(timeout=5)
+
+    assert run_all(executor, [waiter, started.set]) == [True, None]
+
+
+def test_raise_first_error_after_all_tasks_done(executor):
+    done = []
+
+    def fail(msg):
+        def run():
+            raise ValueError(msg)
+        return run
+
+    def slow():
+        sleep(0.05)
+        done.append(True)
+
+    with pytest.raises(ValueError) as e:
+        run_all(executor, [slow, fail('first'), fail('second')])
+
+    assert str(e.value) == 'first'
+    assert done == [True]
+
+
+def test_no_tasks(executor):
+    assert run_all(executor, []) == []
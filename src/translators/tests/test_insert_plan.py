@@ -0,0 +1,62 @@
+from translators.insert_plan import InsertPlan, InsertPlanCache
+
+
+def plan(table_name: str) -> InsertPlan:
+    return InsertPlan(table_name=table_name, table={}, original_attrs={},
+                      col_names=['a', 'b'],
+                      converters=[lambda e, sp: e['a'], lambda e, sp: sp],
+                      stmt=f"insert into {table_name} (a, b) values (?,?)")
+
+
+def test_plan_to_row():
+    p = plan('t')
+    assert p.to_row({'a': 1}, '/x') == [1, '/x']
+
+
+def test_get_missing_plan():
+    cache = InsertPlanCache(max_size=2)
+    assert cache.get(('sql', 't', 'sig')) is None
+
+
+def test_put_and_get_plan():
+    cache = InsertPlanCache(max_size=2)
+    p = plan('t')
+    cache.put(('sql', 't', 'sig'), p)
+
+    assert cache.get(('sql', 't', 'sig')) is p
+    assert cache.get(('sql', 't', 'other sig')) is None
+    assert cache.get(('crate', 't', 'sig')) is None
+
+
+def test_evict_least_recently_used():
+    cache = InsertPlanCache(max_size=2)
+    cache.put(('sql', 't1', 'sig'), plan('t1'))
+    cache.put(('sql', 't2', 'sig'), plan('t2'))
+    cache.get(('sql', 't1', 'sig'))
+    cache.put(('sql', 't3', 'sig'), plan('t3'))
+
+    assert len(cache) == 2
+    assert cache.get(('sql', 't1', 'sig')) is not None
+    assert cache.get(('sql', 't2', 'sig')) is None
+    assert cache.get(('sql', 't3', 'sig')) is not None
+
+
+def test_evict_table_plans():
+    cache = InsertPlanCache(max_size=10)
+    cache.put(('sql', 't1', 'sig1'), plan('t1'))
+    cache.put(('sql', 't1', 'sig2'), plan('t1'))
+    cache.put(('crate', 't1', 'sig1'), plan('t1'))
+    cache.put(('sql', 't2', 'sig1'), plan('t2'))
+    cache.evict('sql', 't1')
+
+    assert len(cache) == 2
+    assert cache.get(('crate', 't1', 'sig1')) is not None
+    assert cache.get(('sql', 't2', 'sig1')) is not None
+
+
+def test_zero_size_disables_cache():
+    cache = InsertPlanCache(max_size=0)
+    cache.put(('sql', 't', 'sig'), plan('t'))
+
+    assert len(cache) == 0
+    assert cache.get(('sql', 't', 'sig')) is None
@@ -0,0 +1,59 @@
+import pytest
+
+from translators.insert_splitter import INSERT_MAX_ROWS_VAR, \
+    INSERT_MAX_SIZE_VAR, compute_row_size, estimate_value_size, \
+    to_insert_batches
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, 4), (True, 5), (1, 8), (1.5, 8), ('', 2), ('abc', 5),
+    ([], 2), ([1, 'a'], 15), ({}, 2), ({'k': 'v'}, 10),
+    ({'k': [None]}, 14)
+])
+def test_estimate_value_size(value, expected):
+    assert estimate_value_size(value) == expected
+
+
+def test_compute_row_size():
+    assert compute_row_size(('abc', 1, None)) == 17
+
+
+@pytest.fixture
+def rows():
+    return [('x' * 8, k) for k in range(5)]   # 18 bytes each
+
+
+def test_no_split_by_default(monkeypatch, rows):
+    monkeypatch.delenv(INSERT_MAX_SIZE_VAR, raising=False)
+    monkeypatch.delenv(INSERT_MAX_ROWS_VAR, raising=False)
+
+    assert to_insert_batches(rows) == [rows]
+
+
+def test_split_by_size(monkeypatch, rows):
+    monkeypatch.setenv(INSERT_MAX_SIZE_VAR, '40B')
+    monkeypatch.delenv(INSERT_MAX_ROWS_VAR, raising=False)
+
+    assert to_insert_batches(rows) == [rows[0:2], rows[2:4], rows[4:]]
+
+
+def test_split_by_rows(monkeypatch, rows):
+    monkeypatch.delenv(INSERT_MAX_SIZE_VAR, raising=False)
+    monkeypatch.setenv(INSERT_MAX_ROWS_VAR, '3')
+
+    assert to_insert_batches(rows) == [rows[0:3], rows[3:]]
+
+
+def test_split_by_size_and_rows(monkeypatch, rows):
+    monkeypatch.setenv(INSERT_MAX_SIZE_VAR, '60B')
+    monkeypatch.setenv(INSERT_MAX_ROWS_VAR, '2')
+
+    assert to_insert_batches(rows) == [rows[0:2], rows[2:4], rows[4:]]
+
+
+@pytest.mark.parametrize('max_rows', ['0', '-1', 'garbage'])
+def test_ignore_invalid_max_rows(monkeypatch, rows, max_rows):
+    monkeypatch.delenv(INSERT_MAX_SIZE_VAR, raising=False)
+    monkeypatch.setenv(INSERT_MAX_ROWS_VAR, max_rows)
+
+    assert to_insert_batches(rows) == [rows]
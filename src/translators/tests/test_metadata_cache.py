@@ -0,0 +1,101 @@
+import json
+from time import sleep
+
+from translators.insert_plan import InsertPlan, insert_plan_cache
+from translators.metadata_cache import INVALIDATION_CHANNEL, \
+    InvalidationListener, MetadataCache
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+
+
+def md(*cols) -> dict:
+    return {c: [c, 'Text'] for c in cols}
+
+
+def test_get_returns_copy():
+    target = MetadataCache(ttl=60)
+    target.put('crate', 't1', md('a'))
+
+    got = target.get('crate', 't1')
+    got['b'] = ['b', 'Text']
+
+    assert target.get('crate', 't1') == md('a')
+
+
+def test_entries_expire():
+    target = MetadataCache(ttl=0.05)
+    target.put('crate', 't1', md('a'))
+    sleep(0.1)
+
+    assert target.get('crate', 't1') is None
+
+
+def test_entries_keyed_by_backend():
+    target = MetadataCache(ttl=60)
+    target.put('crate', 't1', md('a'))
+
+    assert target.get('timescale', 't1') is None
+
+
+def test_load():
+    target = MetadataCache(ttl=60)
+    assert not target.is_loaded('crate')
+
+    target.load('crate', {'t1': md('a'), 't2': md('b')})
+
+    assert target.is_loaded('crate')
+    assert not target.is_loaded('timescale')
+    assert target.get('crate', 't2') == md('b')
+
+
+def test_changed_publishes():
+    redis = FakeRedis()
+    target = MetadataCache(ttl=60, redis=redis)
+
+    target.changed('crate', 't1', md('a'))
+    assert target.get('crate', 't1') == md('a')
+
+    target.changed('crate', 't1', None)
+    assert target.get('crate', 't1') is None
+
+    assert redis.published == [
+        (INVALIDATION_CHANNEL, {'origin': target.origin(),
+                                'cache_name': 'crate', 'table_name': 't1'})
+    ] * 2
+
+
+def test_listener_invalidates_other_origins():
+    target = MetadataCache(ttl=60)
+    target.put('crate', 't1', md('a'))
+    target.put('crate', 't2', md('b'))
+    plan_key = ('crate', 't1', frozenset())
+    insert_plan_cache().put(plan_key, InsertPlan('t1', {}, {}, [], [], ''))
+    listener = InvalidationListener(target, redis=None)
+
+    own = {'origin': target.origin(), 'cache_name': 'crate',
+           'table_name': 't2'}
+    listener.handle({'data': json.dumps(own).encode()})
+    assert target.get('crate', 't2') == md('b')
+
+    other = {'origin': 'other', 'cache_name': 'crate', 'table_name': 't1'}
+    listener.handle({'data': json.dumps(other).encode()})
+    assert target.get('crate', 't1') is None
+    assert insert_plan_cache().get(plan_key) is None
+
+
+def test_listener_ignores_malformed_messages():
+    target = MetadataCache(ttl=60)
+    target.put('crate', 't1', md('a'))
+    listener = InvalidationListener(target, redis=None)
+
+    listener.handle({'data': b'not json'})
+    listener.handle({})
+
+    assert target.get('crate', 't1') == md('a')
@@ -58,6 +58,12 @@ def test_changed_attr_type_scenario(translator):
     translator.run_changed_attr_type_scenario()
 
 
+def test_partially_failed_batch_scenario(with_crate):
+    with_crate.run_partially_failed_batch_scenario()
+# NOTE. Only Crate tells which rows in a bulk insert failed. If Postgres
+# rejects a row, the whole batch fails.
+
+
 @pytest.mark.parametrize("translator", translators, ids=["timescale", "crate"])
 def test_inconsistent_attr_type_in_batch_scenario(translator):
     translator.run_inconsistent_attr_type_in_batch_scenario()
@@ -78,6 +84,16 @@ def test_success_scenario_with_keep_raw_on(translator):
     translator.run_success_scenario_with_keep_raw_on()
 
 
+@pytest.mark.parametrize("translator", translators, ids=["timescale", "crate"])
+def test_success_scenario_with_keep_raw_compressed(translator):
+    translator.run_success_scenario_with_keep_raw_compressed()
+
+
+@pytest.mark.parametrize("translator", translators, ids=["timescale", "crate"])
+def test_failed_batch_scenario_with_keep_raw_compressed(translator):
+    translator.run_failed_batch_scenario_with_keep_raw_compressed()
+
+
 @pytest.mark.parametrize("translator", translators, ids=["timescale", "crate"])
 def test_query_failed_entities_scenario(translator):
     clause = f"({ORIGINAL_ENTITY_COL} ->> 'failedBatchID')"
@@ -33,13 +33,17 @@ def get_db_user(c: PostgresConnectionData): return c.db_user
 def get_db_pass(c: PostgresConnectionData): return c.db_pass
 
 
+def get_use_copy(c: PostgresConnectionData): return c.use_copy
+
+
 @pytest.mark.parametrize('getter, env_var_name', [
     (get_host, 'POSTGRES_HOST'),
     (get_port, 'POSTGRES_PORT'),
     (get_ssl, 'POSTGRES_USE_SSL'),
     (get_db_name, 'POSTGRES_DB_NAME'),
     (get_db_user, 'POSTGRES_DB_USER'),
-    (get_db_pass, 'POSTGRES_DB_PASS')
+    (get_db_pass, 'POSTGRES_DB_PASS'),
+    (get_use_copy, 'POSTGRES_USE_COPY')
 ])
 def test_param_default(getter, env_var_name):
     assert_conn_param(getter, env_var_name, '')
@@ -52,7 +56,9 @@ def test_param_default(getter, env_var_name):
     (get_ssl, 'POSTGRES_USE_SSL', ' yes ', True),
     (get_db_name, 'POSTGRES_DB_NAME', 'quantumleap\n', 'quantumleap'),
     (get_db_user, 'POSTGRES_DB_USER', '\tquantumleap', 'quantumleap'),
-    (get_db_pass, 'POSTGRES_DB_PASS', ' p4ss ', 'p4ss')
+    (get_db_pass, 'POSTGRES_DB_PASS', ' p4ss ', 'p4ss'),
+    (get_use_copy, 'POSTGRES_USE_COPY', ' no ', False),
+    (get_use_copy, 'POSTGRES_USE_COPY', ' yes ', True)
 ])
 def test_param(getter, env_var_name, env_value, expected_param):
     assert_conn_param(getter, env_var_name, env_value, expected_param)
@@ -0,0 +1,106 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import crate_translator, timescale_translator
+from translators.base_translator import BaseTranslator
+from translators.provision import attrs_from_json_schema, read_template
+
+translators = [
+    pytest.lazy_fixture('crate_translator'),
+    pytest.lazy_fixture('timescale_translator')
+]
+
+
+SCHEMA = {
+    'allOf': [
+        {'properties': {
+            'id': {'type': 'string'},
+            'location': {'$ref': 'https://example.org/geometry-schema.json'}
+        }},
+        {'properties': {
+            'temperature': {'type': 'number'},
+            'count': {'type': 'integer'},
+            'dateObserved': {'type': 'string', 'format': 'date-time'},
+            'status': {'type': 'string', 'enum': ['ok', 'ko']},
+            'refDevice': {'anyOf': [{'type': 'string'}]}
+        }}
+    ],
+    'properties': {
+        'type': {'type': 'string'},
+        'tags': {'type': 'array'},
+        'address': {'type': 'object'}
+    }
+}
+
+
+def test_attrs_from_json_schema():
+    assert attrs_from_json_schema(SCHEMA) == {
+        'location': 'geo:json',
+        'temperature': 'Number',
+        'count': 'Integer',
+        'dateObserved': 'DateTime',
+        'status': 'Text',
+        'tags': 'Array',
+        'address': 'StructuredValue'
+    }
+
+
+def test_read_template(tmp_path):
+    (tmp_path / 'schema.json').write_text(json.dumps(SCHEMA))
+    template = tmp_path / 'template.yml'
+    template.write_text('''
+entity_types:
+  - type: Room
+    attributes:
+      temperature: Number
+  - type: WeatherObserved
+    tenant: smartcity
+    schema: schema.json
+    attributes:
+      status: Integer
+''')
+
+    room, weather = read_template(str(template))
+
+    assert (room.etype, room.attrs, room.fiware_service) == \
+        ('Room', {'temperature': 'Number'}, None)
+    assert weather.fiware_service == 'smartcity'
+    assert weather.attrs['status'] == 'Integer'
+    assert weather.attrs['dateObserved'] == 'DateTime'
+
+
+def test_read_template_without_attributes(tmp_path):
+    template = tmp_path / 'template.yml'
+    template.write_text('entity_types: [{type: Room}]')
+
+    with pytest.raises(ValueError):
+        read_template(str(template))
+
+
+@pytest.mark.parametrize("translator", translators, ids=["crate", "timescale"])
+def test_provision_entity_type(translator):
+    attrs = {'temperature': 'Number', 'pressure': 'Number'}
+    added = translator.provision_entity_type('Room', attrs)
+    assert {'temperature', 'pressure'} <= added
+
+    added = translator.provision_entity_type(
+        'Room', {**attrs, 'humidity': 'Number'})
+    assert added == {'humidity'}
+
+    entity = {
+        'id': 'Room1', 'type': 'Room',
+        'temperature': {'type': 'Number', 'value': 21.5},
+        'humidity': {'type': 'Number', 'value': 40},
+        BaseTranslator.TIME_INDEX_NAME:
+            datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+    }
+    table_name = translator._et2tn('Room')
+    plan = translator._compile_insert_plan(table_name, [entity])
+    assert not translator._metadata_diff(table_name, plan.original_attrs)
+
+    translator.insert([entity])
+    loaded_entities, err = translator.query()
+    assert loaded_entities[0]['temperature']['values'] == [21.5]
+    translator.clean()
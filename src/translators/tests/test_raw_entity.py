@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from translators.config import KEEP_RAW_ENTITY_ENCODING_VAR, \
+    SQLTranslatorConfig
+from translators.raw_entity import RAW_JSON, RAW_ZLIB, ZLIB_NGSI_V1, \
+    decode_original_data, encode_raw_entity
+
+ENTITY = {
+    'id': 'urn:ngsi-ld:WeatherObserved:Valladolid',
+    'type': 'WeatherObserved',
+    'temperature': {'type': 'Number', 'value': 3.3, 'metadata': {}},
+    'dateObserved': {'type': 'DateTime', 'value': '2016-11-30T07:00:00Z',
+                     'metadata': {}},
+    'location': {'type': 'geo:json', 'metadata': {},
+                 'value': {'type': 'Point', 'coordinates': [-4.75, 41.64]}},
+    'address': {'type': 'Text', 'value': 'Calle Nueva, Ñuñoa',
+                'metadata': {}},
+    'time_index': '2016-11-30T07:00:00.000+00:00'
+}
+
+
+def test_json_encoding():
+    value = encode_raw_entity(ENTITY, RAW_JSON)
+
+    assert value == {'data': ENTITY}
+    assert decode_original_data(value) == ENTITY
+
+
+def test_zlib_encoding():
+    value = encode_raw_entity(ENTITY, RAW_ZLIB)
+
+    assert value['encoding'] == ZLIB_NGSI_V1
+    assert isinstance(value['data'], str)
+    assert len(value['data']) < len(json.dumps(ENTITY)) / 2
+    assert decode_original_data(value) == ENTITY
+
+
+@pytest.mark.parametrize('value', [
+    {'data': json.dumps(ENTITY)},
+    json.dumps({'data': ENTITY, 'failedBatchID': 'x'}),
+    json.dumps(encode_raw_entity(ENTITY, RAW_ZLIB))
+])
+def test_decode_stored_values(value):
+    assert decode_original_data(value) == ENTITY
+
+
+def test_decode_empty_column():
+    assert decode_original_data(None) is None
+
+
+def test_decode_unknown_encoding():
+    with pytest.raises(ValueError):
+        decode_original_data({'data': 'x', 'encoding': 'lz4'})
+
+
+@pytest.mark.parametrize('env, expected', [
+    ({}, RAW_JSON),
+    ({KEEP_RAW_ENTITY_ENCODING_VAR: 'ZLIB'}, RAW_ZLIB),
+    ({KEEP_RAW_ENTITY_ENCODING_VAR: 'zstd'}, RAW_JSON)
+])
+def test_encoding_config(env, expected):
+    assert SQLTranslatorConfig(env).keep_raw_entity_encoding() == expected
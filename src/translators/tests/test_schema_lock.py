@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from threading import Lock
+from time import sleep
+
+import pytest
+
+from conftest import crate_translator, timescale_translator
+from translators.base_translator import BaseTranslator
+from translators.schema_lock import advisory_lock_id, local_schema_lock, \
+    pg_advisory_lock, schema_lock
+
+translators = [
+    pytest.lazy_fixture('crate_translator'),
+    pytest.lazy_fixture('timescale_translator')
+]
+
+
+class FakeRedisLock:
+
+    def __init__(self, store, name, timeout, blocking_timeout):
+        self._store = store
+        self._name = name
+
+    def acquire(self):
+        if self._name in self._store:
+            return False
+        self._store.add(self._name)
+        return True
+
+    def release(self):
+        self._store.remove(self._name)
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.held = set()
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return FakeRedisLock(self.held, name, timeout, blocking_timeout)
+
+
+class FakeCursor:
+
+    def __init__(self, busy_polls=0):
+        self.busy_polls = busy_polls
+        self.stmts = []
+        self._result = None
+
+    def execute(self, stmt, params=None):
+        self.stmts.append((stmt, params))
+        if 'unlock' in stmt:
+            self._result = [[True]]
+        else:
+            self._result = [[self.busy_polls == 0]]
+            self.busy_polls = max(0, self.busy_polls - 1)
+
+    def fetchall(self):
+        return self._result
+
+
+def test_local_lock_serializes_threads():
+    running, overlaps = [], []
+    guard = Lock()
+
+    def critical_section(_):
+        with local_schema_lock('crate:t1', timeout=5):
+            with guard:
+                running.append(1)
+                overlaps.append(len(running))
+            sleep(0.01)
+            with guard:
+                running.pop()
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(critical_section, range(8)))
+
+    assert max(overlaps) == 1
+
+
+def test_local_lock_times_out():
+    with local_schema_lock('crate:t2', timeout=5):
+        with ThreadPoolExecutor(1) as pool:
+            def try_lock():
+                with local_schema_lock('crate:t2', timeout=0.01):
+                    return True
+            assert pool.submit(try_lock).result()
+
+
+def test_schema_lock_uses_redis():
+    redis = FakeRedis()
+    with schema_lock('crate:t3', redis):
+        assert redis.held == {'ql:schema-lock:crate:t3'}
+    assert redis.held == set()
+
+
+def test_advisory_lock_id():
+    lock_id = advisory_lock_id('timescale:t1')
+    assert lock_id == advisory_lock_id('timescale:t1')
+    assert lock_id != advisory_lock_id('timescale:t2')
+    assert -2**63 <= lock_id < 2**63
+
+
+def test_advisory_lock_polls_until_acquired():
+    cursor = FakeCursor(busy_polls=2)
+    with pg_advisory_lock(cursor, 'timescale:t1', timeout=5,
+                          poll_interval=0.001):
+        assert len(cursor.stmts) == 3
+    assert 'pg_advisory_unlock' in cursor.stmts[-1][0]
+    assert cursor.stmts[-1][1] == [advisory_lock_id('timescale:t1')]
+
+
+def test_advisory_lock_gives_up_after_timeout():
+    cursor = FakeCursor(busy_polls=1000)
+    with pg_advisory_lock(cursor, 'timescale:t1', timeout=0.01,
+                          poll_interval=0.001):
+        pass
+    assert all('unlock' not in stmt for stmt, _ in cursor.stmts)
+
+
+@pytest.mark.parametrize("translator", translators, ids=["crate", "timescale"])
+def test_concurrent_schema_changes(translator):
+    def insert(n):
+        entity = {
+            'id': f"Room{n}", 'type': 'Room',
+            'temperature': {'type': 'Number', 'value': n},
+            'humidity': {'type': 'Number', 'value': n},
+            BaseTranslator.TIME_INDEX_NAME:
+                datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        }
+        with translator._clone() as trans:
+            trans.insert([entity])
+
+    translator.insert([{
+        'id': 'Room0', 'type': 'Room',
+        'temperature': {'type': 'Number', 'value': 0},
+        BaseTranslator.TIME_INDEX_NAME:
+            datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+    }])
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(insert, range(1, 9)))
+
+    loaded_entities, err = translator.query()
+    assert len(loaded_entities) == 9
+    translator.clean()
@@ -7,7 +7,8 @@ from time import sleep
 from geocoding.geojson.wktcodec import decode_wkb_hexstr
 from translators.base_translator import TIME_INDEX_NAME
 from translators.timescale import postgres_translator_instance, \
-    PostgresConnectionData
+    PostgresConnectionData, POSTGRES_USE_COPY_ENV_VAR, CopyTextStream, \
+    to_copy_text_line
 from translators.sql_translator import METADATA_TABLE_NAME, \
     TYPE_PREFIX, TENANT_PREFIX, FIWARE_SERVICEPATH
 
@@ -210,6 +211,43 @@ def test_bare_entity(with_pg8000):
     assert_inserted_entity_values(entity, rows[0])
 
 
+def test_bare_entity_with_copy(with_pg8000, monkeypatch):
+    monkeypatch.setenv(POSTGRES_USE_COPY_ENV_VAR, 'true')
+    entity_type = 'test-device'
+    entities = [gen_entity(entity_type) for _ in range(3)]
+    insert(entities)
+
+    _, pg_cursor = with_pg8000
+    full_table_name = f'"{TYPE_PREFIX}{entity_type}"'
+    assert_entity_attrs_meta(pg_cursor, full_table_name)
+
+    for entity in entities:
+        rows = select_entities(pg_cursor, full_table_name, entity['id'])
+        assert pg_cursor.rowcount == 1
+        assert_inserted_entity_values(entity, rows[0])
+
+
+@pytest.mark.parametrize('row, expected', [
+    ([], '\n'),
+    ([None, True, False], '\\N\tt\tf\n'),
+    ([1, 2.5, 'x'], '1\t2.5\tx\n'),
+    (['a\tb\nc\rd\\e'], 'a\\tb\\nc\\rd\\\\e\n'),
+    ([{'k': 'v\\w'}, [1, 'y']], '{"k": "v\\\\\\\\w"}\t[1, "y"]\n')
+])
+def test_to_copy_text_line(row, expected):
+    assert to_copy_text_line(row) == expected
+
+
+def test_copy_text_stream_chunks():
+    rows = [['x' * 5, i] for i in range(10)]
+    expected = ''.join(to_copy_text_line(r) for r in rows)
+
+    stream = CopyTextStream(rows)
+    chunks = iter(lambda: stream.read(4), '')
+    assert ''.join(chunks) == expected
+    assert stream.read() == ''
+
+
 def test_tenants_entity(with_pg8000):
     entity_type = 'test-device'
     entity = gen_entity('test-device')
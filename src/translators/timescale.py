@@ -1,11 +1,15 @@
 from contextlib import contextmanager
 from datetime import datetime, timezone
+from io import TextIOBase
 import pg8000
 import json
-from typing import Any, Callable, Sequence
+from typing import Any, Callable, Iterable, List, Optional, Sequence
 import os
 from translators import sql_translator
 from translators.errors import PostgresErrorAnalyzer
+from translators.insert_plan import InsertPlan
+from translators.schema_lock import local_schema_lock, pg_advisory_lock, \
+    schema_lock_timeout
 from translators.sql_translator import NGSI_ISO8601, NGSI_DATETIME, \
     NGSI_LD_GEOMETRY, NGSI_GEOJSON, NGSI_TEXT, NGSI_STRUCTURED_VALUE, \
     TIME_INDEX, METADATA_TABLE_NAME, TENANT_PREFIX
@@ -47,19 +51,21 @@ POSTGRES_USE_SSL_ENV_VAR = 'POSTGRES_USE_SSL'
 POSTGRES_DB_NAME_ENV_VAR = 'POSTGRES_DB_NAME'
 POSTGRES_DB_USER_ENV_VAR = 'POSTGRES_DB_USER'
 POSTGRES_DB_PASS_ENV_VAR = 'POSTGRES_DB_PASS'
+POSTGRES_USE_COPY_ENV_VAR = 'POSTGRES_USE_COPY'
 
 
 class PostgresConnectionData:
 
     def __init__(self, host='0.0.0.0', port=5432, use_ssl=False,
                  db_name='quantumleap',
-                 db_user='quantumleap', db_pass='*'):
+                 db_user='quantumleap', db_pass='*', use_copy=False):
         self.host = host
         self.port = port
         self.use_ssl = use_ssl
         self.db_name = db_name
         self.db_user = db_user
         self.db_pass = db_pass
+        self.use_copy = use_copy
 
     def read_env(self, env: dict = os.environ):
         r = EnvReader(env, log=logging.getLogger(__name__).debug)
@@ -70,12 +76,74 @@ class PostgresConnectionData:
         self.db_user = r.read(StrVar(POSTGRES_DB_USER_ENV_VAR, self.db_user))
         self.db_pass = r.read(StrVar(POSTGRES_DB_PASS_ENV_VAR, self.db_pass,
                                      mask_value=True))
+        self.use_copy = r.read(BoolVar(POSTGRES_USE_COPY_ENV_VAR,
+                                       self.use_copy))
 
 
 def _encode_to_json_string(data: dict or list) -> str:
     return json.dumps(data)
 
 
+_COPY_TEXT_ESCAPES = str.maketrans({
+    '\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'
+})
+
+
+def _to_copy_text_value(value: Any) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        value = _encode_to_json_string(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    return str(value).translate(_COPY_TEXT_ESCAPES)
+
+
+def to_copy_text_line(row: Sequence[Any]) -> str:
+    """
+    Encode a row to insert in the Postgres COPY text format.
+
+    :param row: the row values, in the same order as the table columns
+        in the COPY statement.
+    :return: the encoded row, including the line terminator.
+    """
+    return '\t'.join(_to_copy_text_value(v) for v in row) + '\n'
+
+
+class CopyTextStream(TextIOBase):
+    """
+    Read-only text stream to feed rows to a ``COPY ... FROM STDIN``
+    statement. Rows get encoded lazily, as pg8000 reads from the stream,
+    so we never have the whole batch encoded in memory at once.
+    """
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._lines = (to_copy_text_line(r) for r in rows)
+        self._buffer = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        chunks, buffered = [self._buffer], len(self._buffer)
+        while size is None or size < 0 or buffered < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            buffered += len(line)
+
+        data = ''.join(chunks)
+        if size is None or size < 0:
+            size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+
+
 class PostgresTranslator(sql_translator.SQLTranslator):
     NGSI_TO_SQL = NGSI_TO_SQL
 
@@ -86,11 +154,16 @@ class PostgresTranslator(sql_translator.SQLTranslator):
         self.db_user = conn_data.db_user
         self.db_pass = conn_data.db_pass
         self.ssl = {} if conn_data.use_ssl else None
+        self.use_copy = conn_data.use_copy
         self.ccm = None
         self.connection = None
         self.cursor = None
+        self.conn_data = conn_data
         self.dbCacheName = 'timescale'
 
+    def _clone(self):
+        return type(self)(self.conn_data)
+
     def setup(self):
         self.ccm = ConnectionManager()
         self.connection = self.ccm.get_connection('timescale')
@@ -190,6 +263,16 @@ class PostgresTranslator(sql_translator.SQLTranslator):
 
         self.with_connection_guard(do_create)
 
+    @contextmanager
+    def _schema_lock(self, table_name):
+        key = f"{self.dbCacheName}:{table_name}"
+        timeout = schema_lock_timeout()
+        with local_schema_lock(key, timeout):
+            with pg_advisory_lock(self.cursor, key, timeout):
+                yield
+    # NOTE. Advisory locks. Postgres can coordinate schema changes across
+    # processes on its own, so we don't need Redis for that.
+
     def _update_data_table(self, table_name, new_columns, fiware_service):
         def do_update():
             alt_cols = ', '.join('add column if not exists "{}" {}'
@@ -262,6 +345,19 @@ class PostgresTranslator(sql_translator.SQLTranslator):
     def _to_db_ngsi_structured_value(data: dict) -> str:
         return _encode_to_json_string(data)
 
+    def _insert_batch(self, plan: InsertPlan, batch: List[List]) -> Any:
+        if not self.use_copy:
+            return super()._insert_batch(plan, batch)
+
+        cols = ', '.join('"{}"'.format(c.lower()) for c in plan.col_names)
+        stmt = f"copy {plan.table_name} ({cols}) from stdin"
+        self.cursor.execute(stmt, stream=CopyTextStream(batch))
+    # NOTE. COPY vs executemany. pg8000's executemany runs one insert per
+    # row, i.e. a round trip per row, whereas COPY streams the whole batch
+    # in one go. Also COPY is atomic, so if Postgres rejects a row, none of
+    # the batch rows get in and the translator falls back to storing the
+    # original entities as usual.
+
     def _should_insert_original_entities(self,
                                          insert_error: Exception) -> bool:
         return isinstance(insert_error, pg8000.ProgrammingError)
@@ -1,3 +1,6 @@
+from threading import local
+
+
 class Borg:
     _shared_state = {}
 
@@ -6,20 +9,33 @@ class Borg:
 
 
 class ConnectionManager(Borg):
+    """
+    Keep DB connections around so translators can reuse them across calls.
+    Each thread gets its own set of connections since none of the DB drivers
+    we use can safely share a connection among threads---e.g. the coalescer's
+    background flusher or a thread pool running inserts.
+    """
 
-    connection = {}
+    _local = local()
 
     def __init__(self):
         Borg.__init__(self)
 
+    def _connections(self) -> dict:
+        conns = getattr(self._local, 'connection', None)
+        if conns is None:
+            conns = {}
+            self._local.connection = conns
+        return conns
+
     def set_connection(self, db, connection):
-        self.connection[db] = connection
+        self._connections()[db] = connection
 
     def get_connection(self, db):
         try:
-            return self.connection[db]
+            return self._connections()[db]
         except KeyError as e:
             return None
 
     def reset_connection(self, db):
-        self.connection[db] = None
+        self._connections()[db] = None
@@ -2,10 +2,11 @@
 This module provides utilities to spilt iterables into batches.
 """
 
-from itertools import chain
-from typing import Any, Callable, Iterable
+from typing import Any, Callable, Iterable, Optional
 
 
+_NOTHING = object()
+
 CostFn = Callable[[Any], int]
 """
 A function to assign a "cost" to an item. Typically the cost is a non
@@ -30,11 +31,18 @@ class IterCostSplitter:
     some ``b[k]`` contains just one element ``x > M`` since that doesn't
     violate (1) and (2).
 
+    Optionally, you can also cap the number of elements in each batch, in
+    which case a batch gets cut as soon as it reaches either limit.
+
     Examples:
 
     >>> splitter = IterCostSplitter(cost_fn=lambda x: x, batch_max_cost=5)
     >>> splitter.list_batches([1, 7, 2, 3, 8, 5, 1, 2, 1])
     [[1], [7], [2, 3], [8], [5], [1, 2, 1]]
+    >>> splitter = IterCostSplitter(cost_fn=lambda x: x, batch_max_cost=5,
+    ...                             batch_max_len=2)
+    >>> splitter.list_batches([1, 7, 2, 3, 8, 5, 1, 2, 1])
+    [[1], [7], [2, 3], [8], [5], [1, 2], [1]]
     """
 
 # NOTE. Algebra of programming.
@@ -64,46 +72,59 @@ class IterCostSplitter:
 # Why is the Python implementation so damn complicated then?! The mind
 # boggles.
 
-    def __init__(self, cost_fn: CostFn, batch_max_cost: int):
+    def __init__(self, cost_fn: CostFn, batch_max_cost: int,
+                 batch_max_len: Optional[int] = None):
         """
         Create a new instance.
 
         :param cost_fn: the function to assign a cost to each stream element.
         :param batch_max_cost: the cost goal. It determines how the input
             stream gets split into batches.
+        :param batch_max_len: if given, the maximum number of elements in
+            a batch.
         """
         self._cost_of = cost_fn
         self._max_cost = batch_max_cost
+        self._max_len = batch_max_len
         self._iter = None
+        self._lookahead = _NOTHING
+        self._lookahead_cost = 0
         self._keep_iterating = True
 
-    def _put_back(self, item: Any):
-        self._iter = chain([item], self._iter)
+    def _peek(self) -> Any:
+        if self._lookahead is _NOTHING:
+            x = next(self._iter, _NOTHING)
+            if x is not _NOTHING:
+                self._lookahead = x
+                self._lookahead_cost = self._cost_of(x)
+        return self._lookahead
 
     def _is_empty(self) -> bool:
-        try:
-            x = next(self._iter)
-            self._put_back(x)
-            return False
-        except StopIteration:
+        return self._peek() is _NOTHING
+
+    def _is_full(self, batch_size: int, cost_so_far: int) -> bool:
+        if self._max_len is not None and batch_size >= self._max_len:
             return True
+        return cost_so_far + self._lookahead_cost > self._max_cost
 
     def _next_batch(self) -> Iterable[Any]:
         cost_so_far = 0
         batch_size = 0
 
-        for x in self._iter:
-            next_cost = self._cost_of(x)
-
-            if batch_size == 0 or cost_so_far + next_cost <= self._max_cost:
-                batch_size += 1
-                cost_so_far += next_cost
-                yield x
-            else:
-                self._put_back(x)
+        while self._peek() is not _NOTHING:
+            if batch_size > 0 and self._is_full(batch_size, cost_so_far):
                 return
 
+            x, self._lookahead = self._lookahead, _NOTHING
+            batch_size += 1
+            cost_so_far += self._lookahead_cost
+            yield x
+
         self._keep_iterating = False
+    # NOTE. Flat cost. We keep the element that didn't fit in the current
+    # batch, together with its cost, in a one-element lookahead buffer for
+    # the next batch to pick up. So each element gets pulled from the input
+    # iterator and costed exactly once, no matter how many batches we cut.
 
     def iter_batches(self, xs: Iterable[Any]) -> Iterable[Iterable[Any]]:
         """
@@ -116,8 +137,9 @@ class IterCostSplitter:
             documented in this class' description.
         """
         self._iter = iter(xs)
+        self._lookahead = _NOTHING
         if self._is_empty():
-            return self._iter
+            return
 
         self._keep_iterating = True
         while self._keep_iterating:
@@ -0,0 +1,307 @@
+"""
+A durable, append-only spool of records on local disk.
+
+The spool is a directory of segment files. Each process appends records
+to its own segment until the segment grows past a given size, then moves
+on to a new one. Each record is framed with its length and a CRC so we
+can tell where a record ends and whether it got written out in full:
+
+    +----------------+---------------+------------------+
+    | length: uint32 | crc32: uint32 | payload: length  |
+    +----------------+---------------+------------------+
+
+Writers and readers coordinate through file locks, so processes can share
+the same spool directory. To read a segment, you claim it: we rename the
+segment so writers won't append to it anymore and hold a lock on it so
+no other reader can claim it too. As you process the segment's records,
+you save a checkpoint so that, if the process dies, whoever claims the
+segment next resumes from the checkpoint instead of going through the
+whole segment again. When done, you remove the segment. The spool never
+takes up more than a given amount of disk space: appending a record that
+would exceed it fails with a ``SpoolFullError``.
+"""
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+from threading import Lock
+from time import time_ns
+from typing import Iterator, Optional, Tuple
+import zlib
+
+
+SEGMENT_EXT = '.seg'
+CLAIMED_EXT = '.replay'
+CHECKPOINT_EXT = '.offset'
+
+RECORD_HEADER = struct.Struct('>II')
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+class SpoolFullError(Exception):
+    """
+    Raised when a record can't be added to the spool because the spool
+    would take up more than its maximum size.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__(f"spool full: max size is {max_size} bytes")
+
+
+def _same_file(fd: int, path: str) -> bool:
+    try:
+        return os.stat(path).st_ino == os.fstat(fd).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _frame(record: bytes) -> bytes:
+    return RECORD_HEADER.pack(len(record), zlib.crc32(record)) + record
+
+
+class SpoolSegment:
+    """
+    A segment claimed for reading.
+    """
+
+    def __init__(self, path: str, fd: int):
+        """
+        Create a new instance.
+
+        :param path: the path of the claimed segment file.
+        :param fd: a descriptor of the segment file on which we hold an
+            exclusive lock.
+        """
+        self.path = path
+        self._fd = fd
+
+    def _checkpoint_path(self) -> str:
+        return self.path + CHECKPOINT_EXT
+
+    def checkpoint(self, offset: int):
+        """
+        Record the given offset as the point where to resume reading.
+
+        :param offset: the offset of the first record yet to process.
+        """
+        tmp_path = self._checkpoint_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self._checkpoint_path())
+
+    def last_checkpoint(self) -> int:
+        """
+        :return: the last checkpoint or ``0`` if there's none.
+        """
+        try:
+            with open(self._checkpoint_path()) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def records(self) -> Iterator[Tuple[int, bytes]]:
+        """
+        Iterate the segment's records from the last checkpoint on.
+
+        :return: for each record, the offset past the record's end and the
+            record itself.
+        """
+        size = os.fstat(self._fd).st_size
+        offset = self.last_checkpoint()
+        if offset >= size:
+            return
+
+        with mmap.mmap(self._fd, size, access=mmap.ACCESS_READ) as data:
+            while offset + RECORD_HEADER.size <= size:
+                length, crc = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                end = start + length
+                record = data[start:end]
+                if end > size or zlib.crc32(record) != crc:         # (1)
+                    break
+                yield end, record
+                offset = end
+        if offset < size:
+            log().warning(f"Skipping {size - offset} bytes of truncated " +
+                          f"or corrupt records in {self.path}")
+    # NOTE
+    # 1. Torn writes. If a process died halfway through writing a record,
+    # the segment ends with a partial record. Since we can't tell where
+    # the next record starts after a corrupt one, we skip the rest of the
+    # segment.
+
+    def release(self):
+        """
+        Let go of the segment so it can be claimed again, e.g. because
+        there was an error processing its records.
+        """
+        os.close(self._fd)
+
+    def remove(self):
+        """
+        Delete the segment and its checkpoint after processing all its
+        records.
+        """
+        for path in (self._checkpoint_path(), self.path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        os.close(self._fd)
+
+
+class Spool:
+    """
+    Append records to and claim segments from a spool directory.
+    """
+
+    def __init__(self, directory: str, max_size: int, segment_size: int,
+                 fsync: bool = False):
+        """
+        Create a new instance.
+
+        :param directory: the spool directory, created if not there.
+        :param max_size: how many bytes all the segment files can take up.
+        :param segment_size: how many bytes a segment file should take up
+            before moving on to a new segment.
+        :param fsync: whether to flush each record to disk before returning
+            from ``append``.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self._fsync = fsync
+        self._segment: Optional[str] = None
+        self._lock = Lock()
+
+    def _new_segment_path(self) -> str:
+        name = f"{time_ns():020d}-{os.getpid()}{SEGMENT_EXT}"
+        return os.path.join(self.directory, name)
+
+    def usage(self) -> Tuple[int, int]:
+        """
+        :return: how many bytes the segment files take up and how many
+            segment files there are.
+        """
+        size, count = 0, 0
+        with os.scandir(self.directory) as entries:
+            for e in entries:
+                if e.name.endswith((SEGMENT_EXT, CLAIMED_EXT)):
+                    try:
+                        size += e.stat().st_size
+                        count += 1
+                    except FileNotFoundError:
+                        pass
+        return size, count
+
+    def append(self, record: bytes):
+        """
+        Add a record to the spool.
+
+        :param record: the record to add.
+        :raise SpoolFullError: if the record doesn't fit.
+        """
+        framed = _frame(record)
+        with self._lock:                                            # (1)
+            if self.usage()[0] + len(framed) > self.max_size:
+                raise SpoolFullError(self.max_size)
+            while not self._append_to_segment(framed):
+                self._segment = None
+    # NOTE
+    # 1. Threads. Each process appends to its own segment so we only need
+    # to serialise threads here. We still lock the segment file on append
+    # since a reader could be claiming it.
+
+    def _append_to_segment(self, framed: bytes) -> bool:
+        if self._segment is None:
+            self._segment = self._new_segment_path()
+        path = self._segment
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:                                 # (1)
+                self._segment = None
+                return False
+            if not _same_file(fd, path):                            # (2)
+                return False
+
+            view = memoryview(framed)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            if self._fsync:
+                os.fsync(fd)
+            if os.fstat(fd).st_size >= self.segment_size:
+                self._segment = None
+            return True
+        finally:
+            os.close(fd)
+    # NOTE
+    # 1. Busy segments. No other writer appends to our segment, so if the
+    # segment is locked, a reader is claiming it and is about to replay it,
+    # which could take a while. Rather than have the caller, e.g. a notify
+    # request, wait for the replay, we move on to a new segment.
+    # 2. Claimed segments. A reader renamed the segment after we opened it,
+    # so we've got to move on to a new segment. Otherwise the reader would
+    # never see the record.
+
+    def claim(self) -> Iterator[SpoolSegment]:
+        """
+        Claim segments for reading, oldest first. Segments claimed by
+        readers that died get claimed again. Segments other readers are
+        working on get skipped.
+
+        :return: the claimed segments; the caller must either ``remove``
+            or ``release`` each segment.
+        """
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(SEGMENT_EXT):
+                segment = self._claim_segment(path)
+            elif name.endswith(CLAIMED_EXT):
+                segment = self._reclaim_segment(path)
+            else:
+                continue
+            if segment:
+                yield segment
+
+    @staticmethod
+    def _claim_segment(path: str) -> Optional[SpoolSegment]:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        fcntl.flock(fd, fcntl.LOCK_EX)                              # (1)
+        if not _same_file(fd, path):
+            os.close(fd)
+            return None
+        claimed_path = path[:-len(SEGMENT_EXT)] + CLAIMED_EXT
+        os.rename(path, claimed_path)
+        return SpoolSegment(claimed_path, fd)
+    # NOTE
+    # 1. Pending writes. Waiting on the lock lets any ongoing append
+    # complete. Since the lock sticks to the file, not its name, we still
+    # hold it after renaming the file.
+
+    @staticmethod
+    def _reclaim_segment(path: str) -> Optional[SpoolSegment]:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        if not _same_file(fd, path):
+            os.close(fd)
+            return None
+        return SpoolSegment(path, fd)
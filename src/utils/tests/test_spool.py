@@ -0,0 +1,103 @@
+import fcntl
+import os
+
+import pytest
+
+from utils.spool import CLAIMED_EXT, SEGMENT_EXT, Spool, SpoolFullError
+
+
+def records_of(spool: Spool) -> [bytes]:
+    rs = []
+    for segment in spool.claim():
+        rs.extend(r for _, r in segment.records())
+        segment.remove()
+    return rs
+
+
+def test_append_and_claim(tmp_path):
+    spool = Spool(str(tmp_path), max_size=1024, segment_size=1024)
+    spool.append(b'one')
+    spool.append(b'two')
+
+    assert records_of(spool) == [b'one', b'two']
+    assert spool.usage() == (0, 0)
+
+
+def test_segments_roll_over(tmp_path):
+    spool = Spool(str(tmp_path), max_size=1024, segment_size=30)
+    for k in range(4):
+        spool.append(f"record {k}".encode())
+
+    assert spool.usage()[1] == 2
+    assert records_of(spool) == [f"record {k}".encode() for k in range(4)]
+
+
+def test_max_size(tmp_path):
+    spool = Spool(str(tmp_path), max_size=30, segment_size=1024)
+    spool.append(b'0123456789')
+
+    with pytest.raises(SpoolFullError):
+        spool.append(b'0123456789')
+
+
+def test_append_after_claim_goes_to_new_segment(tmp_path):
+    spool = Spool(str(tmp_path), max_size=1024, segment_size=1024)
+    spool.append(b'one')
+    segment = next(spool.claim())
+    spool.append(b'two')
+
+    assert [r for _, r in segment.records()] == [b'one']
+    segment.remove()
+    assert records_of(spool) == [b'two']
+
+
+def test_append_to_locked_segment_goes_to_new_segment(tmp_path):
+    spool = Spool(str(tmp_path), max_size=1024, segment_size=1024)
+    spool.append(b'one')
+    [name] = os.listdir(tmp_path)
+    fd = os.open(os.path.join(tmp_path, name), os.O_RDONLY)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        spool.append(b'two')
+    finally:
+        os.close(fd)
+
+    assert spool.usage()[1] == 2
+    assert records_of(spool) == [b'one', b'two']
+
+
+def test_claimed_segment_skipped_by_other_readers(tmp_path):
+    spool = Spool(str(tmp_path), max_size=1024, segment_size=1024)
+    spool.append(b'one')
+    segment = next(spool.claim())
+
+    assert list(Spool(str(tmp_path), 1024, 1024).claim()) == []
+
+    segment.release()
+    assert records_of(Spool(str(tmp_path), 1024, 1024)) == [b'one']
+
+
+def test_resume_from_checkpoint(tmp_path):
+    spool = Spool(str(tmp_path), max_size=1024, segment_size=1024)
+    for r in (b'one', b'two', b'three'):
+        spool.append(r)
+
+    segment = next(spool.claim())
+    end, _ = next(segment.records())
+    segment.checkpoint(end)
+    segment.release()
+
+    assert records_of(spool) == [b'two', b'three']
+
+
+def test_truncated_record_skipped(tmp_path):
+    spool = Spool(str(tmp_path), max_size=1024, segment_size=1024)
+    spool.append(b'one')
+    spool.append(b'two')
+    name = next(n for n in os.listdir(tmp_path) if n.endswith(SEGMENT_EXT))
+    path = tmp_path / name
+    path.write_bytes(path.read_bytes()[:-1])
+
+    segment = next(spool.claim())
+    assert segment.path.endswith(CLAIMED_EXT)
+    assert [r for _, r in segment.records()] == [b'one']
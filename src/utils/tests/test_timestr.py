@@ -1,5 +1,6 @@
 import pytest
-from dateutil.tz import tzutc
+from dateutil.parser import isoparse, parse
+from dateutil.tz import tzoffset, tzutc
 from utils.timestr import *
 
 
@@ -19,6 +20,54 @@ def test_to_datetime(string_rep, expected):
     assert expected == to_datetime(string_rep)
 
 
+iso8601_reps = [
+    '2008-09-03', '2008-09-03T20:56', '2008-09-03 20:56',
+    '2008-09-03T20:56:35', '2008-09-03T20:56:35.4',
+    '2008-09-03T20:56:35.450686', '2008-09-03T20:56:35.450686Z',
+    '2008-09-03T20:56:35.450686+02:00', '2008-09-03T20:56:35-0330',
+    '2008-09-03T20:56:35+00:00', '2008-09-03T20:56:35-00:00',
+    '2018-03-20T13:26:38.722Z'
+]
+
+
+@pytest.mark.parametrize('string_rep', iso8601_reps + [
+    '20080903T205635.450686', '20080903', '2008-09-03T24:00',
+    '2008-09-03T20', '2008-09-03T20:56:35.4506861Z', '2008-W36-3', '2008'
+])
+def test_parse_iso8601_same_as_dateutil(string_rep):
+    assert parse_iso8601(string_rep) == isoparse(string_rep)
+    assert parse_iso8601(string_rep).tzinfo == isoparse(string_rep).tzinfo
+
+
+@pytest.mark.parametrize('string_rep', iso8601_reps)
+def test_to_datetime_same_as_dateutil(string_rep):
+    assert to_datetime(string_rep) == parse(string_rep)
+    assert to_datetime(string_rep).tzinfo == parse(string_rep).tzinfo
+
+
+@pytest.mark.parametrize('string_rep, expected', [
+    ('2008-09-03T20:56:35+01:00',
+        datetime(2008, 9, 3, 20, 56, 35, tzinfo=tzoffset(None, 3600))),
+    ('2008-09-03T20:56:35.4Z',
+        datetime(2008, 9, 3, 20, 56, 35, 400000, tzinfo=tzutc()))
+])
+def test_parse_iso8601(string_rep, expected):
+    assert expected == parse_iso8601(string_rep)
+
+
+@pytest.mark.parametrize('value', [
+    None, 1, 1.5, True, {}, [], '', ' ', 'text', 'Room1', '2008-02-30',
+    '2008-09-03T20:61', '2008-09-03T20:56+25:00', '٢٠٠٨-09-03'
+])
+def test_is_not_iso8601(value):
+    assert not is_iso8601(value)
+
+
+@pytest.mark.parametrize('value', iso8601_reps)
+def test_is_iso8601(value):
+    assert is_iso8601(value)
+
+
 @pytest.mark.parametrize('timepoints, expected', [
     ([], None),
     ([datetime(2019, 2, 1)], datetime(2019, 2, 1)),
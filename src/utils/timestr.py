@@ -3,13 +3,125 @@ This module provides utilities to work with string representations of time
 points.
 """
 
-from dateutil.parser import parse
+from dateutil.parser import isoparse, parse
+from dateutil.tz import tzoffset, tzutc
 from datetime import datetime
-from typing import Iterable, Union
+from functools import lru_cache
+import re
+from typing import Any, Iterable, Union
 
 MaybeString = Union[str, None]
 MaybeDateTime = Union[datetime, None]
 
+MEMO_SIZE = 4096
+"""
+How many parsed string representations to remember. Notifications often
+carry the same time points over and over, e.g. in the metadata of each
+attribute, so it pays off to cache parse results.
+"""
+
+_ISO8601_EXT = re.compile(
+    r'([0-9]{4})-([0-9]{2})-([0-9]{2})'
+    r'(?:[T ]([0-9]{2}):([0-9]{2})(?::([0-9]{2})(?:\.([0-9]{1,6}))?)?'
+    r'(Z|[+-][0-9]{2}:?[0-9]{2})?)?')
+
+_DIGITS = frozenset('0123456789')
+
+_UTC = tzutc()
+
+
+def _tz(rep: str):
+    if rep == 'Z':
+        return _UTC
+    hours, minutes = int(rep[1:3]), int(rep[-2:])
+    if hours > 23 or minutes > 59:
+        raise ValueError
+    offset = hours * 3600 + minutes * 60
+    if offset == 0:
+        return _UTC
+    return tzoffset(None, -offset if rep[0] == '-' else offset)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _fast_parse(rep: str) -> MaybeDateTime:
+    m = _ISO8601_EXT.fullmatch(rep)
+    if m is None:
+        return None
+    yy, mm, dd, hh, mi, ss, frac, tz = m.groups()
+    try:
+        return datetime(
+            int(yy), int(mm), int(dd),
+            int(hh or 0), int(mi or 0), int(ss or 0),
+            int(frac.ljust(6, '0')) if frac else 0,
+            _tz(tz) if tz else None)
+    except ValueError:
+        return None
+# NOTE. Fast path. We only handle the ISO 8601 extended format Orion and
+# most devices use, i.e. "YYYY-MM-DD[(T| )hh:mm[:ss[.ffffff]][tz]]" with a
+# "Z", "+hh:mm" or "+hhmm" time zone. This way we return exactly what both
+# the dateutil ISO parser and its generic parser return for the same input.
+# Anything else, e.g. basic format, hour 24 or more than 6 fraction digits,
+# goes to dateutil. Also, we only memoize fast path results since the
+# generic dateutil parser fills in missing date fields with today's date.
+
+
+def _may_be_iso8601(rep: str) -> bool:
+    return len(rep) >= 4 and rep.isascii() and _DIGITS.issuperset(rep[:4])
+# NOTE. Cheap pre-check. The dateutil ISO parser only accepts ASCII strings
+# starting with a four-digit year, so we can tell most text values apart
+# without parsing them.
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def parse_iso8601(rep: str) -> MaybeDateTime:
+    """
+    Convert an ISO 8601 string to a ``datetime`` object if possible,
+    otherwise return ``None``. Same as ``dateutil.parser.isoparse`` but
+    faster for the common formats and without exceptions.
+
+    :param rep: the string to convert.
+    :return: the converted ``datetime`` or ``None`` if the input isn't in
+        ISO 8601 format.
+    """
+    if not _may_be_iso8601(rep):
+        return None
+    d = _fast_parse(rep)
+    if d is not None:
+        return d
+    try:
+        return isoparse(rep)
+    except (ValueError, OverflowError):
+        return None
+
+
+def is_iso8601(rep: Any) -> bool:
+    """
+    Is the given value a string in ISO 8601 format?
+
+    :param rep: the value to test.
+    :return: true for yes, false for no.
+    """
+    return isinstance(rep, str) and parse_iso8601(rep) is not None
+
+
+def _parse_str_rep(rep: str) -> MaybeDateTime:
+    d = _fast_parse(rep)
+    if d is not None:
+        return d
+    try:
+        return parse(rep)
+    except (ValueError, OverflowError):
+        return None
+
+
+def _parse_time_point(rep) -> MaybeDateTime:
+    if isinstance(rep, str):
+        return _parse_str_rep(rep)
+    try:
+        return parse(rep)
+    except (ValueError, OverflowError):
+        return None
+
 
 def to_datetime(rep: MaybeString) -> MaybeDateTime:
     """
@@ -20,15 +132,9 @@ def to_datetime(rep: MaybeString) -> MaybeDateTime:
     :return: the converted ``datetime`` or ``None`` if conversion fails.
     """
     if rep and '@value' not in rep:
-        try:
-            return parse(rep)
-        except (ValueError, OverflowError):
-            return None
+        return _parse_time_point(rep)
     elif rep and '@value' in rep:
-        try:
-            return parse(rep['@value'])
-        except (ValueError, OverflowError):
-            return None
+        return _parse_time_point(rep['@value'])
     return None
 
 
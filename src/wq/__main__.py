@@ -15,7 +15,9 @@ if __name__ == '__main__':
 # --help  Show this message and exit.
 #
 # Commands:
-# up  Start processing tasks on the queue.
+# reindex-tasks  Add all the tasks in Redis to the task index.
+# replay-spool   Insert the notifications spooled while the backend was down.
+# up             Start processing tasks on the queue.
 
 # $ python wq up --help
 # Usage: wq up [OPTIONS]
@@ -23,13 +25,30 @@ if __name__ == '__main__':
 # Start processing tasks on the queue.
 #
 # Options:
-# -w, --workers INTEGER  How many worker processes to service the queues.
-# -b, --burst-mode       Process tasks until the queue is empty and then exit.
-# --max-tasks INTEGER    Process the specified number of tasks and then exit.
-# --help                 Show this message and exit.
+# -w, --workers INTEGER      How many worker processes to service the queues.
+# --max-workers INTEGER      Up to how many worker processes to scale out to
+#                            when tasks pile up; defaults to WQ_MAX_WORKERS.
+# -t, --threads INTEGER      How many tasks each worker process runs at the
+#                            same time; defaults to WQ_WORKER_THREADS.
+# -b, --burst-mode           Process tasks until the queue is empty and then
+#                            exit.
+# --max-tasks INTEGER        Process the specified number of tasks and then
+#                            exit. With multiple workers, replace each worker
+#                            after that many tasks.
+# --collect-telemetry-in TEXT
+#                            Turn on telemetry and collect task durations in
+#                            the specified path. Directories in the given path
+#                            will be created as needed.
+# --help                     Show this message and exit.
 
 # $ python wq up
 # basically the same as running: `rq worker`
 
-# $ python wq up -w 2
-# multiple workers run tasks in parallel; experimental, only use for testing.
+# $ python wq up -w 2 --max-workers 8 --max-tasks 1000
+# start two workers and scale out to eight when tasks wait in the queue
+# for longer than WQ_SCALE_UP_LATENCY seconds; replace each worker after
+# a thousand tasks.
+
+# $ python wq up -t 8
+# start one worker running up to eight tasks at the same time, each in a
+# thread of its own.
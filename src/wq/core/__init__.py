@@ -2,5 +2,6 @@
 TODO document package interface
 """
 
-from wq.core.mgmt import TaskStatus, TaskRuntimeInfo, TaskInfo, QMan
+from wq.core.mgmt import TaskStatus, TaskRuntimeInfo, TaskInfo, QMan, \
+    TenantBacklog
 from wq.core.task import TaskId, CompositeTaskId, WorkQ, Tasklet, StopTask
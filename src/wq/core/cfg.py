@@ -4,11 +4,13 @@ out of configuration items.
 """
 
 import logging
+from typing import Dict, Iterable, Set
 
 from redis import Redis
 
 from cache.factory import CacheEnvReader
-from utils.cfgreader import EnvReader, BoolVar, IntVar, StrVar
+from utils.cfgreader import EnvReader, YamlReader, BoolVar, IntVar, StrVar
+from utils.jsondict import maybe_string_match
 
 
 def redis_connection() -> Redis:
@@ -75,6 +77,75 @@ def queue_names() -> [str]:
 # e.g. use a separate queue for each task type to prioritise execution.
 
 
+TENANT_QUEUES_VAR = BoolVar('WQ_TENANT_QUEUES', False)
+
+
+def tenant_queues() -> bool:
+    """
+    Split each work queue into per-tenant lanes workers take turns at?
+
+    :return: ``True`` to queue each tenant's tasks separately, ``False``
+        to queue all tasks in the same list.
+    """
+    return EnvReader().safe_read(TENANT_QUEUES_VAR)
+
+
+QL_CONFIG_ENV_VAR = 'QL_CONFIG'
+
+
+def tenant_weights(fiware_services: Iterable[str]) -> Dict[str, int]:
+    """
+    Read from the ``QL_CONFIG`` file how many tasks of each given tenant
+    workers should run for each task of a tenant with a weight of one,
+    when the tenants' tasks queue up.
+
+    :param fiware_services: the tenants.
+    :return: the weight of each tenant, defaulting to the file's
+        ``default-wq-weight`` or ``1`` if not in the file.
+    """
+    config = YamlReader(log=logging.getLogger(__name__).debug) \
+        .from_env_file(QL_CONFIG_ENV_VAR, defaults={})
+    default = _weight(maybe_string_match(config, 'default-wq-weight'), 1)
+    return {
+        s: _weight(maybe_string_match(config, 'tenants', s, 'wq-weight'),
+                   default)
+        for s in fiware_services
+    }
+
+
+def _weight(value, default: int) -> int:
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+HIGH_PRIORITY = 'high'
+
+
+def priority_tenants() -> Set[str]:
+    """
+    Read from the ``QL_CONFIG`` file which tenants have a ``wq-priority``
+    of ``high``, i.e. tenants whose notifications QuantumLeap should keep
+    accepting when shedding load.
+
+    :return: the lowercased names of the high-priority tenants.
+    """
+    config = YamlReader(log=logging.getLogger(__name__).debug) \
+        .from_env_file(QL_CONFIG_ENV_VAR, defaults={})
+    tenants = maybe_string_match(config, 'tenants')
+    if not isinstance(tenants, dict):
+        return set()
+    return {
+        str(s).lower() for s, settings in tenants.items()
+        if isinstance(settings, dict) and
+        str(maybe_string_match(settings, 'wq-priority')).lower() ==
+        HIGH_PRIORITY
+    }
+# NOTE. Case. Like the other tenant settings, we match tenant names in
+# the file regardless of case.
+
+
 MAX_RETRIES_VAR = IntVar('WQ_MAX_RETRIES', 0)
 
 
@@ -137,6 +208,63 @@ def successful_task_retention_period() -> int:
 # task type gets different retention periods.
 
 
+MERGE_MAX_TASKS_VAR = IntVar('WQ_MERGE_MAX_TASKS', 1)
+
+
+def merge_max_tasks() -> int:
+    """
+    How many pending tasks a worker may run together as one, if the tasks
+    can be merged. For example, insert tasks for the same tenant and service
+    path can be run as a single insert.
+
+    :return: the max number of tasks to merge; ``1`` or less means never
+        merge tasks.
+    """
+    return EnvReader().safe_read(MERGE_MAX_TASKS_VAR)
+
+
+WORKER_THREADS_VAR = IntVar('WQ_WORKER_THREADS', 1)
+
+
+def worker_threads() -> int:
+    """
+    How many tasks each work queue worker process may run at the same
+    time, each in a thread of its own. Threads pay off when tasks spend
+    most of their time waiting on the DB.
+
+    :return: the max number of tasks a worker runs concurrently; ``1`` or
+        less means run one task at a time.
+    """
+    return EnvReader().safe_read(WORKER_THREADS_VAR)
+
+
+MAX_WORKERS_VAR = IntVar('WQ_MAX_WORKERS', 0)
+
+
+def max_workers() -> int:
+    """
+    Up to how many worker processes a work queue backend may scale out to
+    when tasks pile up in the queue.
+
+    :return: the max number of workers; if less than the number of workers
+        the backend starts with, the backend never scales.
+    """
+    return EnvReader().safe_read(MAX_WORKERS_VAR)
+
+
+SCALE_UP_LATENCY_VAR = IntVar('WQ_SCALE_UP_LATENCY', 10)
+
+
+def scale_up_latency() -> int:
+    """
+    How long, in seconds, the oldest task in the queue may wait before the
+    work queue backend adds a worker process, if it can scale.
+
+    :return: the max queue wait time in seconds.
+    """
+    return EnvReader().safe_read(SCALE_UP_LATENCY_VAR)
+
+
 LOG_LEVEL_VAR = StrVar('LOGLEVEL', 'INFO')
 
 
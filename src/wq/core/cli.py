@@ -3,6 +3,8 @@ CLI for the QuantumLeap work queue.
 """
 import click
 
+from wq.core.index import task_index
+from wq.core.rqutils import find_job_ids
 from wq.core.rts import start
 
 
@@ -12,18 +14,61 @@ def main():
     pass
 
 
+def warm_up():
+    """
+    Load what tasks need before forking workers, so each worker doesn't
+    have to load it again.
+    """
+    from translators.factory import default_backend    # (*)
+    from wq.ql.notify import InsertAction
+    InsertAction.insert_queue()
+    default_backend()
+# NOTE. Imports. Lazy so we only pull in the translators when starting a
+# pool of workers.
+
+
 @main.command()
 @click.option('--workers', '-w', type=int, default=None,
               help='How many worker processes to service the queues.')
+@click.option('--max-workers', type=int, default=None,
+              help='Up to how many worker processes to scale out to when ' +
+              'tasks pile up; defaults to WQ_MAX_WORKERS.')
+@click.option('--threads', '-t', type=int, default=None,
+              help='How many tasks each worker process runs at the same ' +
+              'time; defaults to WQ_WORKER_THREADS.')
 @click.option('--burst-mode', '-b', is_flag=True, default=False,
               help='Process tasks until the queue is empty and then exit.')
 @click.option('--max-tasks', type=int, default=None,
-              help='Process the specified number of tasks and then exit.')
+              help='Process the specified number of tasks and then exit. ' +
+              'With multiple workers, replace each worker after that ' +
+              'many tasks.')
 @click.option('--collect-telemetry-in', type=str, default=None,
               help='Turn on telemetry and collect task durations in the ' +
               'specified path. Directories in the given path will be ' +
               'created as needed.')
-def up(workers, burst_mode, max_tasks, collect_telemetry_in):
+def up(workers, max_workers, threads, burst_mode, max_tasks,
+       collect_telemetry_in):
     """Start processing tasks on the queue."""
     start(pool_size=workers, burst_mode=burst_mode, max_tasks=max_tasks,
-          monitoring_dir=collect_telemetry_in)
+          monitoring_dir=collect_telemetry_in, max_pool_size=max_workers,
+          warm_up=warm_up, threads=threads)
+
+
+@main.command('replay-spool')
+def replay_spool():
+    """Insert the notifications spooled while the backend was down."""
+    from wq.ql.spool import new_notification_spool    # (*)
+    spool = new_notification_spool()
+    if spool is None:
+        raise click.ClickException('SPOOL_DIR not set.')
+    replayed = spool.replay()
+    click.echo(f"Replayed {replayed} entities.")
+# NOTE. Imports. The spool depends on the translators, which only this
+# command needs.
+
+
+@main.command('reindex-tasks')
+def reindex_tasks():
+    """Add all the tasks in Redis to the task index."""
+    indexed = task_index().rebuild(find_job_ids('*'))
+    click.echo(f"Indexed {indexed} tasks.")
@@ -0,0 +1,188 @@
+"""
+Background deletion of work queue tasks.
+
+Deleting all the tasks of a tenant can take a while when there are lots
+of them, e.g. a backlog of failed tasks, so the management API deletes
+tasks in a background thread of the QuantumLeap process that got the
+request. Each deletion keeps track of its progress in a Redis hash, so
+clients can poll any QuantumLeap process for it. Progress records expire
+``DELETION_TTL`` seconds after the deletion's last update. The process
+could exit in the middle of a deletion, e.g. when Gunicorn recycles its
+workers, so a running deletion that hasn't made any progress for
+``DELETION_STALL_TIMEOUT`` seconds shows up as failed.
+"""
+
+from datetime import datetime, timezone
+from enum import Enum
+import logging
+from threading import Thread
+from time import time
+from typing import Callable, Optional
+from uuid import uuid4
+
+from pydantic import BaseModel
+from redis import Redis
+
+from wq.core.cfg import redis_connection
+
+
+DELETION_KEY_PREFIX = 'ql:wq:task-deletion:'
+
+DELETION_TTL = 24 * 60 * 60
+"""How many seconds to keep a deletion's progress around."""
+
+DELETION_STALL_TIMEOUT = 5 * 60
+"""
+How many seconds a running deletion may go without deleting any tasks
+before we take it for dead.
+"""
+
+STALLED_ERROR = 'Deletion stopped making progress, the QuantumLeap ' \
+    'process running it may have exited. Delete the tasks again.'
+
+ProgressFn = Callable[[int], None]
+"""
+A function a deletion calls with how many more tasks it deleted.
+"""
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+class TaskDeletionStatus(Enum):
+    """
+    Enumerate the states a task deletion can be in.
+    """
+
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class TaskDeletionInfo(BaseModel):
+    """
+    Progress of a background task deletion.
+    """
+    deletion_id: str
+    status: TaskDeletionStatus
+    total: int
+    deleted: int
+    error: Optional[str]
+    updated_at: Optional[datetime]
+
+
+class TaskDeletion:
+    """
+    Run a task deletion in the background and keep track of its progress.
+    """
+
+    def __init__(self, redis: Redis, deletion_id: str):
+        self._redis = redis
+        self._id = deletion_id
+        self._key = f"{DELETION_KEY_PREFIX}{deletion_id}"
+
+    def _save(self, **fields) -> float:
+        now = time()
+        pipe = self._redis.pipeline()
+        pipe.hset(self._key, mapping=dict(fields, updated_at=now))
+        pipe.expire(self._key, DELETION_TTL)
+        pipe.execute()
+        return now
+
+    def load(self) -> Optional[TaskDeletionInfo]:
+        """
+        :return: the deletion's progress or ``None`` if there's no such
+            deletion.
+        """
+        fields = {k.decode('utf-8'): v.decode('utf-8')
+                  for k, v in self._redis.hgetall(self._key).items()}
+        if not fields:
+            return None
+        status = TaskDeletionStatus(fields['status'])
+        error = fields.get('error')
+        updated_at = fields.get('updated_at')                          # (1)
+        if updated_at is not None:
+            updated_at = float(updated_at)
+            if status == TaskDeletionStatus.RUNNING and \
+                    time() - updated_at > DELETION_STALL_TIMEOUT:
+                status, error = TaskDeletionStatus.FAILED, STALLED_ERROR
+        return TaskDeletionInfo(deletion_id=self._id, status=status,
+                                total=int(fields['total']),
+                                deleted=int(fields['deleted']),
+                                error=error,
+                                updated_at=_to_datetime(updated_at))
+    # NOTE
+    # 1. Old records. Deletions started by an older QuantumLeap have no
+    # update time, but they expire within a day anyway.
+
+    def start(self, delete: Callable[[ProgressFn], int], total: int) \
+            -> TaskDeletionInfo:
+        """
+        Start the deletion in a background thread.
+
+        :param delete: deletes the tasks, calling the given progress
+            function after each batch of deleted tasks.
+        :param total: how many tasks we expect to delete.
+        :return: the deletion's progress at the start.
+        """
+        started_at = self._save(status=TaskDeletionStatus.RUNNING.value,
+                                total=total, deleted=0)
+        Thread(target=self._run, args=(delete,), daemon=True,     # (1)
+               name='ql-task-deletion').start()
+        return TaskDeletionInfo(deletion_id=self._id,
+                                status=TaskDeletionStatus.RUNNING,
+                                total=total, deleted=0, error=None,
+                                updated_at=_to_datetime(started_at))
+    # NOTE
+    # 1. Shutdown. A daemon thread won't hold up the process on exit, in
+    # which case the deletion stops updating its progress and ``load``
+    # reports it as failed once ``DELETION_STALL_TIMEOUT`` has passed.
+    # Deleting again takes care of whatever tasks are left.
+
+    def _run(self, delete: Callable[[ProgressFn], int]):
+        deleted = 0
+
+        def progress(n: int):
+            nonlocal deleted
+            deleted += n
+            self._save(deleted=deleted)
+
+        try:
+            delete(progress)
+            self._save(status=TaskDeletionStatus.DONE.value)
+            log().info(f"Task deletion {self._id} deleted {deleted} tasks")
+        except Exception as e:
+            log().exception(f"Task deletion {self._id} failed")
+            self._save(status=TaskDeletionStatus.FAILED.value, error=repr(e))
+
+
+def _to_datetime(timestamp: Optional[float]) -> Optional[datetime]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def start_deletion(delete: Callable[[ProgressFn], int], total: int) \
+        -> TaskDeletionInfo:
+    """
+    Start a new task deletion in the background.
+
+    :param delete: deletes the tasks, calling the given progress function
+        after each batch of deleted tasks.
+    :param total: how many tasks we expect to delete.
+    :return: the deletion's progress at the start.
+    """
+    deletion = TaskDeletion(redis_connection(), uuid4().hex)
+    return deletion.start(delete, total)
+
+
+def load_deletion(deletion_id: str) -> Optional[TaskDeletionInfo]:
+    """
+    Look up the progress of a task deletion.
+
+    :param deletion_id: the ID ``start_deletion`` returned.
+    :return: the deletion's progress or ``None`` if there's no such
+        deletion, e.g. because it expired.
+    """
+    return TaskDeletion(redis_connection(), deletion_id).load()
@@ -0,0 +1,430 @@
+"""
+Secondary index of work queue tasks.
+
+Finding tasks by ID prefix used to mean scanning every RQ job key in Redis,
+which takes ages when Redis holds lots of retained jobs. So on enqueueing
+a task, we also add its ID to an index. The index groups task IDs in
+buckets, one for each distinct ID prefix made up of the first two elements
+of the ID, e.g. tenant and service path for insert tasks. Each bucket is a
+sorted set of task IDs scored by enqueue time, so listing, paging through
+and counting a bucket's tasks are range operations on the sorted set. A
+Redis set keeps track of the buckets. To find the tasks with a given ID
+prefix, we only look at the buckets that can hold them.
+
+Each bucket also comes with a hash of how many of its tasks are pending,
+succeeded and failed, so counting a bucket's tasks by status takes
+constant time. Enqueueing a task bumps the pending count, whereas workers
+move the task to the succeeded or failed count after the task's last run.
+
+RQ deletes jobs when their TTL expires, so the index can reference jobs
+that are gone. Readers skip those, whereas workers prune them from the
+index as part of RQ's periodic clean up of job registries. Pruning also
+recounts each bucket's tasks, which takes care of expired tasks as well
+as any drift in the counts, e.g. because a worker died before it could
+update the counts.
+"""
+
+from datetime import timezone
+from itertools import islice
+from time import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from redis import Redis
+from rq import Queue
+from rq.utils import utcparse
+
+from wq.core.cfg import queue_names, redis_connection
+from wq.core.rqutils import RqJobId, job_id_to_job_key
+
+
+BUCKET_DEPTH = 2
+"""How many elements of a task ID make up the ID's bucket."""
+
+BUCKETS_KEY = 'ql:wq:task-index-buckets'
+BUCKET_KEY_PREFIX = 'ql:wq:task-index:'
+COUNTS_KEY_PREFIX = 'ql:wq:task-counts:'
+PRUNE_LOCK_KEY = 'ql:wq:task-index-prune-lock'
+
+PRUNE_INTERVAL = 5 * 60
+"""Min number of seconds between two index clean ups."""
+
+PAGE_SIZE = 1000
+
+PENDING = 'pending'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+STATUSES = (PENDING, SUCCEEDED, FAILED)
+"""Task states we keep counts of, same as ``TaskStatus`` values."""
+
+_DROP_IF_EMPTY = """
+if redis.call('zcard', KEYS[2]) == 0 then
+    redis.call('del', KEYS[3])
+    return redis.call('srem', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def bucket_of(jid: RqJobId) -> str:
+    """
+    Figure out the index bucket of a task ID.
+
+    :param jid: the task ID.
+    :return: the ID's bucket.
+
+    Examples:
+
+        >>> bucket_of('dA==:Lw==:Yw==:dQ==')
+        'dA==:Lw=='
+
+        >>> bucket_of('dA==:dQ==')
+        'dA=='
+    """
+    elements = jid.split(':')
+    depth = min(BUCKET_DEPTH, len(elements) - 1)    # (*)
+    return ':'.join(elements[:depth])
+# NOTE. UUID. The last element of our task IDs is a UUID, so using it would
+# put each task in a bucket of its own.
+
+
+def _bucket_key(bucket: str) -> str:
+    return f"{BUCKET_KEY_PREFIX}{bucket}"
+
+
+def _counts_key(bucket: str) -> str:
+    return f"{COUNTS_KEY_PREFIX}{bucket}"
+
+
+def _decode(x) -> str:
+    return x.decode('utf-8') if isinstance(x, bytes) else x
+
+
+class TaskIndex:
+    """
+    Index task IDs to find and count them by ID prefix.
+    """
+
+    def __init__(self, redis: Redis, finished_keys: Iterable[str] = (),
+                 failed_keys: Iterable[str] = ()):
+        """
+        Create a new instance.
+
+        :param redis: the Redis connection to use.
+        :param finished_keys: the keys of the RQ finished job registries
+            where to look for succeeded tasks.
+        :param failed_keys: the keys of the RQ failed job registries where
+            to look for failed tasks.
+        """
+        self._redis = redis
+        self._finished_keys = list(finished_keys)
+        self._failed_keys = list(failed_keys)
+
+    @staticmethod
+    def _index(pipe, jid: RqJobId, enqueued_at: Optional[float]):
+        bucket = bucket_of(jid)
+        when = time() if enqueued_at is None else enqueued_at
+        pipe.sadd(BUCKETS_KEY, bucket)
+        pipe.zadd(_bucket_key(bucket), {jid: when})
+
+    def add(self, jid: RqJobId, enqueued_at: Optional[float] = None):
+        """
+        Add the ID of a task about to be enqueued to the index.
+
+        :param jid: the task ID.
+        :param enqueued_at: when the task got enqueued, in seconds since
+            the epoch; defaults to now.
+        """
+        pipe = self._redis.pipeline()                               # (1)
+        self._index(pipe, jid, enqueued_at)
+        pipe.hincrby(_counts_key(bucket_of(jid)), PENDING, 1)
+        pipe.execute()
+    # NOTE
+    # 1. Atomicity. The pipeline runs as a transaction so ``prune`` can't
+    # drop the bucket in between adding the bucket and the ID.
+
+    def record_outcome(self, jid: RqJobId, status: str):
+        """
+        Move a task from the pending count to the given one after the
+        task ran for the last time.
+
+        :param jid: the task ID.
+        :param status: either ``SUCCEEDED`` or ``FAILED``.
+        """
+        key = _counts_key(bucket_of(jid))
+        pipe = self._redis.pipeline()
+        pipe.hincrby(key, PENDING, -1)
+        pipe.hincrby(key, status, 1)
+        pipe.execute()
+
+    def remove(self, jids: Iterable[RqJobId]):
+        """
+        Remove the IDs of deleted tasks from the index.
+
+        :param jids: the task IDs.
+        """
+        buckets = set()
+        pipe = self._redis.pipeline(transaction=False)
+        for jid in jids:
+            bucket = bucket_of(jid)
+            buckets.add(bucket)
+            pipe.zrem(_bucket_key(bucket), jid)
+        pipe.execute()
+        for bucket in buckets:
+            self.recount(bucket)
+
+    def _buckets(self, prefix: str) -> List[Tuple[str, bool]]:
+        members = self._redis.smembers(BUCKETS_KEY)
+        buckets = sorted(_decode(b) for b in members)
+        matching = []
+        for b in buckets:
+            if b.startswith(prefix):                                # (1)
+                matching.append((b, True))
+            elif prefix.startswith(b):                              # (2)
+                matching.append((b, False))
+        return matching
+    # NOTE
+    # 1. Whole bucket. Since the bucket is a prefix of all its IDs, they
+    # all start with the given prefix.
+    # 2. Partial bucket. Some of the bucket's IDs could start with the given
+    # prefix, e.g. those with a given correlation ID in a tenant and service
+    # path bucket.
+
+    def _iter_bucket(self, bucket: str, start: int = 0) \
+            -> Iterator[RqJobId]:
+        key = _bucket_key(bucket)
+        while True:
+            page = self._redis.zrange(key, start, start + PAGE_SIZE - 1)
+            for jid in page:
+                yield _decode(jid)
+            if len(page) < PAGE_SIZE:
+                return
+            start += PAGE_SIZE
+
+    def _statuses(self, jids: List[RqJobId]) -> List[Optional[str]]:
+        if not jids:
+            return []
+        pipe = self._redis.pipeline(transaction=False)
+        for jid in jids:
+            pipe.exists(job_id_to_job_key(jid))
+            for key in self._finished_keys + self._failed_keys:
+                pipe.zscore(key, jid)
+        replies = pipe.execute()
+
+        n, m = 1 + len(self._finished_keys), len(self._failed_keys)
+        statuses = []
+        for k in range(len(jids)):
+            reply = replies[k * (n + m):(k + 1) * (n + m)]
+            if not reply[0]:
+                statuses.append(None)
+            elif any(s is not None for s in reply[1:n]):
+                statuses.append(SUCCEEDED)
+            elif any(s is not None for s in reply[n:]):
+                statuses.append(FAILED)
+            else:
+                statuses.append(PENDING)
+        return statuses
+    # NOTE. Statuses. A task is gone if RQ deleted its job, succeeded or
+    # failed if the job is in a finished or failed job registry, and
+    # pending otherwise, i.e. queued, running or waiting for a retry.
+
+    def _iter_statuses(self, jids: Iterable[RqJobId]) \
+            -> Iterator[Tuple[RqJobId, Optional[str]]]:
+        jids = iter(jids)
+        while True:
+            page = list(islice(jids, PAGE_SIZE))
+            if not page:
+                return
+            yield from zip(page, self._statuses(page))
+
+    def _find_all(self, prefix: str, start: int,
+                  count: Optional[int]) -> Iterator[RqJobId]:
+        to_skip, to_take = start, count
+        if to_take is not None and to_take <= 0:
+            return
+        for bucket, whole in self._buckets(prefix):
+            if whole:
+                size = self._redis.zcard(_bucket_key(bucket))
+                if to_skip >= size:                                 # (1)
+                    to_skip -= size
+                    continue
+                jids = self._iter_bucket(bucket, to_skip)
+                to_skip = 0
+            else:
+                jids = (j for j in self._iter_bucket(bucket)
+                        if j.startswith(prefix))
+            for jid in jids:
+                if to_skip > 0:
+                    to_skip -= 1
+                    continue
+                yield jid
+                if to_take is not None:
+                    to_take -= 1
+                    if to_take == 0:
+                        return
+    # NOTE
+    # 1. Paging. We skip whole buckets and start from the right offset in
+    # the first bucket we don't skip, so we only read the IDs we return.
+
+    def find(self, prefix: str, start: int = 0,
+             count: Optional[int] = None,
+             status: Optional[str] = None) -> Iterator[RqJobId]:
+        """
+        Iterate the IDs starting with the given prefix. IDs in the same
+        bucket come out in enqueue order.
+
+        :param prefix: the ID prefix to match.
+        :param start: how many matching IDs to skip.
+        :param count: how many matching IDs to return at most; all of them
+            if ``None``.
+        :param status: only return the IDs of tasks in this state, one of
+            ``STATUSES``; any state if ``None``.
+        :return: the matching IDs.
+        """
+        if status is None:
+            return self._find_all(prefix, start, count)
+        jids = (j for j, s in self._iter_statuses(self._find_all(prefix, 0,
+                                                                 None))
+                if s == status)
+        stop = None if count is None else start + count
+        return islice(jids, start, stop)
+
+    def _bucket_counts(self, bucket: str) -> Dict[str, int]:
+        values = self._redis.hmget(_counts_key(bucket), *STATUSES)
+        return {s: max(0, int(v or 0)) for s, v in zip(STATUSES, values)}
+
+    def count(self, prefix: str, status: Optional[str] = None) -> int:
+        """
+        Count the IDs starting with the given prefix.
+
+        :param prefix: the ID prefix to match.
+        :param status: only count tasks in this state, one of ``STATUSES``;
+            any state if ``None``.
+        :return: how many IDs match.
+        """
+        total = 0
+        for bucket, whole in self._buckets(prefix):
+            if whole:                                               # (1)
+                counts = self._bucket_counts(bucket)
+                total += counts[status] if status else sum(counts.values())
+            else:
+                jids = (j for j in self._iter_bucket(bucket)
+                        if j.startswith(prefix))
+                total += sum(1 for _, s in self._iter_statuses(jids)
+                             if s is not None and (not status or s == status))
+        return total
+    # NOTE
+    # 1. Constant time. If the prefix matches whole buckets, e.g. tenant and
+    # service path, we read the counts. Otherwise, e.g. for a correlation
+    # ID, we've got to look at the bucket's IDs.
+
+    def recount(self, bucket: str) -> int:
+        """
+        Count a bucket's tasks by state and remove the IDs of tasks that
+        aren't in Redis anymore.
+
+        :param bucket: the bucket.
+        :return: how many IDs got removed.
+        """
+        counts = {s: 0 for s in STATUSES}
+        gone = []
+        for jid, status in self._iter_statuses(self._iter_bucket(bucket)):
+            if status is None:
+                gone.append(jid)
+            else:
+                counts[status] += 1
+
+        pipe = self._redis.pipeline()                               # (1)
+        if gone:
+            pipe.zrem(_bucket_key(bucket), *gone)
+        pipe.hset(_counts_key(bucket), mapping=counts)
+        pipe.execute()
+        return len(gone)
+    # NOTE
+    # 1. Races. Tasks enqueued or completed while we count could make the
+    # counts off by a few, until the next recount.
+
+    def prune(self) -> int:
+        """
+        Recount the tasks of each bucket, removing the IDs of jobs that
+        aren't in Redis anymore, as well as empty buckets.
+
+        :return: how many IDs got removed.
+        """
+        removed = 0
+        for bucket, _ in self._buckets(''):
+            removed += self.recount(bucket)
+            self._redis.eval(_DROP_IF_EMPTY, 3, BUCKETS_KEY,
+                             _bucket_key(bucket), _counts_key(bucket),
+                             bucket)
+        return removed
+
+    def rebuild(self, jids: Iterable[RqJobId]) -> int:
+        """
+        Add the given IDs to the index, using the enqueue time RQ recorded
+        for each job, e.g. to index jobs enqueued before we had an index.
+
+        :param jids: the IDs of the jobs to index.
+        :return: how many IDs got indexed.
+        """
+        jids = list(jids)
+        added, buckets = 0, set()
+        for k in range(0, len(jids), PAGE_SIZE):
+            batch = jids[k:k + PAGE_SIZE]
+            pipe = self._redis.pipeline(transaction=False)
+            for jid in batch:
+                pipe.hget(job_id_to_job_key(jid), 'enqueued_at')
+            replies = pipe.execute()
+
+            pipe = self._redis.pipeline()
+            for jid, when in zip(batch, replies):
+                if when:
+                    enqueued_at = utcparse(_decode(when)) \
+                        .replace(tzinfo=timezone.utc).timestamp()
+                    self._index(pipe, jid, enqueued_at)
+                    buckets.add(bucket_of(jid))
+                    added += 1
+            pipe.execute()
+        for bucket in buckets:
+            self.recount(bucket)
+        return added
+
+
+def task_index(queues: Optional[Iterable[Queue]] = None) -> TaskIndex:
+    """
+    Build the index of the tasks in the configured Redis.
+
+    :param queues: the queues whose registries tell the state of a task;
+        defaults to all the work queues.
+    :return: the index.
+    """
+    redis = redis_connection()
+    if queues is None:
+        queues = [Queue(n, connection=redis) for n in queue_names()]
+    return task_index_for(redis, queues)
+
+
+def task_index_for(redis: Redis, queues: Iterable[Queue]) -> TaskIndex:
+    """
+    :param redis: the Redis connection to use.
+    :param queues: the queues whose registries tell the state of a task.
+    :return: the index of the tasks in the given queues.
+    """
+    queues = list(queues)
+    return TaskIndex(redis,
+                     finished_keys=[q.finished_job_registry.key
+                                    for q in queues],
+                     failed_keys=[q.failed_job_registry.key for q in queues])
+
+
+def prune_task_index(index: TaskIndex, redis: Redis) -> int:
+    """
+    Prune the task index unless some other process did it less than
+    ``PRUNE_INTERVAL`` seconds ago.
+
+    :param index: the index to prune.
+    :param redis: the Redis connection to use.
+    :return: how many IDs got removed.
+    """
+    if not redis.set(PRUNE_LOCK_KEY, 1, nx=True, ex=PRUNE_INTERVAL):
+        return 0
+    return index.prune()
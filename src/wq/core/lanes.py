@@ -0,0 +1,280 @@
+"""
+Per-tenant lanes of a work queue.
+
+With a single list of pending tasks, a tenant pushing lots of tasks in
+one go, e.g. a backfill, starves all the others since their tasks wait
+behind the whole backlog. So when ``WQ_TENANT_QUEUES`` is on, we split
+the pending tasks of a queue into lanes, one Redis list for each tenant,
+i.e. for each distinct first element of the task ID, created on demand
+as tasks come in. Lanes only hold pending task IDs, the queue's job
+registries stay the same, so task management, retries and the task
+index work just as they do with a single list.
+
+Workers take turns at the lanes by smooth weighted round-robin, see
+``LaneScheduler``, so each tenant gets a share of the workers in
+proportion to its weight. RQ puts tasks it enqueues itself, e.g. tasks
+to retry, in the queue's own list, which workers treat as one more lane.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Type
+
+from rq import Queue
+
+from utils.b64 import from_b64_list
+from wq.core.cfg import tenant_queues
+
+
+LANE_SEP = ':lane:'
+LANES_KEY_PREFIX = 'ql:wq:lanes:'
+
+LANE_REFRESH_INTERVAL = 5
+"""Seconds between two lookups of the lanes workers take tasks from."""
+
+_DROP_IF_EMPTY = """
+if redis.call('llen', KEYS[2]) == 0 then
+    return redis.call('srem', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def lane_of(jid: str) -> str:
+    """
+    Figure out the lane of a task ID.
+
+    :param jid: the task ID.
+    :return: the first element of the ID.
+
+    Examples:
+
+        >>> lane_of('dA==:Lw==:Yw==:dQ==')
+        'dA=='
+
+        >>> lane_of('dQ==')
+        'dQ=='
+    """
+    return jid.split(':', 1)[0]
+
+
+def tenant_of(lane: str) -> Optional[str]:
+    """
+    Figure out the tenant of a lane.
+
+    :param lane: the lane.
+    :return: the tenant, assuming the lane holds ``CompositeTaskId``s whose
+        first element is the tenant, or ``None`` if the lane isn't a
+        ``CompositeTaskId`` element.
+
+    Examples:
+
+        >>> tenant_of('dA==')
+        't'
+
+        >>> tenant_of('""')
+        ''
+
+        >>> tenant_of('not b64!') is None
+        True
+    """
+    try:
+        return from_b64_list(lane)[0]
+    except Exception:
+        return None
+
+
+class LaneQueue(Queue):
+    """
+    RQ queue that keeps pending tasks in per-tenant lanes.
+
+    An instance with no lane stands for the whole queue: enqueueing a task
+    puts the task in its lane. An instance with a lane stands for that
+    lane: popping, removing or pushing back task IDs works on the lane.
+    """
+
+    def __init__(self, name: str = 'default', lane: Optional[str] = None,
+                 **kwargs):
+        super().__init__(name, **kwargs)
+        self.lane = lane
+        if lane is not None:
+            self._key = f"{self.key}{LANE_SEP}{lane}"
+
+    @classmethod
+    def from_queue_key(cls, queue_key, connection=None, **kwargs):
+        base_key, sep, lane = queue_key.partition(LANE_SEP)
+        if not sep:
+            return super().from_queue_key(queue_key, connection=connection,
+                                          **kwargs)
+        name = base_key[len(cls.redis_queue_namespace_prefix):]
+        return cls(name, lane=lane, connection=connection, **kwargs)
+    # NOTE. Dequeueing. RQ pops the job ID off one of the given list keys and
+    # then builds the queue from that key, so we get back the lane.
+
+    def _lanes_key(self) -> str:
+        return f"{LANES_KEY_PREFIX}{self.name}"
+
+    def lane_queue(self, lane: str) -> 'LaneQueue':
+        """
+        :param lane: the lane.
+        :return: the queue standing for the given lane of this queue.
+        """
+        return LaneQueue(self.name, lane=lane, connection=self.connection,
+                         job_class=self.job_class)
+
+    def push_job_id(self, job_id, pipeline=None, at_front=False):
+        if self.lane is not None:
+            return super().push_job_id(job_id, pipeline=pipeline,
+                                       at_front=at_front)
+        lane = self.lane_queue(lane_of(job_id))
+        connection = pipeline if pipeline is not None else self.connection
+        connection.sadd(self._lanes_key(), lane.lane)                 # (1)
+        return lane.push_job_id(job_id, pipeline=pipeline,
+                                at_front=at_front)
+    # NOTE
+    # 1. Lane set. RQ enqueues jobs through a transactional pipeline, so
+    # adding the lane to the set and the job ID to the lane is atomic and
+    # ``prune_lanes`` can't drop a lane with tasks in it.
+
+    def remove(self, job_or_id, pipeline=None):
+        if self.lane is not None:
+            return super().remove(job_or_id, pipeline=pipeline)
+        job_id = job_or_id.id if isinstance(job_or_id, self.job_class) \
+            else job_or_id
+        lane = self.lane_queue(lane_of(job_id))
+        if pipeline is not None:
+            lane.remove(job_id, pipeline=pipeline)
+            super().remove(job_id, pipeline=pipeline)
+            return
+        return lane.remove(job_id) + super().remove(job_id)
+
+    def lanes(self) -> List[str]:
+        """
+        :return: the lanes of this queue.
+        """
+        members = self.connection.smembers(self._lanes_key())
+        return sorted(m.decode('utf-8') for m in members)
+
+    def lane_queues(self) -> List['LaneQueue']:
+        """
+        :return: this queue followed by a queue for each of its lanes.
+        """
+        return [self] + [self.lane_queue(lane) for lane in self.lanes()]
+
+    def lane_counts(self) -> Dict[str, int]:
+        """
+        :return: how many tasks are waiting in each lane of this queue.
+        """
+        lanes = self.lanes()
+        pipe = self.connection.pipeline(transaction=False)
+        for lane in lanes:
+            pipe.llen(self.lane_queue(lane).key)
+        return dict(zip(lanes, pipe.execute()))
+
+    def shared_count(self) -> int:
+        """
+        :return: how many tasks are waiting in the queue's own list rather
+            than in a lane, e.g. tasks RQ queued again to retry them.
+        """
+        return self.connection.llen(self.key)
+
+    @property
+    def count(self):
+        if self.lane is not None:
+            return super().count
+        return self.shared_count() + sum(self.lane_counts().values())
+
+    def prune_lanes(self) -> int:
+        """
+        Forget about empty lanes.
+
+        :return: how many lanes got dropped.
+        """
+        dropped = 0
+        for lane in self.lanes():
+            dropped += self.connection.eval(
+                _DROP_IF_EMPTY, 2, self._lanes_key(),
+                self.lane_queue(lane).key, lane)
+        return dropped
+
+
+def work_queue_class() -> Type[Queue]:
+    """
+    :return: the RQ queue class to use, depending on whether tenants' tasks
+        should go into separate lanes, see ``tenant_queues``.
+    """
+    return LaneQueue if tenant_queues() else Queue
+
+
+class LaneScheduler:
+    """
+    Decide in which order a worker should look for tasks in the lanes of
+    the given queues, so each lane gets a share of the tasks workers run
+    in proportion to its weight. This is smooth weighted round-robin: each
+    lane has a credit and the worker looks at lanes in order of credit.
+    Every time the worker takes a task, each lane that could've had tasks
+    earns its weight and the lane the worker took the task from pays the
+    sum of what they earned. Unlike plain weighted round-robin, heavier
+    lanes don't get all their turns in a row.
+    """
+
+    def __init__(self, queues: Iterable[LaneQueue],
+                 weights: Callable[[Iterable[str]], Dict[str, int]]):
+        """
+        Create a new instance.
+
+        :param queues: the queues whose lanes to schedule.
+        :param weights: looks up the weight of the given tenants.
+        """
+        self._queues = list(queues)
+        self._weights = weights
+        self._lanes: List[LaneQueue] = []
+        self._lane_weights: Dict[str, int] = {}
+        self._credits: Dict[str, int] = {}
+        self._refreshed_at: Optional[float] = None
+
+    def refresh(self, now: float):
+        """
+        Look up the lanes and their weights again.
+
+        :param now: the current time in seconds.
+        """
+        lanes = [lane for q in self._queues for lane in q.lane_queues()]
+        tenants = {q.key: tenant_of(q.lane) for q in lanes
+                   if q.lane is not None}
+        weights = self._weights(t for t in tenants.values() if t is not None)
+        self._lanes = lanes
+        self._lane_weights = {q.key: weights.get(tenants.get(q.key), 1)
+                              for q in lanes}
+        self._credits = {q.key: self._credits.get(q.key, 0) for q in lanes}
+        self._refreshed_at = now
+
+    def order(self, now: float) -> List[LaneQueue]:
+        """
+        :param now: the current time in seconds.
+        :return: the lanes in the order the worker should look at them.
+        """
+        if self._refreshed_at is None or \
+                now - self._refreshed_at >= LANE_REFRESH_INTERVAL:
+            self.refresh(now)
+        return sorted(self._lanes, key=lambda q: -self._credits[q.key])
+
+    def served(self, lane: Queue, order: List[LaneQueue]):
+        """
+        Charge a lane for the task the worker took from it.
+
+        :param lane: the lane the worker took the task from.
+        :param order: the lanes in the order the worker looked at them.
+        """
+        keys = [q.key for q in order]
+        if lane.key not in keys:
+            return
+        eligible = keys[keys.index(lane.key):]                         # (1)
+        for k in eligible:
+            self._credits[k] += self._lane_weights[k]
+        self._credits[lane.key] -= sum(self._lane_weights[k]
+                                       for k in eligible)
+    # NOTE
+    # 1. Empty lanes. The worker takes the task from the first lane that
+    # has one, so the lanes before it were empty and earn nothing. Otherwise
+    # a lane would pile up credit while idle and then hog the workers when
+    # its tenant comes back. A lane after it that is empty too earns credit
+    # until it moves to the front, where it gets skipped and stops earning.
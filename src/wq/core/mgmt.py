@@ -9,11 +9,13 @@ from typing import Callable, Iterable, List, Optional
 from pydantic import BaseModel
 from rq.job import Job, JobStatus
 
+from wq.core.deletion import ProgressFn, TaskDeletionInfo, \
+    load_deletion, start_deletion
+from wq.core.index import TaskIndex, bucket_of, task_index
+from wq.core.lanes import LaneQueue, tenant_of
 from wq.core.task import WorkQ, _tasklet_from_rq_job, RqExcMan
-from wq.core.rqutils import RqJobId, find_job_ids, find_failed_job_ids, \
-    find_successful_job_ids, find_pending_job_ids, load_jobs, delete_jobs, \
-    starts_with_matcher, count_jobs, count_pending_jobs, count_failed_jobs, \
-    count_successful_jobs
+from wq.core.rqutils import RqJobId, load_jobs, purge_jobs, count_jobs, \
+    count_pending_jobs, count_failed_jobs, count_successful_jobs
 
 
 class TaskStatus(Enum):
@@ -75,19 +77,35 @@ class TaskInfo(BaseModel):
     input: BaseModel
 
 
-def _task_info_from_rq_job(j: Job) -> TaskInfo:
+class TenantBacklog(BaseModel):
+    """
+    How many tasks of a tenant are waiting in the work queue.
+    """
+    fiware_service: Optional[str]
+    """
+    The tenant, or ``None`` for tasks not queued by tenant, e.g. retries
+    or all tasks if tenant lanes are off.
+    """
+    queued: int
+
+
+def _task_runtime_info_from_rq_job(j: Job) -> TaskRuntimeInfo:
     tasklet = _tasklet_from_rq_job(j)
     status = _task_status_from_job_status(j.get_status())
     errors = [repr(e) for e in RqExcMan.list_exceptions(j)]
+    return TaskRuntimeInfo(
+        task_id=tasklet.task_id().id_repr(),
+        task_type=str(type(tasklet)),
+        status=status,
+        retries_left=j.retries_left,
+        errors=errors
+    )
+
+
+def _task_info_from_rq_job(j: Job) -> TaskInfo:
     return TaskInfo(
-        runtime=TaskRuntimeInfo(
-            task_id=tasklet.task_id().id_repr(),
-            task_type=str(type(tasklet)),
-            status=status,
-            retries_left=j.retries_left,
-            errors=errors
-        ),
-        input=tasklet.task_input()
+        runtime=_task_runtime_info_from_rq_job(j),
+        input=_tasklet_from_rq_job(j).task_input()
     )
 
 
@@ -98,27 +116,33 @@ class QMan:
 
     def __init__(self, q: WorkQ):
         self._q = q
-        self._pending_jid_finder = lambda m: find_pending_job_ids(q, m)
-        self._successful_jid_finder = lambda m: find_successful_job_ids(q, m)
-        self._failed_jid_finder = lambda m: find_failed_job_ids(q, m)
+        self._pending_jid_finder = self._status_jid_finder(
+            TaskStatus.PENDING)
+        self._successful_jid_finder = self._status_jid_finder(
+            TaskStatus.SUCCEEDED)
+        self._failed_jid_finder = self._status_jid_finder(
+            TaskStatus.FAILED)
+
+    def _index(self) -> TaskIndex:
+        return task_index([self._q])
+
+    def _status_jid_finder(self, status: TaskStatus) \
+            -> Callable[[str], Iterable[RqJobId]]:
+        return lambda prefix: self._index().find(prefix,           # (*)
+                                                 status=status.value)
+    # NOTE. Registry scans. We used to scan the RQ registries for matching
+    # job IDs, but when there are lots of jobs in a registry, it's quicker
+    # to look up the task IDs with the given prefix in the task index and
+    # check which ones are in the registries.
 
     @staticmethod
     def _load(jid_finder: Callable[[str], Iterable[RqJobId]],
               task_id_prefix: str) -> Iterable[TaskInfo]:
-        matcher = starts_with_matcher(task_id_prefix)
-        job_ids = jid_finder(matcher)
+        job_ids = jid_finder(task_id_prefix)
         js = load_jobs(job_ids)
         for j in js:
             yield _task_info_from_rq_job(j)
 
-    @staticmethod
-    def _count_tasks(jid_finder: Callable[[str], Iterable[RqJobId]],
-                     task_id_prefix: str) \
-            -> int:
-        matcher = starts_with_matcher(task_id_prefix)
-        job_ids = jid_finder(matcher)
-        return len(list(job_ids))
-
     @staticmethod
     def load_tasks(task_id_prefix: str) -> Iterable[TaskInfo]:
         """
@@ -129,7 +153,7 @@ class QMan:
         :param task_id_prefix: the task ID prefix to match.
         :return: a generator to iterate the matching tasks.
         """
-        return QMan._load(find_job_ids, task_id_prefix)
+        return QMan._load(task_index().find, task_id_prefix)
 
     @staticmethod
     def load_tasks_runtime_info(task_id_prefix: str) \
@@ -138,19 +162,68 @@ class QMan:
         Same as ``load_tasks`` but only return task runtime info without
         inputs.
         """
-        for t in QMan.load_tasks(task_id_prefix):
-            yield t.runtime
-
-    @staticmethod
-    def delete_tasks(task_id_prefix: str):
+        job_ids = task_index().find(task_id_prefix)
+        for j in load_jobs(job_ids):
+            yield _task_runtime_info_from_rq_job(j)        # (*)
+# NOTE. Task input. Tasks may only decode their input on demand, so we
+# don't touch it here.
+
+    def delete_tasks(self, task_id_prefix: str,
+                     progress: ProgressFn = lambda _: None) -> int:
         """
         Delete all the tasks with an ID having the same prefix as the input.
 
         :param task_id_prefix: the task ID prefix to match.
+        :param progress: gets called with how many tasks got deleted after
+            each batch of deletions.
+        :return: how many tasks got deleted.
+        """
+        index = self._index()
+        buckets = set()
+
+        def track(jid: RqJobId) -> RqJobId:
+            buckets.add(bucket_of(jid))
+            return jid
+
+        deleted = 0
+        job_ids = map(track, index.find(task_id_prefix))
+        for n in purge_jobs(self._q, job_ids):                     # (1)
+            deleted += n
+            progress(n)
+        for b in buckets:                                          # (2)
+            index.recount(b)
+        return deleted
+    # NOTE
+    # 1. Bulk deletion. We delete jobs in batches without loading them, so
+    # clearing a large backlog doesn't take ages.
+    # 2. Index clean up. Recounting removes the deleted IDs from the index
+    # and updates the counts in one go. We don't remove IDs as we go along
+    # since that would shift the index pages we're iterating.
+
+    def delete_tasks_in_background(self, task_id_prefix: str) \
+            -> TaskDeletionInfo:
+        """
+        Same as ``delete_tasks`` but run the deletion in the background.
+
+        :param task_id_prefix: the task ID prefix to match.
+        :return: the deletion's progress at the start. Use the deletion ID
+            to look up progress with ``load_deletion``.
+        """
+        total = self.count_all_tasks(task_id_prefix)
+        return start_deletion(
+            lambda progress: self.delete_tasks(task_id_prefix, progress),
+            total)
+
+    @staticmethod
+    def load_deletion(deletion_id: str) -> Optional[TaskDeletionInfo]:
+        """
+        Look up the progress of a background task deletion.
+
+        :param deletion_id: the ID of the deletion.
+        :return: the deletion's progress or ``None`` if there's no such
+            deletion.
         """
-        matcher = starts_with_matcher(task_id_prefix)
-        job_ids = find_job_ids(matcher)
-        delete_jobs(job_ids)
+        return load_deletion(deletion_id)
 
     def count_all_tasks(self, task_id_prefix: Optional[str]) -> int:
         """
@@ -163,7 +236,7 @@ class QMan:
         """
         if task_id_prefix is None:
             return count_jobs(self._q)
-        return self._count_tasks(find_job_ids, task_id_prefix)
+        return self._index().count(task_id_prefix)
 
     def count_pending_tasks(self, task_id_prefix: Optional[str]) -> int:
         """
@@ -176,7 +249,8 @@ class QMan:
         """
         if task_id_prefix is None:
             return count_pending_jobs(self._q)
-        return self._count_tasks(self._pending_jid_finder, task_id_prefix)
+        return self._index().count(task_id_prefix,
+                                   TaskStatus.PENDING.value)
 
     def count_successful_tasks(self, task_id_prefix: Optional[str]) -> int:
         """
@@ -190,7 +264,8 @@ class QMan:
         """
         if task_id_prefix is None:
             return count_successful_jobs(self._q)
-        return self._count_tasks(self._successful_jid_finder, task_id_prefix)
+        return self._index().count(task_id_prefix,
+                                   TaskStatus.SUCCEEDED.value)
 
     def count_failed_tasks(self, task_id_prefix: Optional[str]) -> int:
         """
@@ -203,7 +278,8 @@ class QMan:
         """
         if task_id_prefix is None:
             return count_failed_jobs(self._q)
-        return self._count_tasks(self._failed_jid_finder, task_id_prefix)
+        return self._index().count(task_id_prefix,
+                                   TaskStatus.FAILED.value)
 
     def load_pending_tasks(self, task_id_prefix: str) -> Iterable[TaskInfo]:
         """
@@ -240,3 +316,21 @@ class QMan:
         :return: a generator to iterate the matching tasks.
         """
         return self._load(self._failed_jid_finder, task_id_prefix)
+
+    def tenant_backlog(self) -> List[TenantBacklog]:
+        """
+        Count the tasks waiting to be picked up by a worker, for each
+        tenant that has its own lane in the work queue, see ``LaneQueue``.
+
+        :return: the tenant backlogs, starting with the tasks not queued
+            by tenant.
+        """
+        if not isinstance(self._q, LaneQueue):
+            return [TenantBacklog(fiware_service=None, queued=self._q.count)]
+
+        backlog = [TenantBacklog(fiware_service=None,
+                                 queued=self._q.shared_count())]
+        for lane, count in self._q.lane_counts().items():
+            backlog.append(TenantBacklog(fiware_service=tenant_of(lane),
+                                         queued=count))
+        return backlog
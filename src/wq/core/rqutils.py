@@ -2,7 +2,7 @@ from itertools import chain
 from typing import Iterable
 
 from rq import Queue
-from rq.job import Job
+from rq.job import Job, JobStatus
 
 from utils.itersplit import IterCostSplitter
 from wq.core.cfg import redis_connection
@@ -289,18 +289,46 @@ def load_jobs(job_ids: Iterable[RqJobId]) -> Iterable[Job]:
 # endpoint, retention TTL expiry, etc.
 
 
-def delete_jobs(job_ids: Iterable[RqJobId]):
+def purge_jobs(q: Queue, job_ids: Iterable[RqJobId],
+               batch_size: int = 500) -> Iterable[int]:
     """
-    Delete the specified RQ jobs.
+    Delete the specified RQ jobs of the given queue in batches, without
+    loading them.
 
+    :param q: the queue the jobs belong to.
     :param job_ids: the RQ job IDs of the jobs to delete.
+    :param batch_size: how many jobs to delete with each Redis round trip.
+    :return: an generator object to iterate how many jobs got deleted in
+        each batch. The jobs get deleted as the consumer iterates it.
     """
-    for job in load_jobs(job_ids):
-        job.delete()
+    redis = redis_connection()
+    registries = [q.started_job_registry, q.deferred_job_registry,
+                  q.scheduled_job_registry, q.finished_job_registry,
+                  q.failed_job_registry]
+    splitter = IterCostSplitter(cost_fn=lambda _: 1,
+                                batch_max_cost=batch_size)
+
+    for jid_batch_iter in splitter.iter_batches(job_ids):
+        jid_batch = list(jid_batch_iter)
+        pipe = redis.pipeline(transaction=False)
+        for jid in jid_batch:
+            pipe.hget(job_id_to_job_key(jid), 'status')
+        statuses = pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        for jid, status in zip(jid_batch, statuses):
+            if status == JobStatus.QUEUED.value.encode('utf-8'):      # (1)
+                q.remove(jid, pipeline=pipe)
+            key = job_id_to_job_key(jid)
+            pipe.delete(key, f"{key}:dependents")                     # (2)
+        for r in registries:
+            pipe.zrem(r.key, *jid_batch)
+        pipe.execute()
+
+        yield sum(1 for s in statuses if s is not None)
 # NOTE.
-# 1. Algorithmic efficiency. Awful? But for now we're assuming this function
-# only ever gets called with a handful of job IDs in situations where some
-# manual clean up is needed. Normally, you'd let RQ take care of job life-cycle
-# by setting suitable TTLs.
-# 2. Queue clean up. The delete method takes care of removing the job from
-# its queue and associated registries---have a look at the implementation.
+# 1. Queue clean up. Removing a job ID from the queue list takes time
+# proportional to the queue length, so we only do that for queued jobs.
+# The queue knows which list holds the job, e.g. its lane, see ``LaneQueue``.
+# 2. Job keys. Same keys ``Job.delete`` removes. We don't use job
+# dependencies, so there's no dependents sets of other jobs to update.
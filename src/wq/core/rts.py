@@ -6,18 +6,54 @@ for QL ``Tasklet``s to be executed as RQ jobs, which is why we've got
 the wrapper functions in this module.
 """
 
-from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
 import os
-from time import sleep
-from typing import Optional
+from threading import BoundedSemaphore
+from time import sleep, time
+from typing import Callable, List, Optional
 
+from redis.exceptions import ConnectionError
 from rq import Queue, SimpleWorker, Worker
+from rq.exceptions import DequeueTimeout, NoSuchJobError
 from rq.job import Job
+from rq.registry import FailedJobRegistry
+from rq.defaults import DEFAULT_WORKER_TTL
+from rq.timeouts import JobTimeoutException, TimerDeathPenalty
+from rq.utils import utcnow
+from rq.worker import StopRequested, WorkerStatus
 
-from server.telemetry.monitor import Monitor
-from wq.core.cfg import queue_names, redis_connection, log_level
-from wq.core.mgmt import _task_info_from_rq_job
-from wq.core.task import RqExcMan
+from server.telemetry.monitor import Monitor, record
+from wq.core.cfg import queue_names, redis_connection, log_level, \
+    max_workers, merge_max_tasks, scale_up_latency, tenant_queues, \
+    tenant_weights, worker_threads
+from wq.core.index import FAILED, SUCCEEDED, TaskIndex, \
+    prune_task_index, task_index_for
+from wq.core.lanes import LANE_REFRESH_INTERVAL, LaneQueue, LaneScheduler, \
+    work_queue_class
+from wq.core.mgmt import _task_runtime_info_from_rq_job
+from wq.core.supervisor import WorkerSupervisor
+from wq.core.task import RqExcMan, _tasklet_from_rq_job
+
+
+MERGED_TASKS_LABEL = 'wq merged tasks'
+
+MERGE_SCAN_FACTOR = 10
+"""
+How far down the queue to look for tasks to merge, as a multiple of the
+max number of tasks to merge.
+"""
+
+THREAD_WAIT_INTERVAL = 1
+"""
+Seconds between two heartbeats of a worker waiting for one of its task
+threads to become free.
+"""
+
+
+def log():
+    return logging.getLogger(__name__)
 
 
 # NOTE (Running RQ Workers)
@@ -46,10 +82,321 @@ from wq.core.task import RqExcMan
 # the main process thread.
 
 
-class TelemetryWorker(SimpleWorker):
+class MergingWorker(SimpleWorker):
+    """
+    Extend RQ ``SimpleWorker`` to run pending tasks together with the task
+    at hand when they can be merged, see ``Tasklet.merge_key``. The worker
+    takes mergeable tasks off the queue, up to ``max_merged_tasks`` in
+    total, and runs the merged task. If that succeeds, each task goes to
+    the finished registry as if it had run on its own. Otherwise the worker
+    runs each task on its own, so each task gets retried or ends up in the
+    failed registry independently of the others.
+
+    The worker also keeps the task index counts up to date as tasks
+    succeed or fail, see ``TaskIndex``.
+
+    If given ``lane_weights``, the worker takes turns at the tenant lanes
+    of its ``LaneQueue``s, see ``LaneScheduler``.
+
+    If given ``max_threads`` greater than one, the worker runs up to that
+    many tasks at the same time, each in a thread of a pool. The main
+    thread keeps on fetching tasks as long as there's a free thread. Each
+    thread runs a task just like ``SimpleWorker`` would, so RQ retries and
+    ``RqExcMan`` work as usual, and keeps its own DB connections, see
+    ``ConnectionManager``. RQ's ``TimerDeathPenalty`` enforces the job
+    timeout in each thread since only the main thread gets ``SIGALRM``.
+    On shutdown, the worker waits for the tasks at hand to finish, unless
+    it's a cold shutdown.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.max_merged_tasks = kwargs.pop('max_merged_tasks', 1)
+        lane_weights = kwargs.pop('lane_weights', None)
+        max_threads = kwargs.pop('max_threads', 1)
+        super().__init__(*args, **kwargs)
+        self.lanes = LaneScheduler(self.queues, lane_weights) \
+            if lane_weights else None
+
+        self._executor = None
+        self._threads = None
+        self._cold_shutdown = False
+        if max_threads > 1:
+            self._executor = ThreadPoolExecutor(
+                max_threads, thread_name_prefix='ql-wq-task')
+            self._threads = BoundedSemaphore(max_threads)
+            self.death_penalty_class = TimerDeathPenalty
+
+    def clean_registries(self):
+        super().clean_registries()
+        try:
+            index = task_index_for(self.connection, self.queues)
+            removed = prune_task_index(index, self.connection)        # (1)
+            if removed:
+                log().info(f"Removed {removed} expired tasks from index")
+        except Exception:
+            log().exception("Task index clean up failed")
+        try:
+            for q in self.queues:
+                if isinstance(q, LaneQueue):
+                    q.prune_lanes()                                    # (2)
+        except Exception:
+            log().exception("Lane clean up failed")
+    # NOTE
+    # 1. Task index. RQ calls this method at regular intervals to get rid
+    # of expired jobs in its registries, so it's a good time to get rid of
+    # expired jobs in our index too. Pruning also recounts tasks, which
+    # corrects any drift in the index counts.
+    # 2. Lanes. Ditto for lanes of tenants that have had no tasks queued
+    # since the last clean up, so workers stop looking at them.
+
+    def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+        if self._threads is None:
+            return self._dequeue(timeout, max_idle_time)
+
+        while not self._threads.acquire(timeout=THREAD_WAIT_INTERVAL):
+            self.heartbeat()
+            if self._stop_requested:                                   # (1)
+                raise StopRequested()
+        result = None
+        try:
+            result = self._dequeue(timeout, max_idle_time)
+        finally:
+            if result is None:
+                self._threads.release()
+        return result
+    # NOTE
+    # 1. Warm shutdown. RQ only stops the worker straight away when it's
+    # idle, otherwise it waits for the task at hand to finish. With threads
+    # though, the main thread could wait for a while, so we stop right away
+    # and let ``register_death`` wait for the running tasks instead.
+
+    def execute_job(self, job, queue):
+        if self._executor is None:
+            return super().execute_job(job, queue)
+        self._executor.submit(self._execute_in_thread, job, queue)
+
+    def _execute_in_thread(self, job, queue):
+        try:
+            self.perform_job(job, queue)
+        except Exception:                                              # (1)
+            log().exception(f"Failed to run task {job.id}")
+        finally:
+            self._threads.release()
+    # NOTE
+    # 1. Book keeping errors. ``perform_job`` deals with task errors, so we
+    # only get here if RQ couldn't update the job, e.g. Redis went down. In
+    # the main thread, that'd stop the worker, but here nobody would notice.
+
+    def request_force_stop(self, signum, frame):
+        self._cold_shutdown = True
+        super().request_force_stop(signum, frame)
+
+    def register_death(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=not self._cold_shutdown)
+        super().register_death()
+
+    def _dequeue(self, timeout, max_idle_time):
+        if self.lanes is None:
+            return super().dequeue_job_and_maintain_ttl(timeout,
+                                                        max_idle_time)
+
+        self.set_state(WorkerStatus.IDLE)
+        self.procline('Listening on ' + ','.join(self.queue_names()))
+        wait = None if timeout is None else \
+            max(1, min(timeout, LANE_REFRESH_INTERVAL))                # (1)
+        connection_wait_time = 1.0
+        idle_since = utcnow()
+        idle_time_left = max_idle_time
+        result = None
+        while True:
+            try:
+                self.heartbeat()
+                if self.should_run_maintenance_tasks:
+                    self.run_maintenance_tasks()
+
+                if wait is not None and idle_time_left is not None:
+                    wait = min(wait, idle_time_left)                   # (2)
+                lanes = self.lanes.order(time())
+                result = self.queue_class.dequeue_any(                 # (3)
+                    lanes, wait, connection=self.connection,
+                    job_class=self.job_class, serializer=self.serializer,
+                    death_penalty_class=self.death_penalty_class)
+                if result is not None:
+                    job, queue = result
+                    self.lanes.served(queue, lanes)
+                    job.redis_server_version = \
+                        self.get_redis_server_version()
+                    self.log.info('%s: %s', queue.name, job.id)
+                break
+            except DequeueTimeout:
+                if max_idle_time is not None:
+                    idle_for = (utcnow() - idle_since).total_seconds()
+                    idle_time_left = math.ceil(max_idle_time - idle_for)
+                    if idle_time_left <= 0:
+                        break
+            except ConnectionError as e:
+                self.log.error(f"Could not connect to Redis: {e}, " +
+                               f"retrying in {connection_wait_time} secs")
+                sleep(connection_wait_time)
+                connection_wait_time = min(
+                    connection_wait_time * self.exponential_backoff_factor,
+                    self.max_connection_wait_time)
+            else:
+                connection_wait_time = 1.0
+
+        self.heartbeat()
+        return result
+    # NOTE
+    # 1. New lanes. A blocking pop only watches the lanes we knew about when
+    # we started waiting, so we stop waiting every now and then to pick up
+    # lanes of tenants that started queueing tasks since. In burst mode,
+    # RQ passes no timeout and we pop without waiting, just like RQ does.
+    # 2. Idle workers. If RQ gives us a max idle time, we return nothing
+    # once the worker has been waiting that long, so RQ stops the worker.
+    # 3. Dequeueing. Same as RQ's own implementation, except we go through
+    # the lanes in the order the scheduler tells us instead of going through
+    # the worker's queues in a fixed order.
+
+    def handle_job_success(self, job, queue, started_job_registry):
+        super().handle_job_success(job, queue, started_job_registry)
+        self._record_outcome(job, SUCCEEDED)                           # (1)
+
+    def handle_exception(self, job, *exc_info):
+        super().handle_exception(job, *exc_info)
+        failed = FailedJobRegistry(job.origin, connection=self.connection,
+                                   job_class=self.job_class)
+        if job.id in failed:                                           # (2)
+            self._record_outcome(job, FAILED)
+    # NOTE
+    # 1. Worker hooks. RQ's ``on_success`` and ``on_failure`` job callbacks
+    # won't do here. They're set on each job when enqueueing it, so tasks
+    # queued by an older QuantumLeap would never get counted. RQ runs them
+    # in ``perform_job``, which merged runs skip. And ``on_failure`` runs
+    # after every failed run, before RQ decides whether to retry the task.
+    # 2. Retries. RQ calls ``handle_exception`` after every failed run, but
+    # the task only failed for good if it ended up in the failed registry,
+    # either because there are no retries left or ``RqExcMan`` stopped it.
+
+    def _record_outcome(self, job: Job, status: str):
+        try:
+            TaskIndex(self.connection).record_outcome(job.id, status)
+        except Exception:                                              # (1)
+            log().exception(f"Failed to count {status} task {job.id}")
+    # NOTE
+    # 1. Counts. We'd rather have the counts drift until the next prune than
+    # mess up RQ's book keeping.
+
+    def perform_job(self, job, queue, *args, **kwargs):
+        jobs = [job] + self._claim_mergeable_jobs(job, queue)
+        if len(jobs) == 1:
+            return super().perform_job(job, queue, *args, **kwargs)
+        return self._perform_merged_jobs(jobs, queue)
+
+    def _claim_mergeable_jobs(self, job: Job, queue: Queue) -> List[Job]:
+        if self.max_merged_tasks <= 1:
+            return []
+        key = _tasklet_from_rq_job(job).merge_key()
+        if not key:
+            return []
+
+        claimed = []
+        scan_size = self.max_merged_tasks * MERGE_SCAN_FACTOR
+        for jid in queue.get_job_ids(0, scan_size):
+            if len(claimed) + 1 >= self.max_merged_tasks:
+                break
+            if not jid.startswith(key) or jid == job.id:
+                continue
+            if not queue.remove(jid):                                   # (1)
+                continue
+            try:
+                other = self.job_class.fetch(jid, connection=self.connection)
+            except NoSuchJobError:                                      # (2)
+                continue
+            if _tasklet_from_rq_job(other).merge_key() != key:          # (3)
+                queue.push_job_id(jid, at_front=True)
+                continue
+            claimed.append(other)
+        return claimed
+    # NOTE
+    # 1. Races. Other workers could be after the same job. Removing the job
+    # ID from the queue is atomic, so only one worker gets to claim it.
+    # 2. Deleted jobs. The job got deleted after we listed the queue, e.g.
+    # through the task management API.
+    # 3. Paranoia. Only tasks with the same merge key should have IDs that
+    # start with the key. If not, we put the job back where it was.
+
+    def _perform_merged_jobs(self, jobs: List[Job], queue: Queue) -> bool:
+        tasks = [_tasklet_from_rq_job(j) for j in jobs]
+        timeout = _merged_timeout(jobs, self.queue_class.DEFAULT_TIMEOUT)
+        for j in jobs:
+            dequeued = j is jobs[0] and len(self.queues) == 1          # (1)
+            self.prepare_job_execution(
+                j, remove_from_intermediate_queue=dequeued)
+            j.started_at = utcnow()
+        self._heartbeat_merged_jobs(jobs, timeout)                     # (2)
+        try:
+            with self.death_penalty_class(timeout, JobTimeoutException,
+                                          job_id=jobs[0].id):          # (3)
+                tasks[0].merge(tasks[1:]).run()
+        except Exception as e:
+            log().warning(f"Merged run of {len(jobs)} tasks failed, " +
+                          f"running each task on its own: {e!r}")
+            succeeded = True
+            for j in jobs:                                             # (4)
+                succeeded = super().perform_job(j, queue) and succeeded
+            return succeeded
+
+        for j in jobs:
+            j.ended_at = utcnow()
+            j._result = None
+            self.handle_job_success(job=j, queue=queue,
+                                    started_job_registry=queue
+                                    .started_job_registry)
+        record(MERGED_TASKS_LABEL, len(jobs))
+        return True
+    # NOTE
+    # 1. Intermediate queue. With a single queue, RQ moves the job it pops
+    # to an intermediate list until the job gets started, and its clean up
+    # fails any job left there, so we take out the job the worker dequeued
+    # just like ``perform_job`` does. Claimed jobs never went through that
+    # list since we took them off the queue ourselves.
+    # 2. Abandoned jobs. RQ sets each job's heartbeat to last about as long
+    # as the job's own timeout. If the merged run took longer than that,
+    # RQ's clean up in other workers would fail the jobs while they're still
+    # running, so we stretch the heartbeats to the merged run's timeout.
+    # 3. Timeout. The merged run does the work of all the tasks, so it gets
+    # the sum of their timeouts, or no limit if any of them has none. When
+    # it times out, e.g. because a DB call hangs, it fails like any merged
+    # run that raised: each task runs again on its own, with its own
+    # timeout.
+    # 4. Per-task book keeping. Running each task through ``perform_job``
+    # means the usual RQ retries and our exception handler kick in for
+    # each failed task, while the others succeed. Keep in mind the merged
+    # insert could've inserted some of the entities before failing, in
+    # which case those entities get inserted again, just as they would if
+    # the failed task got retried.
+
+    def _heartbeat_merged_jobs(self, jobs: List[Job], timeout: int):
+        ttl = DEFAULT_WORKER_TTL if timeout == -1 else timeout + 60
+        with self.connection.pipeline() as pipe:
+            self.heartbeat(ttl, pipeline=pipe)
+            for j in jobs:
+                j.heartbeat(utcnow(), ttl, pipeline=pipe)
+            pipe.execute()
+
+
+def _merged_timeout(jobs: List[Job], default_timeout: int) -> int:
+    timeouts = [j.timeout or default_timeout for j in jobs]
+    if -1 in timeouts:
+        return -1
+    return sum(timeouts)
+
+
+class TelemetryWorker(MergingWorker):
     """
-    Extend RQ ``Worker`` to collect task duration samples using QuantumLeap
-    telemetry framework.
+    Extend ``MergingWorker`` to collect task duration samples using
+    QuantumLeap telemetry framework.
     """
 
     @staticmethod
@@ -61,39 +408,54 @@ class TelemetryWorker(SimpleWorker):
     def __init__(self, *args, **kwargs):
         monitoring_dir = kwargs.pop('monitoring_dir')
         self.monitor = self._new_monitor(monitoring_dir)
-        self.duration_sample_id = ''
         super().__init__(*args, **kwargs)
 
     def register_birth(self):
         os.makedirs(self.monitor.monitoring_dir(), exist_ok=True)
         super().register_birth()
 
-    def execute_job(self, job, queue):
-        task_info = _task_info_from_rq_job(job)
-        key = f"task: {task_info.runtime.task_type}"
-        self.duration_sample_id = self.monitor.start_duration_sample()
+    def perform_job(self, job, queue, *args, **kwargs):
+        runtime_info = _task_runtime_info_from_rq_job(job)
+        key = f"task: {runtime_info.task_type}"
+        sample_id = self.monitor.start_duration_sample()               # (1)
         try:
-            super().execute_job(job, queue)
+            return super().perform_job(job, queue, *args, **kwargs)
         finally:
-            self.monitor.stop_duration_sample(key, self.duration_sample_id)
+            self.monitor.stop_duration_sample(key, sample_id)
+    # NOTE
+    # 1. Threads. We time ``perform_job`` rather than ``execute_job`` since
+    # with ``max_threads`` the latter only hands the task over to a thread.
+    # Each thread keeps its own sample ID; the monitor is thread-safe.
 
     def register_death(self):
+        super().register_death()                                       # (1)
         self.monitor.stop()
-        super().register_death()
+    # NOTE
+    # 1. Running tasks. Stop the monitor only after the tasks still running
+    # in other threads are done, so their samples get flushed too.
+
+
+def _lane_weights() -> Optional[Callable]:
+    return tenant_weights if tenant_queues() else None
 
 
-def _new_rq_worker() -> Worker:
-    return SimpleWorker(queues=queue_names(),
-                        connection=redis_connection(),
-                        queue_class=Queue,                              # (1)
-                        job_class=Job,                                  # (2)
-                        exception_handlers=[RqExcMan.exc_handler])      # (3)
+def _new_rq_worker(max_threads: int = 1) -> Worker:
+    return MergingWorker(max_merged_tasks=merge_max_tasks(),
+                         lane_weights=_lane_weights(),
+                         max_threads=max_threads,
+                         queues=queue_names(),
+                         connection=redis_connection(),
+                         queue_class=work_queue_class(),                # (1)
+                         job_class=Job,                                 # (2)
+                         exception_handlers=[RqExcMan.exc_handler])     # (3)
 # NOTE
-# 1. We're relying on the default Queue class in our code, so this is just
-# a reminder not to use a custom class which vanilla RQ lets you do.
-# Technically not needed since if not given or set to None, the Worker
-# will default it to Worker.queue_class which happens to be rq.Queue.
-# 2. Ditto for the Job class.
+# 1. Workers must use the same Queue class ``Tasklet.work_queue`` uses to
+# add tasks, i.e. rq.Queue or, with per-tenant lanes, our ``LaneQueue``
+# which reads tasks from the lanes too. So don't use any other custom
+# class which vanilla RQ lets you do.
+# 2. We're relying on the default Job class in our code, so this is just
+# a reminder not to use a custom class. Technically not needed since if
+# not given or set to None, the Worker will default it to rq.Job.
 # 3. We install only one exception handler to manage retries since RQ
 # doesn't let you easily bail out of a retry cycle. In fact, if you've
 # got n retries, then RQ will retry the task n times, but on catching
@@ -104,11 +466,15 @@ def _new_rq_worker() -> Worker:
 # name will be a GUID, see __init__.
 
 
-def _new_telemetry_worker(monitoring_dir: str) -> Worker:
+def _new_telemetry_worker(monitoring_dir: str,
+                          max_threads: int = 1) -> Worker:
     return TelemetryWorker(monitoring_dir=monitoring_dir,
+                           max_merged_tasks=merge_max_tasks(),
+                           lane_weights=_lane_weights(),
+                           max_threads=max_threads,
                            queues=queue_names(),
                            connection=redis_connection(),
-                           queue_class=Queue,                            # (1)
+                           queue_class=work_queue_class(),               # (1)
                            job_class=Job,                                # (2)
                            exception_handlers=[RqExcMan.exc_handler])    # (3)
 # NOTE. See notes (1), (2), (3) above.
@@ -116,11 +482,12 @@ def _new_telemetry_worker(monitoring_dir: str) -> Worker:
 
 def _start_worker(burst_mode: bool = False,
                   max_tasks: Optional[int] = None,
-                  monitoring_dir: Optional[str] = None):
+                  monitoring_dir: Optional[str] = None,
+                  threads: int = 1):
     if monitoring_dir:
-        w = _new_telemetry_worker(monitoring_dir)
+        w = _new_telemetry_worker(monitoring_dir, threads)
     else:
-        w = _new_rq_worker()
+        w = _new_rq_worker(threads)
     w.work(with_scheduler=True,          # (1)
            burst=burst_mode,             # (2)
            max_jobs=max_tasks,           # (3)
@@ -137,105 +504,39 @@ def _start_worker(burst_mode: bool = False,
 # forward we could change some, e.g. the log format.
 
 
-class WorkerPool:
-
-    def __init__(self, pool_size: int,
-                 burst_mode: bool = False,
-                 max_tasks: Optional[int] = None,
-                 monitoring_dir: Optional[str] = None):
-        self.pool_size = pool_size
-        self.burst_mode = burst_mode
-        self.max_tasks = max_tasks
-        self.monitoring_dir = monitoring_dir
-
-    def _run_worker(self, _):    # (*)
-        _start_worker(self.burst_mode, self.max_tasks, self.monitoring_dir)
-# NOTE. Dummy arg.
-# Proc pool's map needs a function w/ one arg, otherwise it'll bomb out.
-
-    def start(self):
-        with Pool(processes=self.pool_size) as p:                     # (1)
-            while True:                                               # (2)
-                try:
-                    p.map(self._run_worker, range(self.pool_size))    # (3)
-                except Exception as e:
-                    print(e)
-
-                if self.burst_mode:                                   # (4)
-                    sleep(1)
-# NOTE
-# 1. Self-healing. Unless both burst_mode=False and max_tasks=None, Workers
-# will exit after a while. So we avoid RQ workers running for too long and
-# perhaps leaking resources. (Possibly not needed since the RQ code seems
-# solid, so potentially you could keep the Workers going forever w/o any
-# trouble.) Plus, Pool does some book keeping to avoid leaking resources,
-# have a look at the docs. But consider setting ``maxtasksperchild`` to make
-# sure to replace pool processes w/ fresh ones after a while. (Need to think
-# about how that'd gel w/ boost mode and max tasks though...)
-# 2. Exit. If you kill the main process, the pool should catch the kill signal
-# and send a sigint to the RQ workers in the pool. Since Worker installs signal
-# handlers, we should exit gracefully. At least that's the theory. I haven't
-# tested this properly. In particular, we should test the case when Worker
-# processes keep on looping forever, i.e. burst_mode=False and max_tasks=None.
-# Is the above set up going to guarantee a clean exit in all cases? Or could
-# we wind up with orphan/zombie processes?! Maybe worth coding this explicitly
-# with `atexit` clean up to reap Workers...
-# 3. Forking efficiency. The pool won't fork new processes on every call to
-# map, but reuse existing processes. If a process in the pool dies, then a
-# new one will replace it. This is essential for running in burst mode where
-# you definitely don't want to fork new processes every time a Worker exits
-# since that could happen every second if the queue is empty! Use e.g.
-# `htop -F python -t` or `pstree -s python` after starting WQ w/ a pool to
-# see what's actually going on. (Even with an empty queue and burst_mode=True
-# you should still see the same processes being kept around for a long while.)
-# But consider using: mp.set_start_method('forkserver')
-# 4. Empty queue. When in burst mode, Workers drain the queues and then exit.
-# So we wait a bit before getting back in the loop since we know the queue is
-# empty right now.
-
-
 def start(pool_size: Optional[int] = None,
           burst_mode: bool = False,
           max_tasks: Optional[int] = None,
-          monitoring_dir: Optional[str] = None):
-    if pool_size is None or pool_size <= 1:
-        _start_worker(burst_mode, max_tasks, monitoring_dir)    # (1)
-    else:
-        wp = WorkerPool(pool_size, burst_mode, max_tasks, monitoring_dir)
-        wp.start()                                              # (2)
+          monitoring_dir: Optional[str] = None,
+          max_pool_size: Optional[int] = None,
+          warm_up: Callable[[], None] = lambda: None,
+          threads: Optional[int] = None):
+    min_workers = pool_size or 1
+    if max_pool_size is None:
+        max_pool_size = max_workers()
+    if threads is None:
+        threads = worker_threads()
+    if max(min_workers, max_pool_size) <= 1:
+        _start_worker(burst_mode, max_tasks, monitoring_dir, threads)  # (1)
+        return
+
+    supervisor = WorkerSupervisor(                              # (2)
+        start_worker=lambda: _start_worker(burst_mode, max_tasks,
+                                           monitoring_dir, threads),
+        min_workers=min_workers,
+        max_workers=max_pool_size,
+        queue_names=queue_names(),
+        redis_connection=redis_connection,
+        scale_up_latency=scale_up_latency(),
+        burst_mode=burst_mode,
+        warm_up=warm_up)
+    supervisor.run()
 # NOTE
 # 1. RQ compat mode. For all intents and purposes, this is equivalent to
 # starting QuantumLeap WQ with the ``rq worker --with-scheduler`` command
 # and possibly passing in burst mode and/or max jobs.
-# 2. Parallelism. Still experimental, only use for testing. In fact, funnily
-# enough, if you start two worker processes and then kill the main process:
-#
-#   $ python wq up -w 2
-#   09:51:48 Worker rq:worker:d0... started...
-#   09:51:48 Subscribing to channel rq:pubsub:d0...
-#   09:51:48 Worker rq:worker:d3... started...
-#   09:51:48 Subscribing to channel rq:pubsub:d3...
-#   09:51:48 *** Listening on default...
-#   09:51:48 *** Listening on default...
-#   09:51:48 Trying to acquire locks for default
-#   09:51:48 Trying to acquire locks for default
-#
-# Now kill the the process (^C)
-#
-#    ^CProcess SpawnPoolWorker-1:
-#    09:51:59 Warm shut down requested
-#    09:51:59 Cold shut down
-#
-# It still hangs though. Kill again (^C)
-#
-#   ^C09:52:32 Cold shut down
-#
-#   Aborted!
-#
-# Signals not properly forwarded by the pool? Also, why the "Cold shut down"?
-# This is the result of Worker calling request_force_stop which should only
-# happen if Worker gets two ^C in a row. In fact, if you run ``rq worker``
-# and kill it, you'll only see a "Warm shut down requested". Go figure!
-# See note (2) above about pool exit. Also make sure dead Worker hashes
-# get removed from Redis eventually, which they should since there's a
-# 1 min TTL on the hash if memory serves---look at the RQ source.
+# 2. Parallelism. The supervisor forks ``pool_size`` workers and scales
+# up to ``max_pool_size`` workers, see ``WorkerSupervisor``. Each worker
+# exits after ``max_tasks`` tasks if given, in which case the supervisor
+# replaces it with a fresh one. On top of that, each worker runs up to
+# ``threads`` tasks at the same time, see ``MergingWorker``.
@@ -0,0 +1,297 @@
+"""
+Supervisor of a pool of work queue worker processes.
+
+The supervisor warms up first, i.e. imports the modules tasks need, and
+then forks the workers, so each worker starts out with the parent's
+memory rather than loading everything again. Workers run in their own
+process group, so a ^C on the terminal only reaches the supervisor which
+then asks each worker to shut down exactly once. (RQ takes a second
+signal to mean cold shut down.)
+
+The supervisor replaces workers that exit, either because they crashed
+or because they reached their max number of tasks, and scales the number
+of workers between a min and a max. Every ``SCALE_INTERVAL`` seconds, it
+looks at how many tasks are queued and how long the oldest one has been
+waiting: if the wait is longer than the configured latency, it adds a
+worker; if the queue is empty, it retires a worker. On SIGTERM or SIGINT,
+the supervisor asks all the workers to finish the task at hand and exit,
+then kills any worker still around after ``SHUTDOWN_TIMEOUT`` seconds.
+"""
+
+from datetime import timezone
+import logging
+import os
+import signal
+import sys
+from time import sleep, time
+from typing import Callable, Dict, List, NamedTuple
+
+from redis import Redis
+from rq import Queue
+from rq.utils import utcparse
+
+from wq.core.lanes import LaneQueue, work_queue_class
+from wq.core.rqutils import job_id_to_job_key
+
+
+POLL_INTERVAL = 1
+"""Seconds between two checks on the worker processes."""
+
+SCALE_INTERVAL = 10
+"""Min number of seconds between two changes in the number of workers."""
+
+SHUTDOWN_TIMEOUT = 30
+"""Seconds workers have to shut down before the supervisor kills them."""
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+class QueueStats(NamedTuple):
+    depth: int
+    """How many tasks are waiting in the queues."""
+    latency: float
+    """How many seconds the oldest queued task has been waiting."""
+
+
+def queue_stats(redis: Redis, queues: List[Queue]) -> QueueStats:
+    """
+    Measure how many tasks are waiting in the given queues and for how
+    long.
+
+    :param redis: the Redis connection to use.
+    :param queues: the queues to look at.
+    :return: the queue stats.
+    """
+    depth, latency = 0, 0.0
+    for q in queues:
+        depth += q.count
+        lists = q.lane_queues() if isinstance(q, LaneQueue) else [q]  # (2)
+        for jid in (j for x in lists for j in x.get_job_ids(0, 1)):   # (1)
+            when = redis.hget(job_id_to_job_key(jid), 'enqueued_at')
+            if when:
+                enqueued_at = utcparse(when.decode('utf-8')) \
+                    .replace(tzinfo=timezone.utc).timestamp()
+                latency = max(latency, time() - enqueued_at)
+    return QueueStats(depth=depth, latency=latency)
+# NOTE
+# 1. Oldest task. RQ workers pop tasks off the head of the queue, so the
+# task at the head has been waiting the longest. We only read its enqueue
+# time rather than fetching the whole job.
+# 2. Lanes. Each lane is a queue of its own, so we look at each lane's head.
+
+
+def scale(workers: int, min_workers: int, max_workers: int,
+          stats: QueueStats, scale_up_latency: float) -> int:
+    """
+    Figure out how many workers we should have.
+
+    :param workers: how many workers we've got now.
+    :param min_workers: how many workers we should have at least.
+    :param max_workers: how many workers we should have at most.
+    :param stats: the current queue stats.
+    :param scale_up_latency: how long, in seconds, the oldest queued task
+        may wait before we add a worker.
+    :return: the number of workers we should have.
+
+    Examples:
+
+        >>> scale(2, 1, 4, QueueStats(depth=50, latency=30), 10)
+        3
+        >>> scale(2, 1, 4, QueueStats(depth=0, latency=0), 10)
+        1
+        >>> scale(2, 1, 4, QueueStats(depth=3, latency=1), 10)
+        2
+    """
+    if stats.depth > 0 and stats.latency >= scale_up_latency:
+        workers += 1
+    elif stats.depth == 0:
+        workers -= 1
+    return max(min_workers, min(max_workers, workers))
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _signal(pid: int, sig: int):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+class WorkerSupervisor:
+    """
+    Fork worker processes, replace them when they exit and scale their
+    number with the queue load.
+    """
+
+    def __init__(self, start_worker: Callable[[], None],
+                 min_workers: int, max_workers: int,
+                 queue_names: List[str],
+                 redis_connection: Callable[[], Redis],
+                 scale_up_latency: float,
+                 burst_mode: bool = False,
+                 warm_up: Callable[[], None] = lambda: None):
+        """
+        Create a new instance.
+
+        :param start_worker: runs a worker in the forked process, returning
+            when the worker exits.
+        :param min_workers: how many workers to run at least.
+        :param max_workers: how many workers to run at most.
+        :param queue_names: the queues the workers service.
+        :param redis_connection: creates a Redis connection.
+        :param scale_up_latency: how long, in seconds, the oldest queued
+            task may wait before we add a worker.
+        :param burst_mode: if ``True``, don't replace workers that exit
+            normally, since they drained the queues, and return once all
+            workers are gone.
+        :param warm_up: gets called before forking any worker.
+        """
+        self._start_worker = start_worker
+        self._min_workers = max(1, min_workers)
+        self._max_workers = max(self._min_workers, max_workers)
+        self._queue_names = queue_names
+        self._redis_connection = redis_connection
+        self._scale_up_latency = scale_up_latency
+        self._burst_mode = burst_mode
+        self._warm_up = warm_up
+
+        self._target = self._min_workers
+        self._workers: Dict[int, float] = {}
+        self._retiring = set()
+        self._drained = False
+        self._stopping = False
+        self._scaled_at = time()
+
+    def _handle_stop_signal(self, signum, frame):
+        log().info(f"Received signal {signum}, stopping workers")
+        self._stopping = True
+
+    def _fork(self) -> int:
+        pid = os.fork()
+        if pid > 0:
+            return pid
+
+        code = 0
+        try:
+            os.setpgid(0, 0)                                           # (1)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            self._start_worker()
+        except BaseException:
+            log().exception("Worker bombed out")
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)                                             # (2)
+    # NOTE
+    # 1. Process group. Keeps terminal signals away from workers, see the
+    # module docs.
+    # 2. Exit. Skip the parent's clean up code the child inherited, e.g.
+    # the ``finally`` block in ``run``.
+
+    def _reap(self):
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self._workers.pop(pid, None) is None:
+                continue
+
+            code = _exit_code(status)
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+            elif code != 0:
+                log().warning(f"Worker {pid} exited with code {code}")
+            elif self._burst_mode:
+                self._drained = True
+            else:
+                log().info(f"Worker {pid} exited, replacing it")
+
+    def _scale(self, queues: List[Queue], redis: Redis):
+        if self._min_workers == self._max_workers or \
+                time() - self._scaled_at < SCALE_INTERVAL:
+            return
+        try:
+            stats = queue_stats(redis, queues)
+        except Exception:                                              # (1)
+            log().exception("Failed to measure queue load")
+            return
+
+        target = scale(self._target, self._min_workers, self._max_workers,
+                       stats, self._scale_up_latency)
+        if target != self._target:
+            log().info(f"Scaling from {self._target} to {target} workers " +
+                       f"({stats.depth} queued tasks, oldest waiting " +
+                       f"{stats.latency:.0f} secs)")
+            self._target = target
+            self._scaled_at = time()
+    # NOTE
+    # 1. Redis down. Workers will have a hard time too, but we'd rather keep
+    # the ones we've got than bring the whole pool down.
+
+    def _adjust(self):
+        active = [pid for pid in self._workers if pid not in self._retiring]
+        if not self._drained:
+            for _ in range(self._target - len(active)):
+                pid = self._fork()
+                self._workers[pid] = time()
+                log().info(f"Started worker {pid}")
+        for pid in sorted(active, key=self._workers.get)[self._target:]:
+            self._retiring.add(pid)                                    # (1)
+            _signal(pid, signal.SIGTERM)
+    # NOTE
+    # 1. Scaling in. We retire the youngest workers, which lets them finish
+    # the task at hand, and keep older ones, which are more likely to have
+    # warm caches and connections.
+
+    def _shutdown(self):
+        for pid in self._workers:
+            if pid not in self._retiring:                              # (1)
+                _signal(pid, signal.SIGTERM)
+        deadline = time() + SHUTDOWN_TIMEOUT
+        while self._workers and time() < deadline:
+            self._reap()
+            sleep(0.1)
+        for pid in list(self._workers):
+            log().warning(f"Worker {pid} didn't stop in time, killing it")
+            _signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self._workers[pid]
+    # NOTE
+    # 1. Retiring workers. We already asked them to shut down, and RQ takes
+    # a second SIGTERM as a cold shutdown, which would kill the task they're
+    # finishing.
+
+    def run(self):
+        """
+        Start the workers and supervise them until we get a stop signal or,
+        in burst mode, until all workers exit.
+        """
+        self._warm_up()
+        signal.signal(signal.SIGTERM, self._handle_stop_signal)
+        signal.signal(signal.SIGINT, self._handle_stop_signal)
+
+        redis = self._redis_connection()
+        queue_class = work_queue_class()
+        queues = [queue_class(n, connection=redis) for n in self._queue_names]
+        try:
+            while not self._stopping:
+                self._reap()
+                if self._drained and not self._workers:
+                    return
+                self._scale(queues, redis)
+                self._adjust()
+                sleep(POLL_INTERVAL)
+        finally:
+            self._shutdown()
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from types import TracebackType
-from typing import Optional, Type
+from typing import List, Optional, Type
 from uuid import uuid4
 
 from pydantic import BaseModel
@@ -8,6 +8,8 @@ from rq import Queue, Retry
 from rq.job import Job
 
 from utils.b64 import to_b64_list, from_b64_list
+from wq.core.index import TaskIndex
+from wq.core.lanes import work_queue_class
 from wq.core.cfg import redis_connection, default_queue_name, \
     offload_to_work_queue, recover_from_enqueueing_failure, \
     failed_task_retention_period, successful_task_retention_period
@@ -223,7 +225,8 @@ class Tasklet(ABC):
         """
         :return: the work queue where to put this task.
         """
-        return Queue(self.queue_name(), connection=redis_connection())
+        queue_class = work_queue_class()
+        return queue_class(self.queue_name(), connection=redis_connection())
 
     def success_ttl(self) -> int:
         """
@@ -247,6 +250,31 @@ class Tasklet(ABC):
         """
         return failed_task_retention_period()
 
+    def merge_key(self) -> Optional[str]:
+        """
+        Tell which pending tasks a worker can run together with this one.
+        The key is a prefix of the task ID representation: if other tasks
+        in the same queue have IDs starting with this key, the worker may
+        call ``merge`` to run them all in one go. Subclasses can override
+        this method if running many tasks as one is cheaper than running
+        each on its own. Otherwise this task never gets merged.
+
+        :return: the merge key or ``None`` if this task can't be merged.
+        """
+        return None
+
+    def merge(self, others: List['Tasklet']) -> 'Tasklet':
+        """
+        Build a task that does the work of this task and the given ones.
+        Only called if ``merge_key`` returns a key, in which case the given
+        tasks are tasks with the same merge key. Running the merged task
+        should be equivalent to running each task in turn.
+
+        :param others: the tasks to merge with this one.
+        :return: the merged task.
+        """
+        raise NotImplementedError
+
     def enqueue(self):
         """
         Put this task on the work queue if configured, otherwise run this task
@@ -270,6 +298,7 @@ class Tasklet(ABC):
         tid = self.task_id().id_repr()                     # (1)
         job = None
         try:
+            TaskIndex(q.connection).add(tid)               # (3)
             job = q.enqueue(run_action, self,
                             job_id=tid,
                             retry=self._with_retries(),
@@ -293,6 +322,9 @@ class Tasklet(ABC):
 # 2. Paranoia. But if the RQ API changes and job ID != tid, then all the
 # monitoring queries become inconsistent and it could be a while before
 # we actually realise that since there won't be any obvious clues about it.
+# 3. Task index. We index the task before enqueueing it so there's never a
+# task we can't find. If enqueueing fails, the index entry goes away the
+# next time workers prune the index.
 
 
 def _tasklet_from_rq_job(j: Job) -> Tasklet:
@@ -330,8 +362,21 @@ class RqExcMan:
 
     @staticmethod
     def _add_exception(j: Job, e: Optional[BaseException]):
-        j.meta.setdefault(RqExcMan.EXC_META_KEY, []).append(e)
-        j.save()
+        def append(pipe):
+            raw = pipe.hget(j.key, 'meta')                             # (1)
+            meta = j.serializer.loads(raw) if raw else {}
+            meta.setdefault(RqExcMan.EXC_META_KEY, []).append(e)
+            pipe.multi()
+            pipe.hset(j.key, 'meta', j.serializer.dumps(meta))
+            j.meta = meta
+
+        j.connection.transaction(append, j.key)
+    # NOTE
+    # 1. Races. RQ re-enqueues a failed task with retries left before it
+    # calls our exception handler, so another worker, or thread, could be
+    # running the task again already and add its own exception. We read
+    # the exceptions in Redis rather than the ones the job had when it got
+    # fetched, and only write them back if the job didn't change meanwhile.
 
     @staticmethod
     def list_exceptions(j: Job) -> [Optional[BaseException]]:
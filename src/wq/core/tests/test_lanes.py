@@ -0,0 +1,110 @@
+from collections import Counter
+
+import fakeredis
+import pytest
+
+from wq.core.cfg import tenant_weights
+from wq.core.lanes import LaneQueue, LaneScheduler
+
+
+@pytest.fixture
+def queue():
+    return LaneQueue('q', connection=fakeredis.FakeStrictRedis())
+
+
+def test_push_into_lanes(queue):
+    queue.push_job_id('dA==:j1')
+    queue.push_job_id('dQ==:j2')
+    queue.push_job_id('dA==:j3', at_front=True)
+
+    assert queue.lanes() == ['dA==', 'dQ==']
+    assert queue.lane_queue('dA==').get_job_ids() == ['dA==:j3', 'dA==:j1']
+    assert queue.lane_counts() == {'dA==': 2, 'dQ==': 1}
+    assert (queue.shared_count(), queue.count) == (0, 3)
+
+
+def test_remove_from_lane(queue):
+    queue.push_job_id('dA==:j1')
+    queue.push_job_id('dA==:j2')
+
+    assert queue.remove('dA==:j1') == 1
+    assert queue.remove('dA==:j1') == 0
+    assert queue.lane_queue('dA==').get_job_ids() == ['dA==:j2']
+
+
+def test_prune_empty_lanes(queue):
+    queue.push_job_id('dA==:j1')
+    queue.push_job_id('dQ==:j2')
+    queue.remove('dQ==:j2')
+
+    assert queue.prune_lanes() == 1
+    assert queue.lanes() == ['dA==']
+
+
+def test_lane_from_queue_key(queue):
+    lane = queue.lane_queue('dA==')
+
+    found = LaneQueue.from_queue_key(lane.key, connection=queue.connection)
+
+    assert (found.name, found.lane, found.key) == ('q', 'dA==', lane.key)
+    found = LaneQueue.from_queue_key(queue.key, connection=queue.connection)
+    assert found.lane is None
+
+
+def serve(scheduler, rounds):
+    served = []
+    for t in range(rounds):
+        order = scheduler.order(now=t)
+        lane = next(q for q in order if q.get_job_ids())
+        scheduler.served(lane, order)
+        served.append(lane.lane)
+    return served
+
+
+def fill(queue, lane):
+    queue.push_job_id(f"{lane}:j")
+
+
+def test_share_by_weight(queue):
+    fill(queue, 'dA==')
+    fill(queue, 'dQ==')
+    scheduler = LaneScheduler([queue], lambda ts: {'t': 3, 'u': 1})
+
+    assert Counter(serve(scheduler, 40)) == {'dA==': 30, 'dQ==': 10}
+
+
+def test_interleave_heavy_lane(queue):
+    fill(queue, 'dA==')
+    fill(queue, 'dQ==')
+    scheduler = LaneScheduler([queue], lambda ts: {'t': 2, 'u': 1})
+
+    assert serve(scheduler, 6) == ['dA==', 'dQ==', 'dA=='] * 2
+
+
+def test_idle_lane_gets_no_credit(queue):
+    fill(queue, 'dA==')
+    scheduler = LaneScheduler([queue], lambda ts: {})
+    serve(scheduler, 20)
+
+    fill(queue, 'dQ==')
+    scheduler.refresh(now=20)
+
+    assert Counter(serve(scheduler, 10)) == {'dA==': 5, 'dQ==': 5}
+
+
+def test_tenant_weights(tmp_path, monkeypatch):
+    config = tmp_path / 'ql-config.yml'
+    config.write_text('default-wq-weight: 2\n'
+                      'tenants:\n'
+                      '  t1:\n'
+                      '    wq-weight: 5\n'
+                      '  t2:\n'
+                      '    wq-weight: nope\n')
+    monkeypatch.setenv('QL_CONFIG', str(config))
+
+    assert tenant_weights(['t1', 't2', 't3']) == {'t1': 5, 't2': 2, 't3': 2}
+
+
+def test_tenant_weights_without_config(monkeypatch):
+    monkeypatch.delenv('QL_CONFIG', raising=False)
+    assert tenant_weights(['t1']) == {'t1': 1}
@@ -0,0 +1,130 @@
+import signal
+
+import pytest
+
+from wq.core.rqutils import job_id_to_job_key
+import wq.core.supervisor as supervisor
+from wq.core.supervisor import QueueStats, WorkerSupervisor, queue_stats, \
+    scale
+
+
+@pytest.mark.parametrize('workers, depth, latency, expected', [
+    (1, 10, 10, 2), (4, 10, 60, 4), (2, 10, 5, 2), (2, 0, 0, 1),
+    (1, 0, 0, 1), (6, 10, 0, 4)
+])
+def test_scale(workers, depth, latency, expected):
+    stats = QueueStats(depth=depth, latency=latency)
+    assert scale(workers, 1, 4, stats, 10) == expected
+
+
+class FakeQueue:
+
+    def __init__(self, job_ids):
+        self.job_ids = job_ids
+
+    @property
+    def count(self):
+        return len(self.job_ids)
+
+    def get_job_ids(self, offset, length):
+        return self.job_ids[offset:offset + length]
+
+
+class FakeRedis:
+
+    def __init__(self, enqueued_at):
+        self.enqueued_at = enqueued_at
+
+    def hget(self, key, field):
+        return self.enqueued_at.get(key)
+
+
+def test_queue_stats(monkeypatch):
+    monkeypatch.setattr(supervisor, 'time', lambda: 1622541610.0)
+    redis = FakeRedis({
+        job_id_to_job_key('j1'): b'2021-06-01T10:00:00.000000Z',
+        job_id_to_job_key('j3'): b'2021-06-01T10:00:08.000000Z'
+    })
+    queues = [FakeQueue(['j1', 'j2']), FakeQueue([]), FakeQueue(['j3'])]
+
+    assert queue_stats(redis, queues) == QueueStats(depth=3, latency=10.0)
+
+
+def new_supervisor(start_worker, min_workers=1, max_workers=1,
+                   burst_mode=True):
+    return WorkerSupervisor(start_worker=start_worker,
+                            min_workers=min_workers,
+                            max_workers=max_workers,
+                            queue_names=[],
+                            redis_connection=lambda: None,
+                            scale_up_latency=10,
+                            burst_mode=burst_mode)
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(supervisor, 'POLL_INTERVAL', 0.01)
+    handlers = {s: signal.getsignal(s) for s in (signal.SIGTERM,
+                                                 signal.SIGINT)}
+    yield
+    for s, h in handlers.items():
+        signal.signal(s, h)
+
+
+def test_exit_once_drained_in_burst_mode(tmp_path, fast_polling):
+    def start_worker():
+        (tmp_path / 'ran').touch()
+
+    new_supervisor(start_worker, min_workers=2, max_workers=2).run()
+    assert (tmp_path / 'ran').exists()
+
+
+def test_replace_crashed_worker(tmp_path, fast_polling):
+    def start_worker():
+        runs = len(list(tmp_path.iterdir()))
+        (tmp_path / f"run-{runs}").touch()
+        if runs == 0:
+            raise RuntimeError('boom')
+
+    new_supervisor(start_worker).run()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['run-0', 'run-1']
+
+
+def test_scale_workers(monkeypatch):
+    pids = iter(range(100, 200))
+    signalled = []
+    monkeypatch.setattr(WorkerSupervisor, '_fork', lambda self: next(pids))
+    monkeypatch.setattr(supervisor, '_signal',
+                        lambda pid, sig: signalled.append((pid, sig)))
+    target = new_supervisor(lambda: None, max_workers=4, burst_mode=False)
+
+    target._target = 3
+    target._adjust()
+    assert sorted(target._workers) == [100, 101, 102]
+
+    target._target = 1
+    target._adjust()
+    assert signalled == [(101, signal.SIGTERM), (102, signal.SIGTERM)]
+
+    target._adjust()
+    assert len(signalled) == 2
+    assert sorted(target._workers) == [100, 101, 102]
+
+
+def test_shut_down_each_worker_once(monkeypatch):
+    pids = iter(range(100, 200))
+    signalled = []
+    monkeypatch.setattr(WorkerSupervisor, '_fork', lambda self: next(pids))
+    monkeypatch.setattr(WorkerSupervisor, '_reap',
+                        lambda self: self._workers.clear())
+    monkeypatch.setattr(supervisor, '_signal',
+                        lambda pid, sig: signalled.append((pid, sig)))
+    target = new_supervisor(lambda: None, max_workers=4, burst_mode=False)
+
+    target._target = 2
+    target._adjust()
+    target._target = 1
+    target._adjust()
+    target._shutdown()
+
+    assert signalled == [(101, signal.SIGTERM), (100, signal.SIGTERM)]
@@ -0,0 +1,126 @@
+import fakeredis
+import pytest
+from rq import Queue
+
+from wq.core.deletion import DELETION_KEY_PREFIX, TaskDeletion, \
+    TaskDeletionStatus
+import wq.core.deletion as deletion
+import wq.core.rqutils as rqutils
+from wq.core.rqutils import job_id_to_job_key, purge_jobs
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    r = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(rqutils, 'redis_connection', lambda: r)
+    return r
+
+
+def add_job(queue, jid, status, registry=None):
+    queue.connection.hset(job_id_to_job_key(jid), mapping={'status': status})
+    if registry is not None:
+        queue.connection.zadd(registry.key, {jid: 1})
+    else:
+        queue.push_job_id(jid)
+
+
+def test_purge_jobs(redis):
+    q = Queue('q', connection=redis)
+    add_job(q, 'j1', 'queued')
+    add_job(q, 'j2', 'finished', q.finished_job_registry)
+    add_job(q, 'j3', 'failed', q.failed_job_registry)
+    add_job(q, 'j4', 'queued')
+
+    batches = list(purge_jobs(q, ['j1', 'j2', 'j3', 'gone'], batch_size=2))
+
+    assert batches == [2, 1]
+    assert q.get_job_ids() == ['j4']
+    assert q.finished_job_registry.get_job_ids() == []
+    assert q.failed_job_registry.get_job_ids() == []
+    assert redis.keys('rq:job:*') == [job_id_to_job_key('j4').encode()]
+
+
+def test_purge_nothing(redis):
+    assert list(purge_jobs(Queue('q', connection=redis), [])) == []
+
+
+def run_deletion(redis, delete, total):
+    target = TaskDeletion(redis, 'd1')
+    target._save(status=TaskDeletionStatus.RUNNING.value, total=total,
+                 deleted=0)
+    target._run(delete)
+    return target.load()
+
+
+def test_track_progress(redis):
+    def delete(progress):
+        progress(2)
+        progress(3)
+        return 5
+
+    info = run_deletion(redis, delete, 6)
+
+    assert info.status == TaskDeletionStatus.DONE
+    assert (info.total, info.deleted, info.error) == (6, 5, None)
+    assert redis.ttl(DELETION_KEY_PREFIX + 'd1') == deletion.DELETION_TTL
+
+
+def test_track_failure(redis):
+    def delete(progress):
+        progress(1)
+        raise ValueError('boom')
+
+    info = run_deletion(redis, delete, 2)
+
+    assert info.status == TaskDeletionStatus.FAILED
+    assert info.deleted == 1
+    assert info.error == "ValueError('boom')"
+
+
+def test_start_in_background(redis, monkeypatch):
+    started = []
+
+    class FakeThread:
+        def __init__(self, target, args, **kwargs):
+            started.append((target, args))
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(deletion, 'Thread', FakeThread)
+    target = TaskDeletion(redis, 'd1')
+
+    info = target.start(lambda progress: 0, 3)
+
+    assert info.status == TaskDeletionStatus.RUNNING
+    assert target.load() == info
+    assert len(started) == 1
+
+
+def test_load_missing_deletion(redis):
+    assert TaskDeletion(redis, 'nope').load() is None
+
+
+def test_report_stalled_deletion_as_failed(redis, monkeypatch):
+    target = TaskDeletion(redis, 'd1')
+    target._save(status=TaskDeletionStatus.RUNNING.value, total=2,
+                 deleted=1)
+    saved_at = target.load().updated_at.timestamp()
+
+    monkeypatch.setattr(deletion, 'time', lambda: saved_at +
+                        deletion.DELETION_STALL_TIMEOUT + 1)
+    info = target.load()
+
+    assert info.status == TaskDeletionStatus.FAILED
+    assert info.error == deletion.STALLED_ERROR
+    assert info.deleted == 1
+
+
+def test_finished_deletion_never_stalls(redis, monkeypatch):
+    info = run_deletion(redis, lambda progress: 0, 0)
+    saved_at = info.updated_at.timestamp()
+
+    monkeypatch.setattr(deletion, 'time', lambda: saved_at +
+                        deletion.DELETION_STALL_TIMEOUT + 1)
+
+    assert TaskDeletion(redis, 'd1').load() == info
@@ -0,0 +1,201 @@
+import fakeredis
+import pytest
+
+from wq.core.index import BUCKETS_KEY, FAILED, PENDING, SUCCEEDED, \
+    TaskIndex, bucket_of, prune_task_index
+import wq.core.index as index
+from wq.core.rqutils import job_id_to_job_key
+
+
+def jid(*elements) -> str:
+    return ':'.join(elements)
+
+
+ALL_IDS = ['t1:p1:c1:u1', 't1:p1:c2:u2', 't1:p1:c1:u3', 't1:p2:c1:u4',
+           't2:p1:c1:u5']
+
+
+def add_job(redis, jid, **fields):
+    redis.hset(job_id_to_job_key(jid), mapping={'status': 'queued', **fields})
+
+
+def delete_jobs(redis, *jids):
+    for j in jids:
+        redis.delete(job_id_to_job_key(j))
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeStrictRedis()
+
+
+@pytest.fixture
+def target(redis):
+    t = TaskIndex(redis, finished_keys=['done'], failed_keys=['failed'])
+    for k, j in enumerate(ALL_IDS):
+        add_job(redis, j)
+        t.add(j, k + 1)
+    return t
+
+
+@pytest.mark.parametrize('task_id, bucket', [
+    ('u', ''), ('t:u', 't'), ('t:p:u', 't:p'), ('t:p:c:u', 't:p')
+])
+def test_bucket_of(task_id, bucket):
+    assert bucket_of(task_id) == bucket
+
+
+def test_find_bucket_in_enqueue_order(target):
+    assert list(target.find('t1:p1')) == [
+        't1:p1:c1:u1', 't1:p1:c2:u2', 't1:p1:c1:u3'
+    ]
+    assert target.count('t1:p1') == 3
+
+
+def test_find_in_bucket(target):
+    assert list(target.find('t1:p1:c1')) == ['t1:p1:c1:u1', 't1:p1:c1:u3']
+    assert target.count('t1:p1:c1') == 2
+
+
+def test_find_across_buckets(target):
+    assert list(target.find('t1')) == [
+        't1:p1:c1:u1', 't1:p1:c2:u2', 't1:p1:c1:u3', 't1:p2:c1:u4'
+    ]
+    assert target.count('t1') == 4
+    assert target.count('') == 5
+
+
+@pytest.mark.parametrize('prefix', ['t3', 't1:p3', 't1:p1:c3', 't2:p1:c2'])
+def test_find_nothing(target, prefix):
+    assert list(target.find(prefix)) == []
+    assert target.count(prefix) == 0
+
+
+@pytest.mark.parametrize('start, count, expected', [
+    (0, 2, ['u1', 'u2']),
+    (1, 2, ['u2', 'u3']),
+    (3, None, ['u4']),
+    (2, 10, ['u3', 'u4']),
+    (4, 1, []),
+    (0, 0, [])
+])
+def test_page(target, start, count, expected):
+    got = target.find('t1', start=start, count=count)
+    assert [j.split(':')[-1] for j in got] == expected
+
+
+def test_page_in_bucket(target):
+    got = target.find('t1:p1:c1', start=1, count=1)
+    assert list(got) == ['t1:p1:c1:u3']
+
+
+def test_remove(target):
+    target.remove(['t1:p1:c2:u2', 't2:p1:c1:u5'])
+    assert target.count('') == 3
+    assert list(target.find('t2')) == []
+
+
+def test_find_by_status(target, redis):
+    redis.zadd('done', {'t1:p1:c1:u1': 10, 't2:p1:c1:u5': 10})
+    redis.zadd('failed', {'t1:p1:c1:u3': 10})
+
+    assert list(target.find('t1', status=SUCCEEDED)) == ['t1:p1:c1:u1']
+    assert list(target.find('t1', status=FAILED)) == ['t1:p1:c1:u3']
+    assert list(target.find('t1', status=PENDING)) == [
+        't1:p1:c2:u2', 't1:p2:c1:u4'
+    ]
+
+
+def test_find_by_status_across_pages(target, redis, monkeypatch):
+    monkeypatch.setattr(index, 'PAGE_SIZE', 2)
+    redis.zadd('done', {'t1:p1:c1:u1': 1, 't1:p2:c1:u4': 1})
+
+    assert list(target.find('t1')) == [
+        't1:p1:c1:u1', 't1:p1:c2:u2', 't1:p1:c1:u3', 't1:p2:c1:u4'
+    ]
+    assert list(target.find('t1', status=SUCCEEDED)) == [
+        't1:p1:c1:u1', 't1:p2:c1:u4'
+    ]
+    got = target.find('t1', start=1, count=1, status=SUCCEEDED)
+    assert list(got) == ['t1:p2:c1:u4']
+
+
+def test_skip_deleted_jobs_when_finding_by_status(target, redis):
+    delete_jobs(redis, 't1:p1:c2:u2')
+    assert list(target.find('t1:p1', status=PENDING)) == [
+        't1:p1:c1:u1', 't1:p1:c1:u3'
+    ]
+
+
+def test_count_pending_on_add(target):
+    assert target.count('t1', PENDING) == 4
+    assert target.count('t1', SUCCEEDED) == 0
+    assert target.count('t1', FAILED) == 0
+
+
+def test_count_outcomes(target, redis):
+    target.record_outcome('t1:p1:c1:u1', SUCCEEDED)
+    target.record_outcome('t1:p1:c2:u2', FAILED)
+    target.record_outcome('t1:p2:c1:u4', SUCCEEDED)
+
+    assert target.count('t1', PENDING) == 1
+    assert target.count('t1', SUCCEEDED) == 2
+    assert target.count('t1', FAILED) == 1
+    assert target.count('t1') == 4
+    assert target.count('t1:p1', SUCCEEDED) == 1
+
+
+def test_count_reads_counts_of_whole_buckets(target, redis):
+    redis.hset('ql:wq:task-counts:t1:p1', mapping={PENDING: 7})
+    assert target.count('t1:p1', PENDING) == 7
+
+
+def test_count_in_bucket_by_status(target, redis):
+    redis.zadd('done', {'t1:p1:c1:u1': 10})
+    delete_jobs(redis, 't1:p1:c1:u3')
+
+    assert target.count('t1:p1:c1', SUCCEEDED) == 1
+    assert target.count('t1:p1:c1', PENDING) == 0
+    assert target.count('t1:p1:c1') == 1
+
+
+def test_recount(target, redis):
+    redis.hset('ql:wq:task-counts:t1:p1', mapping={PENDING: 7, FAILED: -1})
+    redis.zadd('done', {'t1:p1:c1:u1': 10})
+    redis.zadd('failed', {'t1:p1:c2:u2': 10})
+    delete_jobs(redis, 't1:p1:c1:u3')
+
+    assert target.recount('t1:p1') == 1
+    assert target.count('t1:p1', PENDING) == 0
+    assert target.count('t1:p1', SUCCEEDED) == 1
+    assert target.count('t1:p1', FAILED) == 1
+    assert list(target.find('t1:p1')) == ['t1:p1:c1:u1', 't1:p1:c2:u2']
+
+
+def test_prune(target, redis):
+    delete_jobs(redis, 't1:p1:c2:u2', 't1:p2:c1:u4', 't2:p1:c1:u5')
+
+    assert target.prune() == 3
+    assert list(target.find('')) == ['t1:p1:c1:u1', 't1:p1:c1:u3']
+    assert redis.smembers(BUCKETS_KEY) == {b't1:p1'}
+    assert target.count('') == 2
+    assert not redis.exists('ql:wq:task-counts:t2:p1')
+
+
+def test_prune_at_most_once_per_interval(target, redis):
+    delete_jobs(redis, *ALL_IDS)
+    assert prune_task_index(target, redis) == 5
+    target.add('t1:p1:c1:u6')
+    assert prune_task_index(target, redis) == 0
+    assert target.count('') == 1
+
+
+def test_rebuild(redis):
+    target = TaskIndex(redis)
+    add_job(redis, 't:p:c:u1', enqueued_at='2021-06-01T10:00:02.000000Z')
+    add_job(redis, 't:p:c:u2', enqueued_at='2021-06-01T10:00:01.000000Z')
+
+    assert target.rebuild(['t:p:c:u1', 't:p:c:u2', 't:p:c:u3']) == 2
+    assert list(target.find('t:p')) == ['t:p:c:u2', 't:p:c:u1']
+    assert target.count('t:p', PENDING) == 2
+    assert redis.zscore('ql:wq:task-index:t:p', 't:p:c:u2') == 1622541601.0
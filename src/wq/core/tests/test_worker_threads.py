@@ -0,0 +1,87 @@
+from threading import Barrier, Event, Thread
+from time import sleep
+
+import fakeredis
+import pytest
+from rq import SimpleWorker
+from rq.timeouts import TimerDeathPenalty
+from rq.worker import StopRequested
+
+import wq.core.rts as rts
+from wq.core.rts import MergingWorker
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setattr(rts, 'THREAD_WAIT_INTERVAL', 0.01)
+    monkeypatch.setattr(SimpleWorker, 'heartbeat', lambda *args: None)
+    monkeypatch.setattr(SimpleWorker, 'register_death', lambda self: None)
+    w = MergingWorker(['q'], connection=fakeredis.FakeStrictRedis(),
+                      max_threads=2)
+    jobs = iter([('j1', 'q'), ('j2', 'q'), ('j3', 'q')])
+    monkeypatch.setattr(w, '_dequeue',
+                        lambda timeout, max_idle_time: next(jobs, None))
+    yield w
+    w._executor.shutdown(wait=False)
+
+
+def dispatch(worker, n):
+    for _ in range(n):
+        worker.execute_job(*worker.dequeue_job_and_maintain_ttl(None))
+
+
+def test_run_tasks_concurrently(worker, monkeypatch):
+    barrier = Barrier(2, timeout=5)
+    performed = []
+
+    def perform_job(job, queue):
+        barrier.wait()
+        performed.append(job)
+
+    monkeypatch.setattr(worker, 'perform_job', perform_job)
+    dispatch(worker, 2)
+    worker.register_death()
+
+    assert sorted(performed) == ['j1', 'j2']
+
+
+def test_wait_for_free_thread(worker, monkeypatch):
+    done = Event()
+    monkeypatch.setattr(worker, 'perform_job',
+                        lambda job, queue: done.wait(5))
+    dispatch(worker, 2)
+
+    fetched = []
+    t = Thread(target=lambda: fetched.append(
+        worker.dequeue_job_and_maintain_ttl(None)))
+    t.start()
+    sleep(0.1)
+    assert fetched == []
+
+    done.set()
+    t.join(timeout=5)
+    assert fetched == [('j3', 'q')]
+
+
+def test_stop_while_all_threads_busy(worker, monkeypatch):
+    done = Event()
+    monkeypatch.setattr(worker, 'perform_job',
+                        lambda job, queue: done.wait(5))
+    dispatch(worker, 2)
+
+    worker._stop_requested = True
+    with pytest.raises(StopRequested):
+        worker.dequeue_job_and_maintain_ttl(None)
+    done.set()
+
+
+def test_free_thread_if_queue_empty(worker, monkeypatch):
+    monkeypatch.setattr(worker, '_dequeue',
+                        lambda timeout, max_idle_time: None)
+
+    for _ in range(3):
+        assert worker.dequeue_job_and_maintain_ttl(None) is None
+
+
+def test_enforce_timeouts_in_threads(worker):
+    assert worker.death_penalty_class is TimerDeathPenalty
@@ -0,0 +1,310 @@
+"""
+Load shedding on the notify endpoint.
+
+When offloading inserts to the work queue, the notify endpoint adds a
+task to the queue for each notification no matter how many tasks are
+already waiting, so if the DB is down or slow, tasks pile up in Redis
+until Redis runs out of memory and evicts keys or gets killed. The
+``LoadShedder`` watches how many insert tasks are waiting and how much
+memory Redis uses and, as soon as either goes past its high water mark,
+the notify endpoint turns down notifications with a ``Retry-After``
+header so Orion backs off and sends them again later: ``429`` if too many
+tasks are waiting, ``503`` if Redis is short of memory. The endpoint
+accepts notifications again once the level drops below the low water
+mark, so it doesn't flip-flop around the high mark. Notifications of
+high-priority tenants, see ``priority_tenants``, always get through.
+
+The shedder measures the load at most once every ``CHECK_INTERVAL``
+seconds, so notifications don't pay a Redis round trip each. If it can't
+measure the load, e.g. Redis is down, it lets notifications through:
+the enqueue fails then and the spool, if any, kicks in.
+"""
+
+import logging
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, NamedTuple, Optional, Set
+
+from server.telemetry.monitor import record
+from utils.cfgreader import EnvReader, BitSizeVar, IntVar
+from wq.core.cfg import offload_to_work_queue, priority_tenants, \
+    redis_connection
+from wq.ql.notify import InsertAction
+
+
+HIGH_WATER_TASKS_VAR = IntVar('WQ_HIGH_WATER_TASKS', 0)
+LOW_WATER_TASKS_VAR = IntVar('WQ_LOW_WATER_TASKS', 0)
+HIGH_WATER_MEMORY_VAR = BitSizeVar('WQ_HIGH_WATER_MEMORY', None)
+LOW_WATER_MEMORY_VAR = BitSizeVar('WQ_LOW_WATER_MEMORY', None)
+RETRY_AFTER_VAR = IntVar('WQ_RETRY_AFTER', 30)
+
+CHECK_INTERVAL = 1
+"""Seconds between two measurements of the load."""
+
+SHED_LABEL = 'shed notifications'
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def _read_size(var: BitSizeVar) -> int:
+    parsed = EnvReader().safe_read(var)
+    if parsed:
+        return int(parsed.to_Byte())
+    return 0
+
+
+def high_water_tasks() -> int:
+    """
+    :return: how many insert tasks may wait in the queue before turning
+        down notifications; ``0`` or less means no limit.
+    """
+    return EnvReader().safe_read(HIGH_WATER_TASKS_VAR)
+
+
+def low_water_tasks() -> int:
+    """
+    :return: how few insert tasks must wait in the queue to accept
+        notifications again; ``0`` or less means three quarters of the
+        high water mark.
+    """
+    return EnvReader().safe_read(LOW_WATER_TASKS_VAR)
+
+
+def high_water_memory() -> int:
+    """
+    :return: how many bytes of memory Redis may use before turning down
+        notifications; ``0`` means no limit.
+    """
+    return _read_size(HIGH_WATER_MEMORY_VAR)
+
+
+def low_water_memory() -> int:
+    """
+    :return: how few bytes of memory Redis must use to accept notifications
+        again; ``0`` means three quarters of the high water mark.
+    """
+    return _read_size(LOW_WATER_MEMORY_VAR)
+
+
+def retry_after() -> int:
+    """
+    :return: in how many seconds a client should send again a notification
+        we turned down.
+    """
+    return max(1, EnvReader().safe_read(RETRY_AFTER_VAR))
+
+
+class WaterMark:
+    """
+    Tell whether a level is too high, with hysteresis: the level is too
+    high from when it reaches the high mark until it drops below the low
+    mark.
+
+    Examples:
+
+        >>> mark = WaterMark(high=10, low=5)
+        >>> [mark.over(x) for x in [9, 10, 6, 5, 4, 9]]
+        [False, True, True, True, False, False]
+
+        >>> WaterMark(high=8, low=0).low
+        6
+    """
+
+    def __init__(self, high: int, low: int = 0):
+        self.high = high
+        self.low = min(low, high) if low > 0 else high * 3 // 4
+        self._over = False
+
+    def over(self, level: int) -> bool:
+        """
+        :param level: the current level.
+        :return: ``True`` if the level is too high, ``False`` otherwise.
+        """
+        if self._over:
+            self._over = level >= self.low
+        else:
+            self._over = level >= self.high
+        return self._over
+
+    def reset(self):
+        self._over = False
+
+
+def water_mark(high: int, low: int) -> Optional[WaterMark]:
+    """
+    :return: a water mark with the given levels or ``None`` if the high
+        mark is ``0`` or less, i.e. there's no limit.
+    """
+    return WaterMark(high, low) if high > 0 else None
+
+
+class Overload(NamedTuple):
+    status: int
+    """The HTTP status code to turn down notifications with."""
+    message: str
+    """Why we're turning down notifications."""
+    retry_after: int
+    """In how many seconds the client should try again."""
+
+    def headers(self) -> Dict[str, str]:
+        """
+        :return: the HTTP headers to add to the response.
+        """
+        return {'Retry-After': str(self.retry_after)}
+
+
+class LoadShedder:
+    """
+    Decide whether to turn down a notification, depending on the work
+    queue load.
+    """
+
+    def __init__(self, queue_depth: Callable[[], int],
+                 used_memory: Callable[[], int],
+                 depth_mark: Optional[WaterMark],
+                 memory_mark: Optional[WaterMark],
+                 retry_after_secs: int,
+                 high_priority: Callable[[], Set[str]] = set):
+        """
+        Create a new instance.
+
+        :param queue_depth: measures how many insert tasks are waiting.
+        :param used_memory: measures how many bytes of memory Redis uses.
+        :param depth_mark: the queue depth water mark, if any.
+        :param memory_mark: the Redis memory water mark, if any.
+        :param retry_after_secs: in how many seconds clients should try
+            again.
+        :param high_priority: looks up the lowercased names of the
+            tenants whose notifications to always accept.
+        """
+        self._queue_depth = queue_depth
+        self._used_memory = used_memory
+        self._depth_mark = depth_mark
+        self._memory_mark = memory_mark
+        self._retry_after = retry_after_secs
+        self._high_priority = high_priority
+        self._priority_tenants: Set[str] = set()
+        self._overload: Optional[Overload] = None
+        self._checked_at: Optional[float] = None
+        self._lock = Lock()
+
+    def check(self, fiware_service: Optional[str]) -> Optional[Overload]:
+        """
+        Figure out whether to turn down a notification.
+
+        :param fiware_service: the tenant that sent the notification.
+        :return: why to turn down the notification or ``None`` to accept it.
+        """
+        overload = self._current_overload()
+        if overload is None:
+            return None
+        if fiware_service and \
+                fiware_service.lower() in self._priority_tenants:
+            return None
+        record(SHED_LABEL, 1)
+        return overload
+
+    def _current_overload(self) -> Optional[Overload]:
+        now = monotonic()
+        with self._lock:                                            # (1)
+            if self._checked_at is None or \
+                    now - self._checked_at >= CHECK_INTERVAL:
+                self._checked_at = now
+                overload = self._measure()
+                if overload != self._overload:
+                    self._log_change(overload)
+                self._overload = overload
+            return self._overload
+    # NOTE
+    # 1. Measuring under the lock. Other threads wait for the measurement
+    # rather than all hitting Redis at the same time, which is what we'd
+    # like to avoid when Redis is struggling.
+
+    @staticmethod
+    def _log_change(overload: Optional[Overload]):
+        if overload:
+            log().warning(f"Shedding load: {overload.message}")
+        else:
+            log().warning("Work queue load back to normal, accepting "
+                          "notifications again.")
+
+    def _measure(self) -> Optional[Overload]:
+        try:
+            memory, depth = self._memory_overload(), self._depth_overload()
+            overload = memory or depth
+            if overload:
+                self._priority_tenants = self._high_priority()
+            return overload
+        except Exception:
+            log().warning("Can't measure the work queue load, accepting "
+                          "notifications", exc_info=True)
+            for mark in (self._depth_mark, self._memory_mark):
+                if mark:
+                    mark.reset()
+            return None
+
+    def _memory_overload(self) -> Optional[Overload]:
+        if self._memory_mark and self._memory_mark.over(self._used_memory()):
+            return Overload(503, 'Work queue short of memory, try again '
+                                 'later.', self._retry_after)
+        return None
+
+    def _depth_overload(self) -> Optional[Overload]:
+        if self._depth_mark and self._depth_mark.over(self._queue_depth()):
+            return Overload(429, 'Too many notifications waiting to be '
+                                 'inserted, try again later.',
+                            self._retry_after)
+        return None
+
+
+def _queue_depth() -> int:
+    return InsertAction.insert_queue().count
+
+
+def _used_memory() -> int:
+    return redis_connection().info('memory')['used_memory']
+
+
+def shed_load() -> bool:
+    """
+    Turn down notifications when the work queue is overloaded?
+
+    :return: ``True`` if offloading to the work queue with a high water
+        mark set, ``False`` otherwise.
+    """
+    return offload_to_work_queue() and \
+        (high_water_tasks() > 0 or high_water_memory() > 0)
+
+
+def new_load_shedder() -> LoadShedder:
+    """
+    :return: a load shedder configured from the environment.
+    """
+    depth_mark = water_mark(high_water_tasks(), low_water_tasks())
+    memory_mark = water_mark(high_water_memory(), low_water_memory())
+    return LoadShedder(queue_depth=_queue_depth, used_memory=_used_memory,
+                       depth_mark=depth_mark, memory_mark=memory_mark,
+                       retry_after_secs=retry_after(),
+                       high_priority=priority_tenants)
+
+
+_shedder: Optional[LoadShedder] = None
+_shedder_lock = Lock()
+
+
+def load_shedder() -> Optional[LoadShedder]:
+    """
+    Get the process-wide load shedder, creating it on first use.
+
+    :return: the shedder if ``shed_load`` returns true, ``None`` otherwise.
+    """
+    global _shedder
+    if not shed_load():
+        return None
+
+    with _shedder_lock:
+        if _shedder is None:
+            _shedder = new_load_shedder()
+        return _shedder
@@ -0,0 +1,324 @@
+"""
+Micro-batching of notified entities.
+
+Orion sends one notification per entity update, so a large fleet of devices
+results in a flood of tiny inserts. The ``NotifyCoalescer`` buffers notified
+entities in memory, grouping them by tenant, service path and entity type,
+and hands each group over to a flush action as a single lot when the group
+holds enough rows, takes up enough bytes, or has been waiting for too long.
+Since all the entities in a group share the same type, the translator can
+then insert the whole lot through a single ``_insert_entities_of_type`` call.
+
+Notice coalescing trades durability for throughput: the notify endpoint
+replies as soon as the entities are buffered, so a process crash loses any
+entities still in the buffer. Also, insert errors can't be reported back to
+the client since the insert happens after the response got sent out.
+"""
+
+import atexit
+import json
+import logging
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+
+from server.telemetry.monitor import record
+from utils.cfgreader import EnvReader, BitSizeVar, BoolVar, FloatVar, IntVar
+from utils.thread import BackgroundRepeater
+
+
+COALESCE_NOTIFICATIONS_VAR = BoolVar('COALESCE_NOTIFICATIONS', False)
+COALESCE_MAX_ROWS_VAR = IntVar('COALESCE_MAX_ROWS', 500)
+COALESCE_MAX_SIZE_VAR = BitSizeVar('COALESCE_MAX_SIZE', None)
+COALESCE_MAX_LATENCY_VAR = FloatVar('COALESCE_MAX_LATENCY', 0.5)
+
+DEFAULT_MAX_SIZE = 1024 * 1024  # 1 MiB
+
+BATCH_SIZE_LABEL = 'coalescer batch size'
+BATCH_BYTES_LABEL = 'coalescer batch bytes'
+BATCH_WAIT_LABEL = 'coalescer batch wait'
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def coalesce_notifications() -> bool:
+    """
+    Buffer notified entities and insert them in batches?
+
+    :return: `True` to coalesce notifications; `False` to insert each
+        notification payload as soon as it arrives.
+    """
+    return EnvReader().safe_read(COALESCE_NOTIFICATIONS_VAR)
+
+
+def max_batch_rows() -> int:
+    """
+    :return: how many entities a batch can hold before it gets flushed.
+    """
+    return EnvReader().safe_read(COALESCE_MAX_ROWS_VAR)
+
+
+def max_batch_size() -> int:
+    """
+    :return: how many bytes of notification payload a batch can hold
+        before it gets flushed.
+    """
+    parsed = EnvReader().safe_read(COALESCE_MAX_SIZE_VAR)
+    if parsed:
+        return int(parsed.to_Byte())
+    return DEFAULT_MAX_SIZE
+
+
+def max_batch_latency() -> float:
+    """
+    :return: how long, in seconds, a batch can be kept in the buffer
+        before it gets flushed.
+    """
+    return EnvReader().safe_read(COALESCE_MAX_LATENCY_VAR)
+
+
+CoalescingKey = Tuple[Optional[str], Optional[str], Optional[str]]
+"""
+The tenant, service path and entity type shared by all the entities in
+a batch.
+"""
+
+FlushAction = Callable[[Optional[str], Optional[str], List[dict]], None]
+"""
+A function to insert a batch of entities. It gets called with the batch's
+tenant, service path and entities, in that order.
+"""
+
+
+class CoalescerStats:
+    """
+    Running totals about the batches a coalescer has flushed so far.
+    """
+
+    def __init__(self):
+        self.flushes = 0
+        self.rows = 0
+        self.bytes = 0
+        self.max_rows = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.failures = 0
+
+    def add(self, rows: int, size: int, wait: float):
+        self.flushes += 1
+        self.rows += rows
+        self.bytes += size
+        self.max_rows = max(self.max_rows, rows)
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> dict:
+        """
+        :return: the current totals plus average batch size and wait time.
+        """
+        n = self.flushes or 1
+        return {
+            'flushes': self.flushes,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'failures': self.failures,
+            'avg_batch_rows': self.rows / n,
+            'max_batch_rows': self.max_rows,
+            'avg_wait_secs': self.total_wait / n,
+            'max_wait_secs': self.max_wait
+        }
+
+
+class _Batch:
+
+    def __init__(self):
+        self.entities = []
+        self.size = 0
+        self.opened_at = monotonic()
+
+    def add(self, entity: dict, size: int):
+        self.entities.append(entity)
+        self.size += size
+
+    def age(self, now: float) -> float:
+        return now - self.opened_at
+
+
+class NotifyCoalescer:
+    """
+    Thread-safe buffer to group notified entities into insert batches.
+    Flushing happens in the thread that adds the entity tipping a batch
+    over the row or size limit, or in the thread calling ``flush_expired``
+    for batches that have been waiting longer than the latency limit. In
+    both cases, the flush action runs outside of the buffer lock, so slow
+    inserts don't stop other threads from adding entities.
+    """
+
+    def __init__(self, flush_action: FlushAction,
+                 max_rows: int, max_size: int, max_latency: float):
+        """
+        Create a new instance.
+
+        :param flush_action: the function to insert a batch.
+        :param max_rows: flush a batch as soon as it holds this many entities.
+        :param max_size: flush a batch as soon as it holds this many bytes.
+        :param max_latency: flush a batch if it's been in the buffer for
+            longer than this amount of seconds.
+        """
+        self._flush_action = flush_action
+        self._max_rows = max(1, max_rows)
+        self._max_size = max_size
+        self._max_latency = max_latency
+        self._batches: Dict[CoalescingKey, _Batch] = {}
+        self._stats = CoalescerStats()
+        self._lock = Lock()
+
+    def max_latency(self) -> float:
+        return self._max_latency
+
+    def _is_full(self, batch: _Batch) -> bool:
+        return len(batch.entities) >= self._max_rows or \
+            batch.size >= self._max_size
+
+    def add(self, fiware_service: Optional[str],
+            fiware_servicepath: Optional[str],
+            entities: List[dict], payload_size: Optional[int] = None):
+        """
+        Buffer the given entities.
+
+        :param fiware_service: the tenant the entities belong to.
+        :param fiware_servicepath: the entities' service path.
+        :param entities: the notified entities, already validated and with
+            a time index.
+        :param payload_size: how many bytes the entities took up in the
+            notification, typically the request's content length. If not
+            given, we compute it by encoding each entity as JSON.
+        """
+        per_entity_size = None
+        if payload_size is not None and entities:
+            per_entity_size = payload_size // len(entities)
+
+        full = []
+        with self._lock:
+            for e in entities:
+                key = (fiware_service, fiware_servicepath, e.get('type'))
+                batch = self._batches.setdefault(key, _Batch())
+                size = per_entity_size if per_entity_size is not None \
+                    else len(json.dumps(e))
+                batch.add(e, size)
+                if self._is_full(batch):
+                    full.append((key, self._batches.pop(key)))
+
+        for key, batch in full:
+            self._flush(key, batch)
+
+    def _pop_batches(self, expired_only: bool) -> [(CoalescingKey, _Batch)]:
+        now = monotonic()
+        with self._lock:
+            keys = [k for k, b in self._batches.items()
+                    if not expired_only or b.age(now) >= self._max_latency]
+            return [(k, self._batches.pop(k)) for k in keys]
+
+    def flush_expired(self):
+        """
+        Flush any batch that's been waiting for longer than the latency limit.
+        """
+        for key, batch in self._pop_batches(expired_only=True):
+            self._flush(key, batch)
+
+    def flush_all(self):
+        """
+        Flush all batches regardless of how long they've been waiting.
+        """
+        for key, batch in self._pop_batches(expired_only=False):
+            self._flush(key, batch)
+
+    def _flush(self, key: CoalescingKey, batch: _Batch):
+        svc, svc_path, _ = key
+        rows = len(batch.entities)
+        wait = batch.age(monotonic())
+        try:
+            self._flush_action(svc, svc_path, batch.entities)
+        except Exception:
+            log().exception(
+                f"Failed to insert batch of {rows} entities of type " +
+                f"'{key[2]}' for tenant '{svc}'")
+            with self._lock:
+                self._stats.failures += 1
+        finally:
+            with self._lock:
+                self._stats.add(rows, batch.size, wait)
+            record(BATCH_SIZE_LABEL, rows)
+            record(BATCH_BYTES_LABEL, batch.size)
+            record(BATCH_WAIT_LABEL, wait)
+
+    def stats(self) -> dict:
+        """
+        :return: a snapshot of the flush stats collected so far.
+        """
+        with self._lock:
+            return self._stats.snapshot()
+
+
+class CoalescerFlusher(BackgroundRepeater):
+    """
+    Flush expired batches at regular intervals so that entities never sit
+    in the buffer for much longer than the latency limit, even when no more
+    notifications come in.
+    """
+
+    def __init__(self, coalescer: NotifyCoalescer):
+        super().__init__(sleep_interval=coalescer.max_latency() / 2)
+        self._coalescer = coalescer
+
+    def _do_run(self) -> bool:
+        self._coalescer.flush_expired()
+        return False
+
+
+def _insert_batch(fiware_service: Optional[str],
+                  fiware_servicepath: Optional[str],
+                  entities: List[dict]):
+    from wq.ql.notify import InsertAction    # (*)
+    InsertAction(fiware_service, fiware_servicepath, None, entities) \
+        .enqueue()
+# NOTE. Import cycle. The notify module depends on the translators which we
+# don't need to load just to buffer entities.
+
+
+_coalescer: Optional[NotifyCoalescer] = None
+_coalescer_lock = Lock()
+
+
+def notify_coalescer() -> Optional[NotifyCoalescer]:
+    """
+    Get the process-wide coalescer, creating it on first use.
+    The coalescer inserts batches through ``InsertAction`` so batches
+    get offloaded to the work queue if so configured.
+
+    :return: the coalescer if ``coalesce_notifications`` returns true,
+        ``None`` otherwise.
+    """
+    global _coalescer
+    if not coalesce_notifications():
+        return None
+
+    with _coalescer_lock:                                     # (1)
+        if _coalescer is None:
+            _coalescer = NotifyCoalescer(
+                flush_action=_insert_batch,
+                max_rows=max_batch_rows(),
+                max_size=max_batch_size(),
+                max_latency=max_batch_latency())
+            CoalescerFlusher(_coalescer).start()
+            atexit.register(_coalescer.flush_all)             # (2)
+        return _coalescer
+# NOTE
+# 1. Lazy init. Gunicorn forks worker processes after loading the config,
+# so we can only spawn the flusher thread in the worker process, i.e. when
+# the first notification comes in.
+# 2. Graceful exit. Gunicorn workers exit normally on SIGTERM, so we still
+# get a chance to flush what's in the buffer. This won't happen on SIGKILL
+# or if the interpreter crashes.
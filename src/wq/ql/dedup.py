@@ -0,0 +1,242 @@
+"""
+Duplicate notification suppression.
+
+Orion retries notifications it thinks got lost and overlapping
+subscriptions can notify the same entity update more than once, so we
+could end up storing the same entity update several times. The
+``NotificationDeduplicator`` fingerprints each notified entity---tenant,
+service path and the whole entity, including its time index---and drops
+any entity whose fingerprint it's already seen within a time window.
+
+Fingerprints get stored in a local LRU set and, if Redis is configured,
+in Redis too with an expiry equal to the window. The local set spares a
+Redis round trip for duplicates notified to the same process, whereas
+Redis catches duplicates across Gunicorn and work queue worker processes.
+If Redis is down, we let entities through rather than losing data.
+"""
+
+from collections import OrderedDict
+from hashlib import sha1
+import json
+import logging
+from threading import Lock
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from cache.factory import CacheEnvReader
+from server.telemetry.monitor import record
+from utils.cfgreader import EnvReader, BoolVar, IntVar
+
+
+DEDUP_NOTIFICATIONS_VAR = BoolVar('DEDUP_NOTIFICATIONS', False)
+DEDUP_WINDOW_VAR = IntVar('DEDUP_WINDOW', 60)
+DEDUP_LOCAL_SIZE_VAR = IntVar('DEDUP_LOCAL_SIZE', 65536)
+
+KEY_PREFIX = 'ql:dedup:'
+
+DROPPED_LABEL = 'dedup dropped entities'
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def dedup_notifications() -> bool:
+    """
+    Drop notified entities we've already seen?
+
+    :return: `True` to drop duplicate entities; `False` to insert every
+        notified entity.
+    """
+    return EnvReader().safe_read(DEDUP_NOTIFICATIONS_VAR)
+
+
+def dedup_window() -> int:
+    """
+    :return: for how many seconds to remember an entity update.
+    """
+    return EnvReader().safe_read(DEDUP_WINDOW_VAR)
+
+
+def local_set_size() -> int:
+    """
+    :return: how many fingerprints to keep in memory at most.
+    """
+    return EnvReader().safe_read(DEDUP_LOCAL_SIZE_VAR)
+
+
+def entity_fingerprint(fiware_service: Optional[str],
+                       fiware_servicepath: Optional[str],
+                       entity: dict) -> str:
+    """
+    Compute a stable hash of a notified entity.
+
+    :param fiware_service: the tenant the entity belongs to.
+    :param fiware_servicepath: the entity's service path.
+    :param entity: the entity, with a time index.
+    :return: the hex digest of the hash.
+    """
+    rep = json.dumps([fiware_service, fiware_servicepath, entity],
+                     sort_keys=True, separators=(',', ':'), default=str)
+    return sha1(rep.encode('utf-8')).hexdigest()
+
+
+class LocalSeenSet:
+    """
+    Thread-safe LRU set of fingerprints, each expiring after a time window.
+    """
+
+    def __init__(self, max_size: int, window: float):
+        self._max_size = max(1, max_size)
+        self._window = window
+        self._expiries: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = Lock()
+
+    def check_and_add(self, key: str) -> bool:
+        """
+        Add the given fingerprint to the set.
+
+        :return: `True` if the fingerprint was already in the set and
+            hadn't expired yet, `False` otherwise.
+        """
+        now = monotonic()
+        with self._lock:
+            expiry = self._expiries.get(key)
+            if expiry is not None and expiry > now:
+                self._expiries.move_to_end(key)
+                return True
+            self._expiries[key] = now + self._window
+            self._expiries.move_to_end(key)
+            while len(self._expiries) > self._max_size:
+                self._expiries.popitem(last=False)
+            return False
+
+    def discard(self, keys: List[str]):
+        with self._lock:
+            for k in keys:
+                self._expiries.pop(k, None)
+
+
+class RedisSeenSet:
+    """
+    Fingerprint set shared by all QuantumLeap processes through Redis.
+    Each fingerprint is a Redis key expiring after the time window.
+    """
+
+    def __init__(self, redis, window: int):
+        self._redis = redis
+        self._window = max(1, window)
+
+    def check_and_add(self, keys: List[str]) -> List[bool]:
+        """
+        Add the given fingerprints to the set in one round trip.
+
+        :return: for each fingerprint, `True` if it was already in the set,
+            `False` otherwise.
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        for k in keys:
+            pipe.set(KEY_PREFIX + k, 1, nx=True, ex=self._window)
+        return [not added for added in pipe.execute()]
+
+    def discard(self, keys: List[str]):
+        if keys:
+            self._redis.delete(*[KEY_PREFIX + k for k in keys])
+
+
+class NotificationDeduplicator:
+    """
+    Filter out notified entities seen within the dedup window.
+    """
+
+    def __init__(self, local: LocalSeenSet,
+                 shared: Optional[RedisSeenSet] = None):
+        """
+        Create a new instance.
+
+        :param local: the in-process fingerprint set.
+        :param shared: the fingerprint set shared with other processes, if
+            any.
+        """
+        self._local = local
+        self._shared = shared
+
+    def filter(self, fiware_service: Optional[str],
+               fiware_servicepath: Optional[str],
+               entities: List[dict]) -> Tuple[List[dict], List[str]]:
+        """
+        Drop the entities we've already seen and remember the others.
+
+        :param fiware_service: the tenant the entities belong to.
+        :param fiware_servicepath: the entities' service path.
+        :param entities: the notified entities, with a time index.
+        :return: the entities never seen before, in the same order as in
+            the input list, and their fingerprints.
+        """
+        fresh = []
+        for e in entities:
+            key = entity_fingerprint(fiware_service, fiware_servicepath, e)
+            if not self._local.check_and_add(key):
+                fresh.append((key, e))
+
+        if fresh and self._shared:
+            try:
+                seen = self._shared.check_and_add([k for k, _ in fresh])
+                fresh = [x for x, dup in zip(fresh, seen) if not dup]
+            except Exception:                                       # (1)
+                log().warning("Can't check for duplicates in Redis",
+                              exc_info=True)
+
+        dropped = len(entities) - len(fresh)
+        if dropped:
+            record(DROPPED_LABEL, dropped)
+            log().debug(f"Dropped {dropped} duplicate entities")
+        return [e for _, e in fresh], [k for k, _ in fresh]
+# NOTE
+# 1. Fail open. Storing a duplicate is better than losing an update.
+
+    def forget(self, keys: List[str]):
+        """
+        Remove the given fingerprints so the corresponding entities can be
+        notified again, e.g. because the insert failed and Orion is going
+        to retry.
+        """
+        self._local.discard(keys)
+        if self._shared:
+            try:
+                self._shared.discard(keys)
+            except Exception:
+                log().warning("Can't remove fingerprints from Redis",
+                              exc_info=True)
+
+
+def _shared_seen_set(window: int) -> Optional[RedisSeenSet]:
+    if not CacheEnvReader().redis_host():
+        return None
+    from wq.core.cfg import redis_connection
+    return RedisSeenSet(redis_connection(), window)
+
+
+_deduplicator: Optional[NotificationDeduplicator] = None
+_deduplicator_lock = Lock()
+
+
+def notification_deduplicator() -> Optional[NotificationDeduplicator]:
+    """
+    Get the process-wide deduplicator, creating it on first use.
+    Fingerprints get shared through Redis if ``REDIS_HOST`` is set.
+
+    :return: the deduplicator if ``dedup_notifications`` returns true,
+        ``None`` otherwise.
+    """
+    global _deduplicator
+    if not dedup_notifications():
+        return None
+
+    with _deduplicator_lock:
+        if _deduplicator is None:
+            window = dedup_window()
+            _deduplicator = NotificationDeduplicator(
+                local=LocalSeenSet(local_set_size(), window),
+                shared=_shared_seen_set(window))
+        return _deduplicator
@@ -30,3 +30,14 @@ def build_json_array_response_stream(xs: Iterable[BaseModel]) -> Response:
     :return: a Flask JSON response containing an array of JSON objects.
     """
     return Response(json_array_streamer(xs), mimetype='application/json')
+
+
+def build_json_response(x: BaseModel, status: int = 200) -> Response:
+    """
+    Build a response to return the input data to the client.
+
+    :param x: the Pydantic model to return to the client.
+    :param status: the HTTP status code.
+    :return: a Flask JSON response containing the model as a JSON object.
+    """
+    return Response(x.json(), status=status, mimetype='application/json')
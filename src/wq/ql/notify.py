@@ -2,12 +2,16 @@ from typing import Callable, Iterable, List, Optional
 
 from pydantic import BaseModel
 
+from geocoding.batch import geocode_entities
 from reporter.httputil import *
 from translators.factory import translator_for, error_analyser_for
+from translators.raw_entity import ZLIB_NGSI_V1, deflate_json, inflate_json
 from wq.core import TaskInfo, TaskStatus, QMan, \
     CompositeTaskId, Tasklet, WorkQ, StopTask
 import wq.core.cfg as cfg
-from wq.ql.flaskutils import build_json_array_response_stream
+from wq.ql.flaskutils import build_json_array_response_stream, \
+    build_json_response
+from wq.ql.spool import backend_unavailable, notification_spool
 import logging
 
 
@@ -52,7 +56,51 @@ class InsertAction(Tasklet):
         return self._id
 
     def task_input(self) -> BaseModel:
+        if self._input is None:                                    # (1)
+            state = self._state
+            self._input = InsertActionInput.construct(             # (2)
+                fiware_service=state['s'],
+                fiware_service_path=state['sp'],
+                fiware_correlator=state['c'],
+                payload=inflate_json(state['p'], state['e'])
+            )
+            self._state = None
         return self._input
+# NOTE
+# 1. Lazy decoding. We only inflate the payload of a task we got out of RQ
+# when we actually need it, e.g. listing tasks runtime info doesn't.
+# 2. Validation. Not needed since the payload got validated when the task
+# was created.
+
+    def __getstate__(self) -> dict:
+        data = self.task_input()
+        return {
+            'v': 1,
+            'id': self._id,
+            's': data.fiware_service,
+            'sp': data.fiware_service_path,
+            'c': data.fiware_correlator,
+            'e': ZLIB_NGSI_V1,
+            'p': deflate_json(data.payload, ZLIB_NGSI_V1),
+            'r': self._retry_int
+        }
+
+    def __setstate__(self, state: dict):
+        if 'v' not in state:                                       # (1)
+            self.__dict__.update(state)
+            return
+        self._id = state['id']
+        self._retry_int = state['r']
+        self._input = None
+        self._state = state
+# NOTE. Task encoding.
+# RQ pickles the task into the job hash, so pending tasks take up Redis
+# memory. Rather than pickling the Pydantic input model as is, we store
+# the payload as deflated JSON using the NGSI preset dictionary we use for
+# raw entities, which shrinks small notifications quite a bit more than
+# RQ compressing the whole pickle does.
+# 1. Old tasks. Tasks enqueued by QuantumLeap versions that pickled the
+# whole object state.
 
     def __init__(self,
                  fiware_service: Optional[str],
@@ -77,16 +125,57 @@ class InsertAction(Tasklet):
 # what the arguments of the method we want to call are, even if they get
 # reordered in the method signature.
 
+    def enqueue(self):
+        try:
+            super().enqueue()
+        except Exception as e:
+            data = self.task_input()
+            spool = notification_spool()
+            if spool is None or \
+                    not backend_unavailable(data.fiware_service, e):
+                raise e
+            try:
+                spool.append(data.fiware_service, data.fiware_service_path,
+                             data.fiware_correlator, data.payload)
+            except Exception:
+                log().exception("Failed to spool notification")
+                raise e
+            log().warning("Backend unavailable, spooled notification: " +
+                          f"{e}")
+
     def retry_intervals(self) -> [int]:
         if self._retry_int is None:
             return cfg.retry_intervals()
         return self._retry_int
 
+    def merge_key(self) -> Optional[str]:
+        svc_path = self.task_input().fiware_service_path
+        if svc_path and ',' in svc_path:                               # (1)
+            return None
+        return self.task_id().fiware_svc_and_svc_path_repr() + ':'   # (2)
+
+    def merge(self, others: List['InsertAction']) -> 'InsertAction':
+        data = self.task_input()
+        payload = list(data.payload)
+        for t in others:
+            payload.extend(t.task_input().payload)
+        return InsertAction(data.fiware_service, data.fiware_service_path,
+                            data.fiware_correlator, payload,
+                            self._retry_int)
+# NOTE
+# 1. Multiple service paths. When the header lists a service path for each
+# entity, the translator pairs up entities and paths, so the payloads of
+# two tasks can't be joined without joining their headers too.
+# 2. Separator. Without the trailing colon, the key of service path '/ab'
+# would be a prefix of that of '/abc' since their Base64 encodings share
+# the first four characters.
+
     def run(self):
         data = self.task_input()
         svc = data.fiware_service
         svc_path = data.fiware_service_path
         try:
+            geocode_entities(data.payload)
             with translator_for(svc) as trans:
                 trans.insert(data.payload, svc, svc_path)
         except Exception as e:
@@ -155,13 +244,29 @@ def delete_insert_tasks(task_status: Optional[str] = None):
     try:
         qman = QMan(InsertAction.insert_queue())
         task_id_prefix = build_task_id_init_segment()
-        qman.delete_tasks(task_id_prefix)
-        log().info("Deleted notifcation tasks from the work queue successfully")
+        deletion = qman.delete_tasks_in_background(task_id_prefix)
+        log().info("Started deleting notification tasks from the work queue")
+        return build_json_response(deletion, 202)
     except Exception as e:
         log().exception("delete_insert_tasks failed")
         raise e
 
 
+def get_insert_tasks_deletion(deletion_id: str):
+    deletion = QMan.load_deletion(deletion_id)
+    if deletion is None:
+        return {
+            "error": "Not Found",
+            "description": f"No task deletion with ID {deletion_id}."
+        }, 404
+    return build_json_response(deletion)
+
+
+def list_insert_tasks_backlog():
+    qman = QMan(InsertAction.insert_queue())
+    return build_json_array_response_stream(qman.tenant_backlog())
+
+
 def insert_task_count_calculator(task_status: Optional[str] = None) \
         -> Callable[[Optional[str]], int]:
     qman = QMan(InsertAction.insert_queue())
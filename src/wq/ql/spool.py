@@ -0,0 +1,301 @@
+"""
+Spooling of notifications while the backend is down.
+
+If the DB or, when offloading inserts to the work queue, Redis can't be
+reached, the notify endpoint would fail and it'd be up to Orion to retry,
+which it won't do for long. Instead, if ``SPOOL_DIR`` is set, we append
+the notification to a local spool (see ``utils.spool``) and reply as if
+all went well. A background thread in each QuantumLeap process then
+tries to replay the spool at regular intervals, inserting spooled
+entities in large batches as soon as the backend is back. You can also
+replay the spool by hand, from the src dir:
+
+    $ python wq replay-spool
+
+The spool takes up at most ``SPOOL_MAX_SIZE`` bytes of disk. If it fills
+up, the notify endpoint fails as it would without a spool.
+"""
+
+import json
+import logging
+from threading import Lock
+from typing import Callable, List, Optional
+
+from redis.exceptions import ConnectionError as RedisConnectionError, \
+    TimeoutError as RedisTimeoutError
+
+from geocoding.batch import geocode_entities
+from server.telemetry.monitor import record
+from translators.factory import error_analyser_for, translator_for
+from utils.cfgreader import EnvReader, BitSizeVar, FloatVar, IntVar, StrVar
+from utils.spool import Spool, SpoolSegment
+from utils.thread import BackgroundRepeater
+
+
+SPOOL_DIR_VAR = StrVar('SPOOL_DIR', None)
+SPOOL_MAX_SIZE_VAR = BitSizeVar('SPOOL_MAX_SIZE', None)
+SPOOL_SEGMENT_SIZE_VAR = BitSizeVar('SPOOL_SEGMENT_SIZE', None)
+SPOOL_REPLAY_INTERVAL_VAR = FloatVar('SPOOL_REPLAY_INTERVAL', 30.0)
+SPOOL_REPLAY_BATCH_VAR = IntVar('SPOOL_REPLAY_BATCH', 1000)
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # 1 GiB
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024  # 16 MiB
+
+SPOOL_BYTES_LABEL = 'spool bytes'
+SPOOL_SEGMENTS_LABEL = 'spool segments'
+SPOOLED_ENTITIES_LABEL = 'spooled entities'
+REPLAYED_ENTITIES_LABEL = 'spool replayed entities'
+
+
+def log():
+    return logging.getLogger(__name__)
+
+
+def spool_dir() -> Optional[str]:
+    """
+    :return: the spool directory or ``None`` to turn spooling off.
+    """
+    return EnvReader().safe_read(SPOOL_DIR_VAR)
+
+
+def _read_size(var: BitSizeVar, default: int) -> int:
+    parsed = EnvReader().safe_read(var)
+    if parsed:
+        return int(parsed.to_Byte())
+    return default
+
+
+def spool_max_size() -> int:
+    """
+    :return: how many bytes of disk the spool can take up.
+    """
+    return _read_size(SPOOL_MAX_SIZE_VAR, DEFAULT_MAX_SIZE)
+
+
+def spool_segment_size() -> int:
+    """
+    :return: how many bytes a spool segment file should take up before
+        moving on to a new one.
+    """
+    return _read_size(SPOOL_SEGMENT_SIZE_VAR, DEFAULT_SEGMENT_SIZE)
+
+
+def spool_replay_interval() -> float:
+    """
+    :return: how many seconds to wait between attempts to replay the spool.
+    """
+    return EnvReader().safe_read(SPOOL_REPLAY_INTERVAL_VAR)
+
+
+def spool_replay_batch() -> int:
+    """
+    :return: the max number of spooled entities to insert in one go.
+    """
+    return EnvReader().safe_read(SPOOL_REPLAY_BATCH_VAR)
+
+
+def backend_unavailable(fiware_service: Optional[str],
+                        e: Exception) -> bool:
+    """
+    Did the given insert error happen because we couldn't reach the DB or
+    Redis?
+
+    :param fiware_service: the tenant the insert was for.
+    :param e: the error.
+    :return: ``True`` for yes, ``False`` for no.
+    """
+    if isinstance(e, (RedisConnectionError, RedisTimeoutError)):
+        return True
+    return error_analyser_for(fiware_service, e).is_transient_error()
+
+
+def encode_notification(fiware_service: Optional[str],
+                        fiware_servicepath: Optional[str],
+                        fiware_correlator: Optional[str],
+                        entities: List[dict]) -> bytes:
+    record = {
+        's': fiware_service,
+        'sp': fiware_servicepath,
+        'c': fiware_correlator,
+        'e': entities
+    }
+    return json.dumps(record, separators=(',', ':')).encode('utf-8')
+
+
+def decode_notification(data: bytes) -> dict:
+    return json.loads(data.decode('utf-8'))
+
+
+InsertFn = Callable[[Optional[str], Optional[str], List[dict]], None]
+
+
+def _insert(fiware_service: Optional[str],
+            fiware_servicepath: Optional[str], entities: List[dict]):
+    geocode_entities(entities)
+    with translator_for(fiware_service) as trans:
+        trans.insert(entities, fiware_service, fiware_servicepath)
+
+
+class NotificationSpool:
+    """
+    Spools notifications and replays them.
+    """
+
+    def __init__(self, spool: Spool, batch_rows: int,
+                 insert: InsertFn = _insert,
+                 is_unavailable=backend_unavailable):
+        """
+        Create a new instance.
+
+        :param spool: the spool where to store notifications.
+        :param batch_rows: the max number of entities to insert in one go
+            when replaying.
+        :param insert: inserts entities into the backend.
+        :param is_unavailable: tells if an insert error happened because
+            the backend is down.
+        """
+        self._spool = spool
+        self._batch_rows = batch_rows
+        self._insert = insert
+        self._is_unavailable = is_unavailable
+        self._replay_lock = Lock()
+
+    def record_depth(self):
+        size, segments = self._spool.usage()
+        record(SPOOL_BYTES_LABEL, size)
+        record(SPOOL_SEGMENTS_LABEL, segments)
+
+    def append(self, fiware_service: Optional[str],
+               fiware_servicepath: Optional[str],
+               fiware_correlator: Optional[str], entities: List[dict]):
+        """
+        Add the entities of a notification to the spool.
+
+        :raise SpoolFullError: if there's no room left in the spool.
+        """
+        self._spool.append(encode_notification(
+            fiware_service, fiware_servicepath, fiware_correlator, entities))
+        record(SPOOLED_ENTITIES_LABEL, len(entities))
+        self.record_depth()
+
+    def replay(self) -> int:
+        """
+        Insert the spooled notifications, oldest first, until the spool is
+        empty or the backend can't be reached.
+
+        :return: how many entities got replayed.
+        """
+        replayed = 0
+        with self._replay_lock:                                     # (1)
+            for segment in self._spool.claim():
+                count, complete = self._replay_segment(segment)
+                replayed += count
+                if not complete:
+                    break
+        if replayed:
+            log().info(f"Replayed {replayed} spooled entities")
+            record(REPLAYED_ENTITIES_LABEL, replayed)
+            self.record_depth()
+        return replayed
+    # NOTE
+    # 1. Replay threads. The spool already keeps readers from claiming the
+    # same segment, but without the lock, a background replay and a manual
+    # one in the same process would hit the backend twice as hard.
+
+    def _replay_segment(self, segment: SpoolSegment) -> (int, bool):
+        replayed = 0
+        batch, batch_key, batch_end = [], None, 0
+        try:
+            for end, data in segment.records():
+                n = decode_notification(data)
+                key = (n['s'], n['sp'])
+                if batch and (key != batch_key or
+                              len(batch) >= self._batch_rows):
+                    replayed += self._replay_batch(batch_key, batch)
+                    segment.checkpoint(batch_end)
+                    batch = []
+                batch_key, batch_end = key, end
+                batch.extend(n['e'])
+            if batch:
+                replayed += self._replay_batch(batch_key, batch)
+        except Exception as e:
+            segment.release()
+            svc = batch_key[0] if batch_key else None
+            if not self._is_unavailable(svc, e):
+                raise
+            log().info(f"Backend still unavailable, stopping replay: {e}")
+            return replayed, False
+        segment.remove()
+        return replayed, True
+
+    def _replay_batch(self, key: (Optional[str], Optional[str]),
+                      entities: List[dict]) -> int:
+        svc, svc_path = key
+        try:
+            self._insert(svc, svc_path, entities)
+        except Exception as e:
+            if self._is_unavailable(svc, e):
+                raise
+            log().exception(                                        # (1)
+                f"Dropping {len(entities)} spooled entities for tenant " +
+                f"'{svc}' since they can't be inserted")
+            return 0
+        return len(entities)
+    # NOTE
+    # 1. Poison batches. The translator already saves the original entities
+    # of rows it can't insert, so retrying won't help. Dropping the batch is
+    # what the work queue does too.
+
+
+class SpoolReplayer(BackgroundRepeater):
+    """
+    Replay the spool at regular intervals.
+    """
+
+    def __init__(self, spool: NotificationSpool, interval: float):
+        super().__init__(sleep_interval=interval)
+        self._spool = spool
+
+    def _do_run(self) -> bool:
+        try:
+            self._spool.replay()
+        except Exception:
+            log().exception("Spool replay failed")
+        return False
+
+
+def new_notification_spool() -> Optional[NotificationSpool]:
+    """
+    :return: a spool configured from the environment or ``None`` if
+        ``SPOOL_DIR`` isn't set.
+    """
+    directory = spool_dir()
+    if not directory:
+        return None
+    spool = Spool(directory, max_size=spool_max_size(),
+                  segment_size=spool_segment_size())
+    return NotificationSpool(spool, spool_replay_batch())
+
+
+_spool: Optional[NotificationSpool] = None
+_spool_lock = Lock()
+
+
+def notification_spool() -> Optional[NotificationSpool]:
+    """
+    Get the process-wide notification spool, creating it on first use
+    along with the thread that replays it.
+
+    :return: the spool if ``SPOOL_DIR`` is set, ``None`` otherwise.
+    """
+    global _spool
+    if not spool_dir():
+        return None
+
+    with _spool_lock:                                         # (*)
+        if _spool is None:
+            _spool = new_notification_spool()
+            SpoolReplayer(_spool, spool_replay_interval()).start()
+        return _spool
+# NOTE. Lazy init. As for the coalescer, we can only start the replayer
+# thread after Gunicorn forked the worker process.
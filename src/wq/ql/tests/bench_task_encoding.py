@@ -0,0 +1,89 @@
+"""
+Micro-benchmark for the encoding of insert tasks.
+
+Compare how many bytes of Redis memory an insert task takes up and how
+long it takes to encode and decode, with the compact encoding and with
+the plain pickle we used to have. Bytes are measured on the job data as
+RQ stores it, i.e. the pickled call, task included, compressed by RQ.
+Decoding time includes getting back the task input. Run it from the
+``src`` directory with
+
+    python -m wq.ql.tests.bench_task_encoding --entities 1 --entities 100
+"""
+
+import pickle
+from timeit import timeit
+from uuid import uuid4
+import zlib
+
+import click
+
+from wq.ql.notify import InsertAction
+
+
+def gen_entities(n: int) -> [dict]:
+    return [{
+        'id': f"urn:ngsi-ld:Device:{k}",
+        'type': 'Device',
+        'temperature': {'type': 'Number', 'value': 20.5 + k,
+                        'metadata': {}},
+        'status': {'type': 'Text', 'value': 'ok', 'metadata': {}},
+        'location': {'type': 'geo:json',
+                     'value': {'type': 'Point', 'coordinates': [11.0, 45.0]},
+                     'metadata': {}},
+        'dateModified': {'type': 'DateTime',
+                         'value': '2021-06-01T10:00:00.000Z',
+                         'metadata': {}}
+    } for k in range(n)]
+
+
+def legacy_getstate(task: InsertAction) -> dict:
+    task.task_input()
+    return {k: v for k, v in task.__dict__.items() if k != '_state'}
+
+
+def rq_job_data(task: InsertAction) -> bytes:
+    call = ('wq.core.task.run_action', None, (task,), {})     # (*)
+    return zlib.compress(pickle.dumps(call, pickle.HIGHEST_PROTOCOL))
+# NOTE. Job data. What RQ 1.x stores in the ``data`` field of the job hash.
+
+
+def rq_job_task(data: bytes) -> InsertAction:
+    task = pickle.loads(zlib.decompress(data))[2][0]
+    task.task_input()
+    return task
+
+
+def run(label: str, task: InsertAction, repeat: int):
+    data = rq_job_data(task)
+    encode_secs = timeit(lambda: rq_job_data(task), number=repeat) / repeat
+    decode_secs = timeit(lambda: rq_job_task(data), number=repeat) / repeat
+    print(f"{label:<10} {len(data):10d} B {encode_secs * 1e6:10.1f} us " +
+          f"{decode_secs * 1e6:10.1f} us")
+    return len(data)
+
+
+@click.command()
+@click.option('--entities', '-e', multiple=True, type=int,
+              default=[1, 10, 100],
+              help='Number of entities per task; can be repeated.')
+@click.option('--repeat', default=1000, help='Number of runs to average.')
+def main(entities, repeat):
+    print(f"{'encoding':<10} {'job size':>12} {'encode':>13} {'decode':>13}")
+    for n in entities:
+        task = InsertAction('tenant', '/some/path', str(uuid4()),
+                            gen_entities(n))
+        print(f"-- {n} entities per task")
+
+        compact = run('compact', task, repeat)
+        original = InsertAction.__getstate__
+        InsertAction.__getstate__ = legacy_getstate
+        try:
+            legacy = run('pickle', task, repeat)
+        finally:
+            InsertAction.__getstate__ = original
+        print(f"Size reduction: {1 - compact / legacy:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import pytest
+
+import wq.ql.backpressure as backpressure
+from wq.core.cfg import priority_tenants
+from wq.ql.backpressure import LoadShedder, WaterMark
+
+
+class Load:
+
+    def __init__(self):
+        self.depth = 0
+        self.memory = 0
+        self.down = False
+
+    def queue_depth(self):
+        if self.down:
+            raise ConnectionError('redis down')
+        return self.depth
+
+    def used_memory(self):
+        if self.down:
+            raise ConnectionError('redis down')
+        return self.memory
+
+
+@pytest.fixture
+def load(monkeypatch):
+    monkeypatch.setattr(backpressure, 'CHECK_INTERVAL', 0)
+    return Load()
+
+
+def new_shedder(load, depth_mark=None, memory_mark=None, high=()):
+    return LoadShedder(queue_depth=load.queue_depth,
+                       used_memory=load.used_memory,
+                       depth_mark=depth_mark, memory_mark=memory_mark,
+                       retry_after_secs=30,
+                       high_priority=lambda: set(high))
+
+
+def test_shed_above_high_water_until_below_low_water(load):
+    shedder = new_shedder(load, depth_mark=WaterMark(100, 50))
+    statuses = []
+    for depth in [99, 100, 60, 49, 99]:
+        load.depth = depth
+        overload = shedder.check('t')
+        statuses.append(overload.status if overload else None)
+
+    assert statuses == [None, 429, 429, None, None]
+
+
+def test_memory_takes_precedence(load):
+    shedder = new_shedder(load, depth_mark=WaterMark(10),
+                          memory_mark=WaterMark(1024))
+    load.depth, load.memory = 10, 1024
+
+    overload = shedder.check('t')
+
+    assert overload.status == 503
+    assert overload.headers() == {'Retry-After': '30'}
+
+
+def test_accept_high_priority_tenants(load):
+    shedder = new_shedder(load, depth_mark=WaterMark(10), high={'gold'})
+    load.depth = 10
+
+    assert shedder.check('Gold') is None
+    assert shedder.check('t').status == 429
+    assert shedder.check(None).status == 429
+
+
+def test_accept_if_load_unknown(load):
+    shedder = new_shedder(load, depth_mark=WaterMark(10))
+    load.depth = 10
+    assert shedder.check('t') is not None
+
+    load.down = True
+    assert shedder.check('t') is None
+
+
+def test_measure_at_most_once_per_interval(load, monkeypatch):
+    monkeypatch.setattr(backpressure, 'CHECK_INTERVAL', 60)
+    shedder = new_shedder(load, depth_mark=WaterMark(10))
+    shedder.check('t')
+
+    load.depth = 10
+    assert shedder.check('t') is None
+
+
+def test_off_unless_offloading(monkeypatch):
+    monkeypatch.setenv('WQ_HIGH_WATER_TASKS', '10')
+    monkeypatch.setenv('WQ_OFFLOAD_WORK', 'false')
+    assert backpressure.load_shedder() is None
+
+
+def test_priority_tenants(tmp_path, monkeypatch):
+    config = tmp_path / 'ql-config.yml'
+    config.write_text('tenants:\n'
+                      '  T1:\n'
+                      '    wq-priority: High\n'
+                      '  t2:\n'
+                      '    wq-priority: low\n'
+                      '  t3:\n'
+                      '    backend: Crate\n')
+    monkeypatch.setenv('QL_CONFIG', str(config))
+
+    assert priority_tenants() == {'t1'}
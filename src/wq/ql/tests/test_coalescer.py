@@ -0,0 +1,104 @@
+import pytest
+from time import sleep
+
+from wq.ql.coalescer import NotifyCoalescer
+
+
+class FlushSink:
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, svc, svc_path, entities):
+        self.batches.append((svc, svc_path, [e['id'] for e in entities]))
+
+
+def entity(eid: str, etype: str = 'Room') -> dict:
+    return {'id': eid, 'type': etype, 'temperature': {'value': 1}}
+
+
+def new_coalescer(max_rows=100, max_size=1024 * 1024, max_latency=60.0) \
+        -> (NotifyCoalescer, FlushSink):
+    sink = FlushSink()
+    target = NotifyCoalescer(flush_action=sink, max_rows=max_rows,
+                             max_size=max_size, max_latency=max_latency)
+    return target, sink
+
+
+def test_flush_on_max_rows():
+    target, sink = new_coalescer(max_rows=2)
+
+    target.add('t', '/', [entity('r1')])
+    assert sink.batches == []
+
+    target.add('t', '/', [entity('r2'), entity('r3')])
+    assert sink.batches == [('t', '/', ['r1', 'r2'])]
+
+
+def test_flush_on_max_size():
+    target, sink = new_coalescer(max_size=10)
+
+    target.add('t', '/', [entity('r1')], payload_size=6)
+    assert sink.batches == []
+
+    target.add('t', '/', [entity('r2')], payload_size=6)
+    assert sink.batches == [('t', '/', ['r1', 'r2'])]
+
+
+def test_group_by_tenant_path_and_type():
+    target, sink = new_coalescer()
+
+    target.add('t1', '/', [entity('r1'), entity('d1', 'Device')])
+    target.add('t2', '/', [entity('r2')])
+    target.add('t1', '/a', [entity('r3')])
+    target.add('t1', '/', [entity('r4')])
+    target.flush_all()
+
+    assert sorted(sink.batches) == [
+        ('t1', '/', ['d1']),
+        ('t1', '/', ['r1', 'r4']),
+        ('t1', '/a', ['r3']),
+        ('t2', '/', ['r2'])
+    ]
+
+
+def test_flush_expired_only():
+    target, sink = new_coalescer(max_latency=0.1)
+
+    target.add('t', '/', [entity('r1')])
+    target.flush_expired()
+    assert sink.batches == []
+
+    sleep(0.2)
+    target.add('t', '/', [entity('d1', 'Device')])
+    target.flush_expired()
+    assert sink.batches == [('t', '/', ['r1'])]
+
+
+def test_stats():
+    target, sink = new_coalescer(max_rows=2)
+
+    target.add('t', '/', [entity('r1'), entity('r2'), entity('r3')],
+               payload_size=30)
+    target.flush_all()
+    stats = target.stats()
+
+    assert stats['flushes'] == 2
+    assert stats['rows'] == 3
+    assert stats['bytes'] == 30
+    assert stats['max_batch_rows'] == 2
+    assert stats['avg_batch_rows'] == pytest.approx(1.5)
+    assert stats['failures'] == 0
+
+
+def test_failed_flush_is_counted_and_dropped():
+    def boom(svc, svc_path, entities):
+        raise RuntimeError()
+
+    target = NotifyCoalescer(flush_action=boom, max_rows=1,
+                             max_size=1024, max_latency=60.0)
+    target.add('t', '/', [entity('r1')])
+
+    assert target.stats()['failures'] == 1
+    target.flush_all()
+    assert target.stats()['flushes'] == 1
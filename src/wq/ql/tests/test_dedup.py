@@ -0,0 +1,97 @@
+from time import sleep
+
+import fakeredis
+
+from wq.ql.dedup import LocalSeenSet, NotificationDeduplicator, \
+    RedisSeenSet, entity_fingerprint
+
+
+def entity(eid: str, value=1) -> dict:
+    return {'id': eid, 'type': 'Room', 'temperature': {'value': value},
+            'time_index': '2021-01-01T00:00:00'}
+
+
+def new_dedup(redis=None, window=60, max_size=100) \
+        -> NotificationDeduplicator:
+    shared = RedisSeenSet(redis, window) if redis else None
+    return NotificationDeduplicator(LocalSeenSet(max_size, window), shared)
+
+
+def ids(entities):
+    return [e['id'] for e in entities]
+
+
+def test_fingerprint_ignores_key_order():
+    e1 = {'id': 'r1', 'type': 'Room', 'a': {'value': 1}}
+    e2 = {'a': {'value': 1}, 'type': 'Room', 'id': 'r1'}
+    assert entity_fingerprint('t', '/', e1) == entity_fingerprint('t', '/', e2)
+
+
+def test_fingerprint_depends_on_tenant():
+    e = entity('r1')
+    assert entity_fingerprint('t1', '/', e) != \
+        entity_fingerprint('t2', '/', e)
+
+
+def test_drop_repeats():
+    target = new_dedup()
+
+    kept, keys = target.filter('t', '/', [entity('r1'), entity('r2')])
+    assert ids(kept) == ['r1', 'r2']
+    assert len(keys) == 2
+
+    kept, _ = target.filter('t', '/', [entity('r1'), entity('r1', 2)])
+    assert kept == [entity('r1', 2)]
+
+
+def test_drop_repeats_in_same_lot():
+    target = new_dedup()
+    kept, _ = target.filter('t', '/', [entity('r1'), entity('r1')])
+    assert ids(kept) == ['r1']
+
+
+def test_local_window_expiry():
+    target = new_dedup(window=0.05)
+    target.filter('t', '/', [entity('r1')])
+    sleep(0.1)
+
+    kept, _ = target.filter('t', '/', [entity('r1')])
+    assert ids(kept) == ['r1']
+
+
+def test_local_lru_eviction():
+    seen = LocalSeenSet(max_size=2, window=60)
+    for k in ['a', 'b', 'c']:
+        assert not seen.check_and_add(k)
+
+    assert not seen.check_and_add('a')
+    assert seen.check_and_add('c')
+
+
+def test_shared_set_catches_other_process_repeats():
+    redis = fakeredis.FakeStrictRedis()
+    worker1, worker2 = new_dedup(redis), new_dedup(redis)
+
+    worker1.filter('t', '/', [entity('r1')])
+    kept, _ = worker2.filter('t', '/', [entity('r1'), entity('r2')])
+
+    assert ids(kept) == ['r2']
+
+
+def test_let_through_when_redis_down():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    target = new_dedup(fakeredis.FakeStrictRedis(server=server))
+
+    kept, _ = target.filter('t', '/', [entity('r1')])
+    assert ids(kept) == ['r1']
+
+
+def test_forget():
+    target = new_dedup(fakeredis.FakeStrictRedis())
+
+    _, keys = target.filter('t', '/', [entity('r1')])
+    target.forget(keys)
+    kept, _ = target.filter('t', '/', [entity('r1')])
+
+    assert ids(kept) == ['r1']
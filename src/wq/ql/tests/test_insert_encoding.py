@@ -0,0 +1,62 @@
+import pickle
+
+from wq.ql.notify import InsertAction
+
+
+def entities(n: int) -> [dict]:
+    return [{
+        'id': f"urn:ngsi-ld:Room:{k}",
+        'type': 'Room',
+        'temperature': {'type': 'Number', 'value': 20.5 + k,
+                        'metadata': {}},
+        'dateModified': {'type': 'DateTime',
+                         'value': '2021-06-01T10:00:00.000Z',
+                         'metadata': {}}
+    } for k in range(n)]
+
+
+def legacy_pickle(task: InsertAction, monkeypatch) -> bytes:
+    with monkeypatch.context() as m:
+        m.setattr(InsertAction, '__getstate__', lambda self: self.__dict__)
+        return pickle.dumps(task)
+
+
+def test_round_trip():
+    task = InsertAction('t', '/p', 'c', entities(3), [10, 20])
+    got = pickle.loads(pickle.dumps(task))
+
+    assert got.task_id().id_repr() == task.task_id().id_repr()
+    assert got.task_input() == task.task_input()
+    assert got.retry_intervals() == [10, 20]
+
+
+def test_round_trip_null_headers():
+    task = InsertAction(None, None, None, entities(1))
+    got = pickle.loads(pickle.dumps(task))
+
+    assert got.task_input() == task.task_input()
+    assert got.task_input().fiware_service is None
+
+
+def test_decode_payload_on_demand():
+    got = pickle.loads(pickle.dumps(InsertAction('t', '/', 'c', entities(2))))
+
+    assert got._input is None
+    assert got.task_id().fiware_svc_and_svc_path_repr() == 'dA==:Lw=='
+    assert len(got.task_input().payload) == 2
+    assert got._input is not None
+
+
+def test_load_legacy_state(monkeypatch):
+    task = InsertAction('t', '/p', 'c', entities(2))
+    got = pickle.loads(legacy_pickle(task, monkeypatch))
+
+    assert isinstance(got, InsertAction)
+    assert got.task_input() == task.task_input()
+    assert got.task_id().id_repr() == task.task_id().id_repr()
+
+
+def test_smaller_than_legacy_state(monkeypatch):
+    task = InsertAction('t', '/p', 'c', entities(20))
+    legacy = legacy_pickle(task, monkeypatch)
+    assert len(pickle.dumps(task)) < len(legacy) / 2
@@ -0,0 +1,35 @@
+from wq.ql.notify import InsertAction
+
+
+def test_merge_key_is_id_prefix():
+    t = InsertAction('t', '/ab', 'c', [])
+    assert t.task_id().id_repr().startswith(t.merge_key())
+
+
+def test_merge_key_tells_service_paths_apart():
+    k1 = InsertAction('t', '/ab', 'c', []).merge_key()
+    k2 = InsertAction('t', '/abc', 'c', []).merge_key()
+    k3 = InsertAction('t', '/ab', 'd', []).merge_key()
+
+    assert not k2.startswith(k1)
+    assert k1 == k3
+
+
+def test_no_merge_key_with_many_service_paths():
+    assert InsertAction('t', '/a,/b', 'c', []).merge_key() is None
+
+
+def test_merge_payloads():
+    t1 = InsertAction('t', '/', 'c1', [{'id': '1'}], [10])
+    t2 = InsertAction('t', '/', 'c2', [{'id': '2'}, {'id': '3'}])
+    t3 = InsertAction('t', '/', 'c3', [{'id': '4'}])
+
+    merged = t1.merge([t2, t3])
+    data = merged.task_input()
+
+    assert data.fiware_service == 't'
+    assert data.fiware_service_path == '/'
+    assert data.fiware_correlator == 'c1'
+    assert [e['id'] for e in data.payload] == ['1', '2', '3', '4']
+    assert merged.retry_intervals() == [10]
+    assert t1.task_input().payload == [{'id': '1'}]
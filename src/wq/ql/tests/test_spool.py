@@ -0,0 +1,98 @@
+import pytest
+
+from utils.spool import Spool
+from wq.ql.spool import NotificationSpool
+
+
+class BackendDown(Exception):
+    pass
+
+
+class FakeBackend:
+
+    def __init__(self):
+        self.down = False
+        self.inserts = []
+
+    def insert(self, svc, svc_path, entities):
+        if self.down:
+            raise BackendDown()
+        if any(e.get('bad') for e in entities):
+            raise ValueError('bad entity')
+        self.inserts.append((svc, svc_path, [e['id'] for e in entities]))
+
+
+def is_unavailable(svc, e):
+    return isinstance(e, BackendDown)
+
+
+def new_spool(tmp_path, backend, batch_rows=10, segment_size=1024):
+    spool = Spool(str(tmp_path), max_size=1024 * 1024,
+                  segment_size=segment_size)
+    return NotificationSpool(spool, batch_rows, insert=backend.insert,
+                             is_unavailable=is_unavailable)
+
+
+def entities(*ids):
+    return [{'id': i, 'type': 'Room'} for i in ids]
+
+
+def test_replay_groups_by_tenant_and_batch_size(tmp_path):
+    backend = FakeBackend()
+    target = new_spool(tmp_path, backend, batch_rows=3)
+    target.append('t1', '/', None, entities('r1', 'r2'))
+    target.append('t1', '/', 'c1', entities('r3', 'r4'))
+    target.append('t2', '/', None, entities('r5'))
+
+    assert target.replay() == 5
+    assert backend.inserts == [
+        ('t1', '/', ['r1', 'r2', 'r3', 'r4']),
+        ('t2', '/', ['r5'])
+    ]
+    assert target.replay() == 0
+
+
+def test_replay_stops_while_backend_down(tmp_path):
+    backend = FakeBackend()
+    target = new_spool(tmp_path, backend, batch_rows=2, segment_size=1)
+    target.append('t1', '/', None, entities('r1'))
+    target.append('t2', '/', None, entities('r2'))
+
+    backend.down = True
+    assert target.replay() == 0
+
+    backend.down = False
+    assert target.replay() == 2
+    assert backend.inserts == [('t1', '/', ['r1']), ('t2', '/', ['r2'])]
+
+
+def test_replay_resumes_after_last_batch(tmp_path):
+    backend = FakeBackend()
+    target = new_spool(tmp_path, backend)
+    target.append('t1', '/', None, entities('r1'))
+    target.append('t2', '/', None, entities('r2'))
+
+    insert = backend.insert
+
+    def fail_on_t2(svc, svc_path, es):
+        if svc == 't2':
+            raise BackendDown()
+        insert(svc, svc_path, es)
+
+    target._insert = fail_on_t2
+    assert target.replay() == 1
+
+    target._insert = insert
+    assert target.replay() == 1
+    assert backend.inserts == [('t1', '/', ['r1']), ('t2', '/', ['r2'])]
+
+
+def test_replay_drops_bad_batches(tmp_path):
+    backend = FakeBackend()
+    target = new_spool(tmp_path, backend)
+    target.append('t1', '/', None, [{'id': 'r1', 'bad': True}])
+    target.append('t2', '/', None, entities('r2'))
+
+    assert target.replay() == 1
+    assert backend.inserts == [('t2', '/', ['r2'])]
+    assert target.replay() == 0